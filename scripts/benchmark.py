@@ -0,0 +1,737 @@
+"""Offline end-to-end benchmark for the build service.
+
+Starts local stand-ins for everything the service talks to -- a fake GitHub
+REST API (repos, Pages and the Pages sites themselves), bare git remotes that
+`https://github.com/...` is rewritten to with `url.<base>.insteadOf`, a fake
+Chat Completions endpoint and a fake evaluation receiver -- then runs the
+Flask and/or FastAPI front end against them and drives `/api-endpoint` at the
+requested concurrency. No GitHub repos or OpenAI tokens are used.
+
+End-to-end latency is measured from submission until the evaluator receives
+the callback. The report is JSON so results can be compared across versions:
+
+    python scripts/benchmark.py --frontend both --requests 50 --concurrency 8 --output bench.json
+"""
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import base64
+import random
+import struct
+import shutil
+import signal
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OWNER = "bench"
+TOKEN = "bench-token"
+SECRET = "bench-secret"
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _body(self):
+        n = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(n) or b"null") if n else None
+
+    def _send(self, status, body=None, content_type="application/json", headers=None):
+        data = b"" if body is None else (body if isinstance(body, bytes) else json.dumps(body).encode())
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(data)
+
+
+class _Server:
+    def __init__(self, handler, **state):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.httpd.daemon_threads = True
+        self.httpd.state = self
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class FakeGitHub(_Handler):
+    """Just enough of the GitHub REST API for the service, plus the Pages sites.
+
+    Repos are bare git repositories under `remotes`; the Git Data API
+    (blobs, trees, commits, refs) and the contents API write to them with git
+    plumbing, counting each write in `git_writes`. A Pages site starts
+    answering 200 `pages_delay` seconds after Pages is enabled. With a
+    `rate_limit`, each token may make that many API calls per `rate_window`
+    seconds: responses carry X-RateLimit-* headers and calls over the limit
+    get GitHub's 403 "API rate limit exceeded" (with a Retry-After header
+    if `retry_after` is set).
+    """
+
+    def _rate_limited(self, path):
+        """Count an API call against its token; True if the token is over its limit."""
+        st = self.server.state
+        self._rl_headers = {}
+        if not st.rate_limit or path.startswith("/pages/"):
+            return False
+        token = (self.headers.get("Authorization") or "").split(" ")[-1]
+        now = time.time()
+        with st.lock:
+            used, reset_at = st.usage.get(token, (0, 0.0))
+            if now >= reset_at:
+                used, reset_at = 0, now + st.rate_window
+            over = used >= st.rate_limit
+            if over:
+                st.limited += 1
+            else:
+                used += 1
+            st.usage[token] = (used, reset_at)
+        self._rl_headers = {
+            "X-RateLimit-Limit": str(st.rate_limit),
+            "X-RateLimit-Remaining": str(st.rate_limit - used),
+            "X-RateLimit-Used": str(used),
+            "X-RateLimit-Reset": str(int(reset_at) + 1),
+        }
+        return over
+
+    def _send(self, status, body=None, content_type="application/json", headers=None):
+        super()._send(status, body, content_type, {**getattr(self, "_rl_headers", {}), **(headers or {})})
+
+    def _limited(self):
+        retry_after = self.server.state.retry_after
+        self._send(403, {"message": "API rate limit exceeded for user."},
+                   headers={"Retry-After": str(retry_after)} if retry_after is not None else None)
+
+    def _repo(self, name):
+        return {
+            "name": name,
+            "owner": {"login": OWNER},
+            "html_url": f"https://github.com/{OWNER}/{name}",
+            "clone_url": f"https://github.com/{OWNER}/{name}.git",
+            "ssh_url": f"git@github.com:{OWNER}/{name}.git",
+        }
+
+    def _git(self, name, *args, input=None, env=None, check=True):
+        st = self.server.state
+        r = subprocess.run(["git", *args], cwd=os.path.join(st.remotes, OWNER, name + ".git"), input=input,
+                           env=dict(os.environ, **(env or {})), capture_output=True, check=check)
+        return r.stdout.decode().strip() if r.returncode == 0 else None
+
+    def _wrote(self, kind):
+        st = self.server.state
+        with st.lock:
+            st.git_writes[kind] = st.git_writes.get(kind, 0) + 1
+
+    def _write_tree(self, name, entries, base_tree=None):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {"GIT_INDEX_FILE": os.path.join(tmp, "index")}
+            self._git(name, "read-tree", *([base_tree] if base_tree else ["--empty"]), env=env)
+            for e in entries:
+                self._git(name, "update-index", "--add", "--cacheinfo", f"{e['mode']},{e['sha']},{e['path']}", env=env)
+            return self._git(name, "write-tree", env=env)
+
+    def _commit_tree(self, name, tree, parents, message):
+        env = {"GIT_AUTHOR_NAME": "bench", "GIT_AUTHOR_EMAIL": "bench@example.com",
+               "GIT_COMMITTER_NAME": "bench", "GIT_COMMITTER_EMAIL": "bench@example.com"}
+        args = [a for parent in parents for a in ("-p", parent)]
+        return self._git(name, "commit-tree", tree, *args, "-m", message, env=env)
+
+    def _git_data_get(self, name, kind, arg):
+        if kind == "ref/heads":
+            if not self._git(name, "for-each-ref", "--count=1"):
+                return self._send(409, {"message": "Git Repository is empty."})
+            sha = self._git(name, "rev-parse", "--verify", "-q", f"refs/heads/{arg}", check=False)
+            if not sha:
+                return self._send(404, {"message": "Not Found"})
+            return self._send(200, {"ref": f"refs/heads/{arg}", "object": {"sha": sha, "type": "commit"}})
+        if kind == "commits":
+            text = self._git(name, "cat-file", "commit", arg, check=False)
+            if text is None:
+                return self._send(404, {"message": "Not Found"})
+            headers = [line.split(" ", 1) for line in text.split("\n\n", 1)[0].splitlines()]
+            return self._send(200, {"sha": arg, "tree": {"sha": dict(headers)["tree"]},
+                                    "parents": [{"sha": v} for k, v in headers if k == "parent"]})
+        text = self._git(name, "ls-tree", "-r", arg, check=False)
+        if text is None:
+            return self._send(404, {"message": "Not Found"})
+        entries = []
+        for line in filter(None, text.splitlines()):
+            info, path = line.split("\t", 1)
+            mode, kind, sha = info.split()
+            entries.append({"path": path, "mode": mode, "type": kind, "sha": sha})
+        return self._send(200, {"sha": arg, "tree": entries, "truncated": False})
+
+    def _git_data_post(self, name, kind, body):
+        if kind == "blobs":
+            if not self._git(name, "for-each-ref", "--count=1"):
+                # like GitHub: no blobs until the repository has a commit
+                return self._send(409, {"message": "Git Repository is empty."})
+            sha = self._git(name, "hash-object", "-w", "--stdin", input=base64.b64decode(body["content"]))
+            self._wrote("blob")
+            return self._send(201, {"sha": sha})
+        if kind == "trees":
+            sha = self._write_tree(name, body["tree"], body.get("base_tree"))
+            self._wrote("tree")
+            return self._send(201, {"sha": sha})
+        if kind == "commits":
+            sha = self._commit_tree(name, body["tree"], body.get("parents", []), body["message"])
+            self._wrote("commit")
+            return self._send(201, {"sha": sha})
+        self._send(404, {"message": "Not Found"})
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        st = self.server.state
+        path = self.path.split("?")[0]
+        if self._rate_limited(path):
+            return self._limited()
+        if path == "/user":
+            return self._send(200, {"login": OWNER})
+        m = re.fullmatch(r"/repos/([^/]+)/([^/]+)(/pages)?", path)
+        if m:
+            name = m.group(2)
+            with st.lock:
+                exists = name in st.repos
+                pages = name in st.pages
+            if m.group(3):
+                return self._send(200, {"status": "built"}) if pages else self._send(404, {"message": "Not Found"})
+            return self._send(200, self._repo(name)) if exists else self._send(404, {"message": "Not Found"})
+        m = re.fullmatch(r"/pages/([^/]+)/([^/]+)/", path)
+        if m:
+            with st.lock:
+                enabled_at = st.pages.get(m.group(2))
+            if enabled_at is not None and time.time() >= enabled_at + st.pages_delay:
+                return self._send(200, b"<!doctype html><title>ok</title>", "text/html")
+            return self._send(404, b"not yet", "text/plain")
+        m = re.fullmatch(r"/repos/([^/]+)/([^/]+)/git/(ref/heads|commits|trees)/(.+)", path)
+        if m:
+            return self._git_data_get(m.group(2), m.group(3), m.group(4))
+        self._send(404, {"message": "Not Found"})
+
+    def do_POST(self):
+        st = self.server.state
+        path = self.path.split("?")[0]
+        body = self._body() or {}
+        if self._rate_limited(path):
+            return self._limited()
+        if path in ("/user/repos", f"/orgs/{OWNER}/repos"):
+            name = body["name"]
+            with st.lock:
+                if name in st.repos:
+                    return self._send(422, {"message": "name already exists on this account"})
+                st.repos.add(name)
+            subprocess.check_call(["git", "init", "-q", "--bare", "--initial-branch=main", os.path.join(st.remotes, OWNER, name + ".git")])
+            return self._send(201, self._repo(name))
+        m = re.fullmatch(r"/repos/([^/]+)/([^/]+)/pages", path)
+        if m:
+            with st.lock:
+                st.pages.setdefault(m.group(2), time.time())
+            return self._send(201, {"status": "queued"})
+        m = re.fullmatch(r"/repos/([^/]+)/([^/]+)/git/(blobs|trees|commits)", path)
+        if m:
+            return self._git_data_post(m.group(2), m.group(3), body)
+        self._send(404, {"message": "Not Found"})
+
+    def do_PATCH(self):
+        path = self.path.split("?")[0]
+        body = self._body() or {}
+        if self._rate_limited(path):
+            return self._limited()
+        m = re.fullmatch(r"/repos/([^/]+)/([^/]+)/git/refs/heads/(.+)", path)
+        if not m:
+            return self._send(404, {"message": "Not Found"})
+        self._git(m.group(2), "update-ref", f"refs/heads/{m.group(3)}", body["sha"])
+        self._wrote("ref")
+        self._send(200, {"ref": f"refs/heads/{m.group(3)}", "object": {"sha": body["sha"], "type": "commit"}})
+
+    def do_PUT(self):
+        path = self.path.split("?")[0]
+        body = self._body() or {}
+        if self._rate_limited(path):
+            return self._limited()
+        m = re.fullmatch(r"/repos/([^/]+)/([^/]+)/contents/(.+)", path)
+        if not m:
+            return self._send(404, {"message": "Not Found"})
+        name, file_path = m.group(2), m.group(3)
+        ref = f"refs/heads/{body.get('branch', 'main')}"
+        parent = self._git(name, "rev-parse", "--verify", "-q", ref, check=False)
+        blob = self._git(name, "hash-object", "-w", "--stdin", input=base64.b64decode(body["content"]))
+        tree = self._write_tree(name, [{"mode": "100644", "sha": blob, "path": file_path}],
+                                f"{parent}^{{tree}}" if parent else None)
+        commit = self._commit_tree(name, tree, [parent] if parent else [], body["message"])
+        self._git(name, "update-ref", ref, commit)
+        self._wrote("contents")
+        self._send(201, {"content": {"path": file_path, "sha": blob}, "commit": {"sha": commit}})
+
+
+class FakeChat(_Handler):
+    """Chat Completions stand-in that answers after `latency` seconds, streamed or not.
+
+    A `slow_fraction` of requests (picked by a seeded RNG) take `slow_latency`
+    seconds instead, to give the latency distribution a tail.
+    """
+
+    def do_POST(self):
+        try:
+            self._complete()
+        except (BrokenPipeError, ConnectionResetError):
+            # the client gave up on this request (a cancelled hedge)
+            self.close_connection = True
+
+    def _complete(self):
+        st = self.server.state
+        req = self._body() or {}
+        with st.lock:
+            st.calls += 1
+            slow = st.rng.random() < st.slow_fraction
+        latency = st.slow_latency if slow else st.latency
+        prompt = json.loads(req["messages"][-1]["content"])
+        files = {
+            "index.html": "<!doctype html><html><body><h1>Bench</h1><p>%s</p></body></html>" % prompt.get("brief", ""),
+            "app.js": "console.log(%s);" % json.dumps(prompt.get("brief", "")),
+        }
+        text = json.dumps(files)
+        # a rough word/punctuation count stands in for the model's tokenizer
+        prompt_tokens = sum(len(re.findall(r"\w+|[^\w\s]", m["content"])) + 4 for m in req["messages"])
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(re.findall(r"\w+|[^\w\s]", text))}
+        if not req.get("stream"):
+            time.sleep(latency)
+            return self._send(200, {"choices": [{"message": {"role": "assistant", "content": text}}], "usage": usage})
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        pieces = [text[i:i + 32] for i in range(0, len(text), 32)]
+        for piece in pieces:
+            time.sleep(latency / len(pieces))
+            chunk = {"choices": [{"delta": {"content": piece}}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+        if (req.get("stream_options") or {}).get("include_usage"):
+            self.wfile.write(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n".encode())
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+
+class FakeEvaluator(_Handler):
+    """Records when each (task, round) callback arrives."""
+
+    def do_POST(self):
+        st = self.server.state
+        body = self._body() or {}
+        key = (body.get("task"), int(body.get("round", 1)))
+        with st.lock:
+            st.received[key] = time.time()
+            event = st.events.setdefault(key, threading.Event())
+        event.set()
+        self._send(200, {"ok": True})
+
+
+class EvaluatorServer(_Server):
+    def __init__(self):
+        super().__init__(FakeEvaluator, received={}, events={})
+
+    def wait(self, task, round_num, timeout):
+        """Return the time the (task, round) callback arrived, or None after timeout."""
+        with self.lock:
+            event = self.events.setdefault((task, round_num), threading.Event())
+        if not event.wait(timeout):
+            return None
+        with self.lock:
+            return self.received[(task, round_num)]
+
+
+def _request(method, url, body=None, timeout=30):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as r:
+            return r.status, r.headers, r.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+
+def _percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    k = max(0, min(len(values) - 1, int(round(p / 100.0 * len(values) + 0.5)) - 1))
+    return values[k]
+
+
+def _peak_rss(pid):
+    """Peak resident set size of pid in bytes (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _parse_prompt_tokens(text):
+    """Mean prompt tokens per LLM request, as estimated by the service and as reported by the fake."""
+    sums = {}
+    for m in re.finditer(r'^llm_deploy_llm_prompt_tokens_(sum|count)\{source="([^"]+)"\} (\S+)$', text, re.M):
+        sums.setdefault(m.group(2), {})[m.group(1)] = float(m.group(3))
+    return {source: v["sum"] / v["count"] if v.get("count") else None for source, v in sorted(sums.items())}
+
+
+def _png(width, height):
+    """A blank RGB PNG of the given size."""
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    rows = (b"\0" + b"\0" * width * 3) * height
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b""))
+
+
+def _sample_attachments():
+    """An image and a CSV table as data: URIs, like a typical task's attachments."""
+    csv = "id,name,score\n" + "".join(f"{i},item{i},{i * 7 % 100}\n" for i in range(2000))
+    return [
+        {"name": "logo.png", "url": "data:image/png;base64," + base64.b64encode(_png(640, 480)).decode()},
+        {"name": "data.csv", "url": "data:text/csv;base64," + base64.b64encode(csv.encode()).decode()},
+    ]
+
+
+def _parse_stages(text):
+    stages = {}
+    for m in re.finditer(r'^llm_deploy_stage_seconds_(sum|count)\{stage="([^"]+)"\} (\S+)$', text, re.M):
+        stages.setdefault(m.group(2), {})[m.group(1)] = float(m.group(3))
+    return {
+        name: {"count": int(v.get("count", 0)), "mean_seconds": v["sum"] / v["count"] if v.get("count") else None}
+        for name, v in sorted(stages.items())
+    }
+
+
+class Service:
+    """One front end running as a subprocess against the fakes."""
+
+    COMMANDS = {
+        "flask": [sys.executable, "app.py"],
+        "fastapi": [sys.executable, "-m", "uvicorn", "src.fastapi_app:app", "--host", "127.0.0.1", "--port", "{port}"],
+    }
+
+    def __init__(self, frontend, workdir, github, chat, args):
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        state = os.path.join(workdir, "state")
+        os.makedirs(state, exist_ok=True)
+        env = dict(os.environ)
+        env.update({
+            "PORT": str(self.port),
+            "secret": SECRET,
+            "GITHUB_TOKEN": TOKEN,
+            "GITHUB_API_URL": github.url,
+            "PAGES_URL_TEMPLATE": github.url + "/pages/{owner}/{repo}/",
+            "PAGES_MIN_INTERVAL": "0.2",
+            "PAGES_MAX_INTERVAL": "1",
+            "OPENAI_API_KEY": "bench",
+            "OPENAI_API_URL": chat.url + "/v1/chat/completions",
+            "LLM_STREAM": "true" if args.stream else "false",
+            "BUILD_WORKERS": str(args.workers),
+            "BUILD_QUEUE_SIZE": str(max(args.requests, 32)),
+            "RESULT_STORE_PATH": os.path.join(state, "results.db"),
+            "NOTIFY_OUTBOX_PATH": os.path.join(state, "outbox.db"),
+            "MIRROR_CACHE_DIR": os.path.join(state, "mirrors"),
+            "LLM_CACHE_DIR": os.path.join(state, "llm-cache"),
+            "ATTACHMENT_SPOOL_DIR": os.path.join(state, "spool"),
+            "GIT_TERMINAL_PROMPT": "0",
+            # send every github.com remote (with or without the token) to the local bare repos
+            "GIT_CONFIG_COUNT": "3",
+            "GIT_CONFIG_KEY_0": f"url.file://{github.remotes}/.insteadOf",
+            "GIT_CONFIG_VALUE_0": f"https://{TOKEN}@github.com/",
+            "GIT_CONFIG_KEY_1": f"url.file://{github.remotes}/.insteadOf",
+            "GIT_CONFIG_VALUE_1": "https://github.com/",
+            "GIT_CONFIG_KEY_2": "init.defaultBranch",
+            "GIT_CONFIG_VALUE_2": "main",
+            "GITHUB_WRITES_PER_MINUTE": str(args.github_writes_per_minute),
+            "DEPLOY_MODE": args.deploy_mode,
+        })
+        if args.github_tokens > 1:
+            # a pool of tokens for the scheduler to rotate; pooling needs an org owner
+            tokens = [TOKEN] + [f"{TOKEN}-{i}" for i in range(1, args.github_tokens)]
+            env.update({"GITHUB_TOKENS": ",".join(tokens), "GITHUB_OWNER": OWNER,
+                        "GIT_CONFIG_COUNT": str(3 + len(tokens) - 1)})
+            for i, token in enumerate(tokens[1:], start=3):
+                env[f"GIT_CONFIG_KEY_{i}"] = f"url.file://{github.remotes}/.insteadOf"
+                env[f"GIT_CONFIG_VALUE_{i}"] = f"https://{token}@github.com/"
+        self.workers = []
+        if args.worker_procs:
+            # API process only enqueues; separate worker processes lease the jobs
+            env.update({"BUILD_QUEUE_BACKEND": "sqlite", "BUILD_QUEUE_PATH": os.path.join(state, "jobs.db"),
+                        "JOB_POLL_INTERVAL": "0.1", "WORKER_IDLE_SECONDS": "0.1"})
+            for i in range(args.worker_procs):
+                log = open(os.path.join(workdir, f"worker-{i}.log"), "wb")
+                self.workers.append((subprocess.Popen(
+                    [sys.executable, "-m", "src.worker", "--concurrency", str(args.workers)],
+                    cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT), log))
+        cmd = [c.format(port=self.port) for c in self.COMMANDS[frontend]]
+        self.log = open(os.path.join(workdir, f"{frontend}.log"), "wb")
+        self.proc = subprocess.Popen(cmd, cwd=REPO_ROOT, env=env, stdout=self.log, stderr=subprocess.STDOUT)
+        deadline = time.time() + 60
+        while time.time() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"{frontend} exited early; see {self.log.name}")
+            try:
+                if _request("GET", self.url + "/metrics", timeout=2)[0] == 200:
+                    return
+            except OSError:
+                pass
+            time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f"{frontend} did not start; see {self.log.name}")
+
+    def stop(self):
+        rss = _peak_rss(self.proc.pid)
+        for proc, log in [(self.proc, self.log)] + self.workers:
+            if proc.poll() is None:
+                proc.send_signal(signal.SIGINT)
+                try:
+                    proc.wait(10)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+                    proc.wait()
+            log.close()
+        return rss
+
+
+def run_frontend(frontend, args):
+    workdir = tempfile.mkdtemp(prefix=f"llm-deploy-bench-{frontend}-")
+    remotes = os.path.join(workdir, "remotes")
+    os.makedirs(os.path.join(remotes, OWNER))
+    github = _Server(FakeGitHub, repos=set(), pages={}, pages_delay=args.pages_delay, remotes=remotes,
+                     rate_limit=args.github_rate_limit, rate_window=args.github_rate_window, usage={}, limited=0,
+                     retry_after=None, git_writes={})
+    chat = _Server(FakeChat, latency=args.llm_latency, slow_fraction=args.llm_slow_fraction,
+                   slow_latency=args.llm_slow_latency, calls=0, rng=random.Random(0))
+    evaluator = EvaluatorServer()
+    service = Service(frontend, workdir, github, chat, args)
+
+    latencies = {1: [], 2: []}
+    failures = []
+    rejected = [0]
+
+    def submit(body):
+        while True:
+            status, headers, data = _request("POST", service.url + "/api-endpoint", body)
+            if status != 429:
+                return status, data
+            rejected[0] += 1
+            time.sleep(float(headers.get("Retry-After") or 1))
+
+    attachments = _sample_attachments() if args.attachments else []
+
+    def task_body(i, round_num):
+        task = f"bench-{frontend}-{i}"
+        return {
+            "email": f"bench{i}@example.com",
+            "secret": SECRET,
+            "task": task,
+            "round": round_num,
+            "nonce": f"{task}-r{round_num}",
+            "brief": f"Benchmark app {i}, round {round_num}",
+            "checks": [],
+            "evaluation_url": evaluator.url + "/notify",
+            "attachments": attachments,
+        }
+
+    def one_task(i):
+        task = f"bench-{frontend}-{i}"
+        for round_num in range(1, args.rounds + 1):
+            body = task_body(i, round_num)
+            started = time.time()
+            status, data = submit(body)
+            if status != 200:
+                failures.append({"task": task, "round": round_num, "status": status, "body": data[:200].decode(errors="replace")})
+                return
+            received = evaluator.wait(task, round_num, args.timeout)
+            if received is None:
+                failures.append({"task": task, "round": round_num, "status": "timeout"})
+                return
+            latencies[round_num].append(received - started)
+
+    def batched_round(round_num):
+        # submit every task of the round through /api-endpoint/batch, then wait for the callbacks
+        bodies = [task_body(i, round_num) for i in range(args.requests)]
+        submitted = {}
+        for k in range(0, len(bodies), args.batch):
+            chunk = bodies[k:k + args.batch]
+            sent = time.time()
+            status, _, data = _request("POST", service.url + "/api-endpoint/batch", {"requests": chunk})
+            if status != 200:
+                failures.extend({"task": b["task"], "round": round_num, "status": status} for b in chunk)
+                continue
+            for body, item in zip(chunk, json.loads(data)["items"]):
+                if "error" in item:
+                    rejected[0] += item.get("status_code") == 429
+                    failures.append({"task": body["task"], "round": round_num, "status": item.get("status_code")})
+                else:
+                    submitted[body["task"]] = sent
+
+        def wait(task):
+            received = evaluator.wait(task, round_num, args.timeout)
+            if received is None:
+                failures.append({"task": task, "round": round_num, "status": "timeout"})
+            else:
+                latencies[round_num].append(received - submitted[task])
+
+        with ThreadPoolExecutor(max_workers=max(1, len(submitted))) as pool:
+            list(pool.map(wait, submitted))
+
+    flood = {"accepted": 0, "rejected_429": 0}
+
+    def flood_submit():
+        # one submitter queues a burst of fire-and-forget builds just before the measured tasks
+        for i in range(args.flood):
+            body = dict(task_body(i, 1), email="flood@example.com", task=f"flood-{frontend}-{i}", nonce=f"flood-{i}")
+            status = _request("POST", service.url + "/api-endpoint", body)[0]
+            key = {200: "accepted", 429: "rejected_429"}.get(status, str(status))
+            flood[key] = flood.get(key, 0) + 1
+
+    flood_submit()
+    started = time.time()
+    try:
+        if args.batch:
+            for round_num in range(1, args.rounds + 1):
+                batched_round(round_num)
+        else:
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                list(pool.map(one_task, range(args.requests)))
+        wall = time.time() - started
+        metrics_text = _request("GET", service.url + "/metrics")[2].decode()
+    finally:
+        peak_rss = service.stop()
+        for server in (github, chat, evaluator):
+            server.close()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    all_latencies = latencies[1] + latencies[2]
+
+    def summary(values):
+        return {
+            "count": len(values),
+            "mean": sum(values) / len(values) if values else None,
+            "p50": _percentile(values, 50),
+            "p95": _percentile(values, 95),
+            "p99": _percentile(values, 99),
+            "max": max(values) if values else None,
+        }
+
+    return {
+        "frontend": frontend,
+        "builds": args.requests * args.rounds,
+        "completed": len(all_latencies),
+        "failed": len(failures),
+        "rejected_429": rejected[0],
+        "github_rate_limited_403": github.limited,
+        "github_git_writes": github.git_writes,
+        "llm_requests": chat.calls,
+        "flood": flood if args.flood else None,
+        "wall_seconds": wall,
+        "throughput_per_second": len(all_latencies) / wall if wall else None,
+        "latency_seconds": summary(all_latencies),
+        "latency_seconds_by_round": {str(r): summary(v) for r, v in latencies.items() if v},
+        "stages": _parse_stages(metrics_text),
+        "llm_prompt_tokens": _parse_prompt_tokens(metrics_text),
+        "peak_rss_bytes": peak_rss,
+        "failures": failures[:20],
+        "workdir": workdir if args.keep else None,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--frontend", choices=["flask", "fastapi", "both"], default="both")
+    parser.add_argument("--requests", type=int, default=20, help="tasks to submit per front end")
+    parser.add_argument("--concurrency", type=int, default=4, help="tasks in flight at once")
+    parser.add_argument("--rounds", type=int, choices=[1, 2], default=1, help="submit a round 2 after each round 1")
+    parser.add_argument("--workers", type=int, default=4, help="BUILD_WORKERS for the service")
+    parser.add_argument("--batch", type=int, default=0,
+                        help="submit each round through /api-endpoint/batch, this many tasks per batch")
+    parser.add_argument("--worker-procs", type=int, default=0,
+                        help="run builds in this many `python -m src.worker` processes (BUILD_QUEUE_BACKEND=sqlite)")
+    parser.add_argument("--flood", type=int, default=0,
+                        help="first submit this many round-1 builds from one submitter, to measure fairness")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds the fake LLM takes per completion")
+    parser.add_argument("--attachments", action="store_true",
+                        help="attach a PNG and a CSV (as data: URIs) to every task")
+    parser.add_argument("--llm-slow-fraction", type=float, default=0,
+                        help="fraction of LLM completions that take --llm-slow-latency instead")
+    parser.add_argument("--llm-slow-latency", type=float, default=20, help="seconds a slow LLM completion takes")
+    parser.add_argument("--stream", action="store_true", help="run the service with LLM_STREAM=true")
+    parser.add_argument("--pages-delay", type=float, default=1.0, help="seconds before a Pages site goes live")
+    parser.add_argument("--github-rate-limit", type=int, default=0,
+                        help="API calls each token may make per --github-rate-window on the fake GitHub (0: unlimited)")
+    parser.add_argument("--github-rate-window", type=float, default=60, help="seconds until a token's rate limit resets")
+    parser.add_argument("--github-tokens", type=int, default=1, help="run the service with a GITHUB_TOKENS pool this large")
+    parser.add_argument("--github-writes-per-minute", type=float, default=0,
+                        help="GITHUB_WRITES_PER_MINUTE for the service (default 0: no write pacing)")
+    parser.add_argument("--deploy-mode", choices=["git", "api"], default="git",
+                        help="DEPLOY_MODE for the service: push with git, or commit through the Git Data API")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds to wait for each evaluator callback")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--keep", action="store_true", help="keep the work directory (logs, remotes, state)")
+    args = parser.parse_args(argv)
+
+    frontends = ["flask", "fastapi"] if args.frontend == "both" else [args.frontend]
+    report = {
+        "benchmark": "llm-deploy-e2e",
+        "format_version": 1,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "keep")},
+        "results": [run_frontend(f, args) for f in frontends],
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0 if all(r["failed"] == 0 for r in report["results"]) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""Check that the service modules import quickly and without network calls.
+
+Each module is imported in a fresh interpreter with `-X importtime`, with
+GITHUB_API_URL pointed at a local socket that accepts connections but never
+answers, so any GitHub call made at import time shows up as a timeout rather
+than a slow pass. A module fails if its import takes longer than the budget
+or pulls in a module it must not depend on (the FastAPI app must not load
+Flask). Exits non-zero on failure, so it can run in CI:
+
+    python scripts/check_import_time.py --budget 2.0
+"""
+import os
+import re
+import sys
+import time
+import socket
+import argparse
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# module -> modules it must not import
+CHECKS = {
+    "src.build": ("flask", "fastapi"),
+    "src.fastapi_app": ("flask",),
+    "src.server": ("fastapi",),
+}
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+print("elapsed", time.perf_counter() - start)
+print("loaded", " ".join(m for m in {forbidden!r} if m in sys.modules))
+"""
+
+
+def _blackhole():
+    """A listening socket that is never read from: requests to it hang until they time out."""
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    s.listen(64)
+    return s
+
+
+def _slowest(stderr, n=8):
+    """Return the n slowest imports (cumulative microseconds) from -X importtime output."""
+    rows = []
+    for line in stderr.splitlines():
+        m = re.match(r"import time:\s+\d+ \|\s+(\d+) \|(\s*)(\S+)", line)
+        if m:
+            rows.append((int(m.group(1)), m.group(3)))
+    return sorted(rows, reverse=True)[:n]
+
+
+def check(module, forbidden, budget, env):
+    """Import module in a subprocess; return (elapsed, loaded forbidden modules, error or None)."""
+    started = time.perf_counter()
+    try:
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", PROBE.format(module=module, forbidden=forbidden)],
+            cwd=REPO_ROOT, env=env, capture_output=True, text=True, timeout=budget + 30,
+        )
+    except subprocess.TimeoutExpired:
+        return time.perf_counter() - started, [], "import hung (network call at import time?)"
+    if proc.returncode:
+        return time.perf_counter() - started, [], proc.stderr.strip().splitlines()[-1]
+    out = dict(line.split(" ", 1) if " " in line else (line, "") for line in proc.stdout.splitlines()
+               if line.startswith(("elapsed", "loaded")))
+    elapsed = float(out["elapsed"])
+    loaded = out.get("loaded", "").split()
+    if elapsed > budget:
+        slowest = ", ".join(f"{name} {us / 1e6:.2f}s" for us, name in _slowest(proc.stderr))
+        return elapsed, loaded, f"over budget; slowest imports: {slowest}"
+    return elapsed, loaded, None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--budget", type=float, default=float(os.environ.get("IMPORT_TIME_BUDGET", "2.0")),
+                        help="maximum seconds per module import (default 2.0)")
+    parser.add_argument("modules", nargs="*", default=list(CHECKS), help="modules to check")
+    args = parser.parse_args(argv)
+
+    hole = _blackhole()
+    env = dict(os.environ,
+               GITHUB_API_URL="http://127.0.0.1:%d" % hole.getsockname()[1],
+               GITHUB_TOKEN=os.environ.get("GITHUB_TOKEN", "import-check"),
+               HTTP_TIMEOUT="60")
+    failed = False
+    try:
+        for module in args.modules:
+            elapsed, loaded, error = check(module, CHECKS.get(module, ()), args.budget, env)
+            if loaded:
+                error = "imports " + ", ".join(loaded)
+            failed = failed or bool(error)
+            print(f"{'FAIL' if error else 'ok':4}  {module:20} {elapsed:6.2f}s" + (f"  {error}" if error else ""))
+    finally:
+        hole.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""Per-submitter admission control for build requests.
+
+build.submit_build checks every new request here before queueing it. A
+submitter (the request's email) may have at most SUBMITTER_MAX_ACTIVE builds
+queued or running, and may submit SUBMITTER_RATE_PER_MINUTE new builds per
+minute with bursts of SUBMITTER_BURST. Over either limit the request is
+refused at once with SubmitterLimited, which the front ends turn into a 429
+with Retry-After; it is not queued. Retries of a request that is already
+queued or finished are answered before this check and never count.
+
+The active-build limit is checked by the build queue in the same critical
+section that inserts the job, so concurrent submits cannot both slip under
+it; with the SQLite backend that holds across processes. The rate limit is
+kept per process.
+"""
+import os
+import math
+import time
+import threading
+
+from .jobs import QueueFull, SubmitterLimited
+from .metrics import registry
+
+# builds one submitter may have queued or running; 0 disables
+SUBMITTER_MAX_ACTIVE = int(os.environ.get("SUBMITTER_MAX_ACTIVE", "16"))
+# new builds one submitter may start per minute; 0 disables
+SUBMITTER_RATE_PER_MINUTE = float(os.environ.get("SUBMITTER_RATE_PER_MINUTE", "60"))
+SUBMITTER_BURST = int(os.environ.get("SUBMITTER_BURST", "20"))
+
+REJECTIONS = registry.counter(
+    "llm_deploy_admission_rejections_total", "Requests refused by per-submitter limits, by limit.", ["limit"])
+
+
+class Admission:
+    def __init__(self, max_active=SUBMITTER_MAX_ACTIVE, rate_per_minute=SUBMITTER_RATE_PER_MINUTE,
+                 burst=SUBMITTER_BURST, max_tracked=10000):
+        self.max_active = max_active
+        self.rate = rate_per_minute / 60.0
+        self.burst = max(1, burst)
+        self.max_tracked = max_tracked
+        self._buckets = {}  # submitter -> [tokens, updated_at]
+        self._lock = threading.Lock()
+
+    def submit(self, submitter, queue, key, target, *args, **kwargs):
+        """queue.submit_keyed(key, target, *args, **kwargs) within submitter's limits.
+
+        Returns (job, created). The allowance is taken only by a job that was
+        actually created. Raises SubmitterLimited or QueueFull.
+        """
+        self.admit(submitter)
+        try:
+            job, created = queue.submit_keyed(key, target, *args, submitter=submitter,
+                                              max_active=self.max_active, **kwargs)
+        except QueueFull as e:
+            if isinstance(e, SubmitterLimited):
+                REJECTIONS.inc(limit="active")
+            self.refund(submitter)
+            raise
+        if not created:
+            # a concurrent duplicate got there first
+            self.refund(submitter)
+        return job, created
+
+    def admit(self, submitter):
+        """Take one build from submitter's rate allowance or raise SubmitterLimited."""
+        if not self.rate:
+            return
+        now = time.time()
+        with self._lock:
+            bucket = self._buckets.get(submitter)
+            if bucket is None:
+                if len(self._buckets) >= self.max_tracked:
+                    self._prune(now)
+                bucket = self._buckets[submitter] = [float(self.burst), now]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                REJECTIONS.inc(limit="rate")
+                raise SubmitterLimited(math.ceil((1 - bucket[0]) / self.rate),
+                                       "too many requests from this submitter")
+            bucket[0] -= 1
+
+    def refund(self, submitter):
+        """Give back the allowance admit() took for a request that was not queued after all."""
+        if not self.rate:
+            return
+        with self._lock:
+            bucket = self._buckets.get(submitter)
+            if bucket is not None:
+                bucket[0] = min(self.burst, bucket[0] + 1)
+
+    def _prune(self, now):
+        # caller holds self._lock; a bucket that has refilled is the same as no bucket
+        for submitter, (tokens, updated) in list(self._buckets.items()):
+            if tokens + (now - updated) * self.rate >= self.burst:
+                del self._buckets[submitter]
+
+
+# Shared by both front ends (via build.submit_build)
+admission = Admission()
@@ -0,0 +1,330 @@
+"""Native asyncio build pipeline, used by the FastAPI front end.
+
+Mirrors build.build_repo_payload step for step, but GitHub and OpenAI calls
+go through one shared httpx.AsyncClient and git runs as asyncio
+subprocesses, so a single event loop carries many builds at once. Only
+file generation (local disk I/O), the Git Data API publisher, the mirror
+cache checkout for round 2 and the SQLite result store and outbox writes
+run in a thread.
+"""
+import weakref
+import asyncio
+import logging
+import tempfile
+import subprocess
+from contextlib import asynccontextmanager
+
+import httpx
+
+from . import build, github_helper
+from .attachments import fetcher
+from .generator import generate_app
+from .github_scheduler import scheduler, token_from_header
+from .github_helper import (
+    GITHUB_OWNER, DEPLOY_MODE, metadata, invalidate_metadata, pages_url_for,
+    _existing_repo, _get_token,
+)
+from .http_client import GITHUB_API_URL, HTTP_TIMEOUT, HTTP_POOL_SIZE
+from .jobs import ASYNC_BUILD_CONCURRENCY
+from .llm_generator import OPENAI_API_KEY, agenerate_with_openai
+from .metrics import stage, failed_stage, BUILDS, BUILD_FAILURES, FORCE_PUSHES, STAGE_SECONDS
+from .mirror_cache import mirrors
+
+logger = logging.getLogger(__name__)
+
+_client = None
+# rounds of the same repo wait here on the loop rather than on the mirror lock in a thread;
+# a lock goes away once no build holds or waits on it
+_repo_locks = weakref.WeakValueDictionary()
+
+
+def _http():
+    """Return the AsyncClient for the running loop (build coroutines all run on one loop)."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(max_connections=max(HTTP_POOL_SIZE, ASYNC_BUILD_CONCURRENCY)),
+        )
+    return _client
+
+
+def _headers():
+    return {"Authorization": f"token {_get_token()}", "Accept": "application/vnd.github+json"}
+
+
+async def _api(method, url, **kwargs):
+    """Send one GitHub API request through the rate-limit scheduler."""
+    token = token_from_header(kwargs.get("headers", {}).get("Authorization"))
+    return await scheduler.acall(token, method, lambda: _http().request(method, url, **kwargs))
+
+
+async def _git(*args, cwd=None):
+    """Run git asynchronously; raise CalledProcessError on failure and return stdout."""
+    proc = await asyncio.create_subprocess_exec(
+        "git", *args, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = await proc.communicate()
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, ["git", *args], out, err)
+    return out.decode().strip()
+
+
+async def get_authenticated_user():
+    """Async counterpart of github_helper.get_authenticated_user (shares its cache)."""
+    headers = _headers()
+    key = ("login", headers["Authorization"])
+    login = metadata.get(key)
+    if login:
+        return login
+    r = await _api("GET", f"{GITHUB_API_URL}/user", headers=headers)
+    r.raise_for_status()
+    login = r.json().get("login")
+    metadata.set(key, login)
+    return login
+
+
+async def _target_owner():
+    return GITHUB_OWNER or await get_authenticated_user()
+
+
+async def _create_repo(repo_name):
+    """Create repo_name (or reuse it if it exists) and return the repo JSON."""
+    headers = _headers()
+    owner = await _target_owner()
+    if metadata.get(("repo", owner, repo_name)):
+        return _existing_repo(owner, repo_name)
+    create_url = f"{GITHUB_API_URL}/orgs/{GITHUB_OWNER}/repos" if GITHUB_OWNER else f"{GITHUB_API_URL}/user/repos"
+    with stage("create_repo"):
+        r = await _api("POST", create_url, headers=headers, json={"name": repo_name, "private": False, "auto_init": False})
+    if r.status_code == 422:
+        repo = _existing_repo(owner, repo_name)
+    else:
+        if r.status_code == 401:
+            metadata.invalidate("login", headers["Authorization"])
+        if r.is_error:
+            logger.error("GitHub repo creation failed: %s %s", r.status_code, r.text)
+        r.raise_for_status()
+        repo = r.json()
+    metadata.set(("repo", repo["owner"]["login"], repo_name), True)
+    return repo
+
+
+async def _push(workdir, token, https_url):
+    """Push main with token, falling back to --force, and leave the token out of the config."""
+    await _git("remote", "set-url", "origin", https_url.replace("https://", f"https://{token}@"), cwd=workdir)
+    try:
+        try:
+            async with scheduler.aslot(token):
+                await _git("push", "-u", "origin", "main", cwd=workdir)
+        except subprocess.CalledProcessError:
+            logger.warning("Normal push failed, attempting force push")
+            FORCE_PUSHES.inc()
+            async with scheduler.aslot(token):
+                await _git("push", "-u", "origin", "main", "--force", cwd=workdir)
+    finally:
+        await _git("remote", "set-url", "origin", https_url, cwd=workdir)
+
+
+async def _push_new(source_dir, repo):
+    """Async counterpart of github_helper._push_with_git."""
+    token = _get_token()
+    https_url = repo["clone_url"]
+    await _git("init", cwd=source_dir)
+    await _git("add", "-A", cwd=source_dir)
+    await _git("-c", "user.name=student", "-c", "user.email=student@example.com",
+               "commit", "-m", "Initial commit", cwd=source_dir)
+    await _git("branch", "-M", "main", cwd=source_dir)
+    await _git("remote", "add", "origin", https_url, cwd=source_dir)
+    with stage("git_push"):
+        await _push(source_dir, token, https_url)
+    return await _git("rev-parse", "HEAD", cwd=source_dir)
+
+
+async def enable_pages(owner, repo_name):
+    """Async counterpart of github_helper.enable_pages."""
+    if metadata.get(("pages", owner, repo_name)):
+        return
+    headers = _headers()
+    pages_api = f"{GITHUB_API_URL}/repos/{owner}/{repo_name}/pages"
+    with STAGE_SECONDS.time(stage="pages_enable"):
+        try:
+            existing = await _api("GET", pages_api, headers=headers)
+            if existing.status_code != 200:
+                r = await _api("POST", pages_api, headers=headers, json={"source": {"branch": "main", "path": "/"}})
+                r.raise_for_status()
+            metadata.set(("pages", owner, repo_name), True)
+        except Exception:
+            # non-fatal, as in the synchronous path
+            pass
+
+
+async def create_repo_from_dir(source_dir, task_name):
+    """Async counterpart of github_helper.create_repo_from_dir(wait_for_pages=False)."""
+    repo_name = task_name.replace(' ', '-').lower()
+    if DEPLOY_MODE == "api":
+        # the Git Data API publisher is synchronous; keep it off the loop
+        return await asyncio.to_thread(github_helper.create_repo_from_dir, source_dir, task_name, False)
+    repo = await _create_repo(repo_name)
+    owner = repo["owner"]["login"]
+    sha = await _push_new(source_dir, repo)
+    await enable_pages(owner, repo_name)
+    return repo["html_url"], sha, pages_url_for(owner, repo_name)
+
+
+@asynccontextmanager
+async def _checkout(owner, repo_name, token):
+    """mirror_cache.checkout for coroutines: its blocking enter and exit run in a thread."""
+    token_url = f"https://{token}@github.com/{owner}/{repo_name}.git"
+    cm = mirrors.checkout(owner, repo_name, token_url, network=lambda: scheduler.slot(token))
+    loop = asyncio.get_running_loop()
+    entering = loop.run_in_executor(None, cm.__enter__)
+    try:
+        workdir = await asyncio.shield(entering)
+    except asyncio.CancelledError:
+        # the thread still takes the repo lock; release it once the checkout is done
+        def release(f):
+            if not f.cancelled() and f.exception() is None:
+                loop.run_in_executor(None, cm.__exit__, None, None, None)
+
+        entering.add_done_callback(release)
+        raise
+    try:
+        yield workdir
+    except BaseException as e:
+        if not await loop.run_in_executor(None, cm.__exit__, type(e), e, e.__traceback__):
+            raise
+    else:
+        await loop.run_in_executor(None, cm.__exit__, None, None, None)
+
+
+async def _update_repo(body, owner, repo_name, files):
+    """Round 2 in git mode: check out main from the mirror cache, regenerate on top, commit and push."""
+    token = _get_token()
+    https_url = f"https://github.com/{owner}/{repo_name}.git"
+    lock = _repo_locks.get((owner, repo_name))
+    if lock is None:
+        lock = _repo_locks[(owner, repo_name)] = asyncio.Lock()
+    async with lock:
+        try:
+            async with _checkout(owner, repo_name, token) as workdir:
+                # keep the token out of the working copy's config, as github_helper.checkout_repo does
+                await _git("remote", "set-url", "origin", https_url, cwd=workdir)
+                metadata.set(("repo", owner, repo_name), True)
+                return await _update_in(body, owner, repo_name, files, workdir, token, https_url)
+        except subprocess.CalledProcessError:
+            invalidate_metadata(owner, repo_name)
+            raise
+
+
+async def _record_status(body, status, **kwargs):
+    """build.record_status off the event loop: the result store is synchronous SQLite."""
+    await asyncio.to_thread(build.record_status, body, status, **kwargs)
+
+
+async def _update_in(body, owner, repo_name, files, workdir, token, https_url):
+    with stage("generate"):
+        await asyncio.to_thread(generate_app, body, workdir, files=files)
+    await _record_status(body, "pushing")
+    with stage("publish"):
+        await _git("add", "-A", cwd=workdir)
+        staged = await asyncio.create_subprocess_exec("git", "diff", "--cached", "--quiet", cwd=workdir)
+        if await staged.wait() != 0:
+            await _git("-c", "user.name=student", "-c", "user.email=student@example.com",
+                       "commit", "-m", f"Round {body['round']} update", cwd=workdir)
+            with stage("git_push"):
+                await _push(workdir, token, https_url)
+        else:
+            logger.info("No changes for %s/%s, skipping commit and push", owner, repo_name)
+    return await _git("rev-parse", "HEAD", cwd=workdir)
+
+
+async def _generate_files(body):
+    """Ask the LLM for the app files; {} (placeholder app) if it is not configured or fails."""
+    if not OPENAI_API_KEY:
+        return {}
+    try:
+        return await agenerate_with_openai(body.get("brief", ""), body.get("attachments", []), _http()) or {}
+    except Exception:
+        logger.warning("LLM generation failed, using the placeholder app", exc_info=True)
+        return {}
+
+
+async def build_repo_payload(body):
+    """Async counterpart of build.build_repo_payload."""
+    BUILDS.inc(round=body.get("round", 1))
+    try:
+        with stage("build"):
+            return await _build_repo_payload(body)
+    except Exception as e:
+        BUILD_FAILURES.inc(stage=failed_stage(e))
+        await _record_status(body, "failed", error=str(e))
+        raise
+
+
+async def _build_repo_payload(body):
+    await _record_status(body, "generating")
+    task_name = body["task"]
+    round_num = int(body.get("round", 1))
+    # remote attachments download in threads while the LLM call is awaited
+    fetcher.fetch_all(body.get("attachments", []))
+    files = await _generate_files(body)
+
+    async def create():
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with stage("generate"):
+                await asyncio.to_thread(generate_app, body, tmpdir, files=files)
+            await _record_status(body, "pushing")
+            with stage("publish"):
+                return await create_repo_from_dir(tmpdir, task_name)
+
+    if round_num == 1:
+        repo_url, commit_sha, pages_url = await create()
+    else:
+        try:
+            owner = await _target_owner()
+            repo_name = task_name.replace(' ', '-').lower()
+            if DEPLOY_MODE == "api":
+                with tempfile.TemporaryDirectory() as tmpdir:
+                    with stage("generate"):
+                        await asyncio.to_thread(generate_app, body, tmpdir, files=files)
+                    await _record_status(body, "pushing")
+                    with stage("publish"):
+                        commit_sha = await asyncio.to_thread(
+                            github_helper.update_repo_via_api, tmpdir, owner, repo_name, f"Round {round_num} update")
+            else:
+                commit_sha = await _update_repo(body, owner, repo_name, files)
+            repo_url = f"https://github.com/{owner}/{repo_name}"
+            pages_url = pages_url_for(owner, repo_name)
+        except Exception:
+            # fallback: create a new repo if update failed
+            logger.warning("round %s update failed, creating the repo instead", round_num, exc_info=True)
+            repo_url, commit_sha, pages_url = await create()
+
+    payload = {
+        "email": body["email"],
+        "task": body["task"],
+        "round": body["round"],
+        "nonce": body["nonce"],
+        "repo_url": repo_url,
+        "commit_sha": commit_sha,
+        "pages_url": pages_url,
+    }
+    eval_payload = {
+        "commit_sha": commit_sha,
+        "message": "App built and deployed successfully",
+        "pages_url": pages_url,
+        "repo_url": repo_url,
+        "round": body["round"],
+        "task": body["task"],
+    }
+    await _record_status(body, "pages-pending", result=eval_payload)
+    return payload, eval_payload
+
+
+async def handle_build(body):
+    """Async counterpart of build.handle_build: build, then hand off to the Pages watcher."""
+    with build.github_priority(body):
+        payload, eval_payload = await build_repo_payload(body)
+    # the outbox insert is a SQLite write, like the status records
+    await asyncio.to_thread(build.notify_when_live, body, eval_payload)
+    return payload, eval_payload
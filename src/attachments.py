@@ -0,0 +1,360 @@
+import os
+import json
+import time
+import socket
+import base64
+import binascii
+import hashlib
+import tempfile
+import ipaddress
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote_to_bytes, urljoin, urlsplit
+
+from .http_client import HttpClient
+
+ATTACHMENT_MAX_BYTES = int(os.environ.get("ATTACHMENT_MAX_BYTES", str(10 * 1024 * 1024)))
+REQUEST_ATTACHMENTS_MAX_BYTES = int(os.environ.get("REQUEST_ATTACHMENTS_MAX_BYTES", str(25 * 1024 * 1024)))
+ATTACHMENT_SPOOL_DIR = os.environ.get(
+    "ATTACHMENT_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "llm-deploy", "spool")
+)
+# Bodies larger than this cannot carry attachments within the limits (base64 adds a third)
+MAX_REQUEST_BODY_BYTES = REQUEST_ATTACHMENTS_MAX_BYTES * 4 // 3 + 1024 * 1024
+ATTACHMENT_SPOOL_MAX_AGE = int(os.environ.get("ATTACHMENT_SPOOL_MAX_AGE", str(24 * 3600)))
+ATTACHMENT_FETCH_CONCURRENCY = int(os.environ.get("ATTACHMENT_FETCH_CONCURRENCY", "8"))
+ATTACHMENT_FETCH_TIMEOUT = float(os.environ.get("ATTACHMENT_FETCH_TIMEOUT", "20"))
+# cached downloads younger than this are reused without asking the origin again
+ATTACHMENT_FETCH_TTL = int(os.environ.get("ATTACHMENT_FETCH_TTL", "3600"))
+# allow downloads from loopback, link-local and private addresses (local testing only)
+ATTACHMENT_FETCH_ALLOW_PRIVATE = os.environ.get("ATTACHMENT_FETCH_ALLOW_PRIVATE", "false").lower() in ("1", "true", "yes")
+_MAX_REDIRECTS = 5
+
+# base64 characters decoded per step; a multiple of 4 keeps chunks aligned
+_CHUNK = 64 * 1024
+
+
+class AttachmentError(ValueError):
+    """Raised for attachments that cannot be ingested."""
+
+
+class AttachmentTooLarge(AttachmentError):
+    """Raised when an attachment, or all attachments together, exceed the size limits."""
+
+
+def _split_data_uri(url):
+    comma = url.find(',')
+    if comma < 0:
+        raise AttachmentError("malformed data URI")
+    header = url[5:comma]
+    mime = header.split(';')[0] or "text/plain"
+    return mime, header.endswith(';base64'), comma + 1
+
+
+def estimated_size(url):
+    """Return the decoded size of a data URI, estimated without decoding it."""
+    mime, is_b64, start = _split_data_uri(url)
+    n = len(url) - start
+    if not is_b64:
+        return n
+    # "=" padding decodes to nothing; without this a fully read file looks cut off
+    return n * 3 // 4 - len(url[-2:]) + len(url[-2:].rstrip("="))
+
+
+def check_sizes(attachments):
+    """Reject oversized data: attachments before any decoding work is done."""
+    total = 0
+    for a in attachments or []:
+        url = a.get("url") or ""
+        if not url.startswith("data:"):
+            continue
+        size = estimated_size(url)
+        if size > ATTACHMENT_MAX_BYTES:
+            raise AttachmentTooLarge(f"attachment {a.get('name')!r} exceeds {ATTACHMENT_MAX_BYTES} bytes")
+        total += size
+    if total > REQUEST_ATTACHMENTS_MAX_BYTES:
+        raise AttachmentTooLarge(f"attachments exceed {REQUEST_ATTACHMENTS_MAX_BYTES} bytes in total")
+
+
+def _iter_decoded(url, is_b64, start):
+    """Yield the decoded bytes of a data URI payload in bounded chunks."""
+    if not is_b64:
+        # percent-encoded text payloads are small; escapes may span chunk boundaries
+        yield unquote_to_bytes(url[start:])
+        return
+    carry = ''
+    for i in range(start, len(url), _CHUNK):
+        piece = carry + ''.join(url[i:i + _CHUNK].split())
+        n = len(piece) - len(piece) % 4
+        carry = piece[n:]
+        if n:
+            yield base64.b64decode(piece[:n], validate=False)
+    if carry:
+        yield base64.b64decode(carry + '=' * (-len(carry) % 4))
+
+
+def _decode_into(url, f, limit):
+    """Decode a data URI payload into the open binary file f. Returns (mime, size, sha256 hex).
+
+    Payloads that are not valid base64 are written as-is, matching the
+    generator's long-standing behaviour.
+    """
+    mime, is_b64, start = _split_data_uri(url)
+    h = hashlib.sha256()
+    size = 0
+    try:
+        for data in _iter_decoded(url, is_b64, start):
+            size += len(data)
+            if limit and size > limit:
+                raise AttachmentTooLarge(f"attachment exceeds {limit} bytes")
+            h.update(data)
+            f.write(data)
+    except binascii.Error:
+        f.seek(0)
+        f.truncate()
+        data = url[start:].encode('utf-8')
+        h = hashlib.sha256(data)
+        size = len(data)
+        f.write(data)
+    return mime, size, h.hexdigest()
+
+
+def decode_data_uri_to_file(url, path, limit=ATTACHMENT_MAX_BYTES):
+    """Decode a data URI into path chunk by chunk. Returns (mime, size, sha256 hex)."""
+    with open(path, "wb") as f:
+        return _decode_into(url, f, limit)
+
+
+def peek(attachment, limit):
+    """Return (mime, size, first `limit` bytes) of a spooled or data: attachment.
+
+    Returns None for anything else (http(s) attachments are downloaded later,
+    during generation) or if the spool file has gone.
+    """
+    if attachment.get("spool"):
+        try:
+            with open(attachment["spool"], "rb") as f:
+                head = f.read(limit)
+        except OSError:
+            return None
+        return attachment.get("mime"), attachment.get("size"), head
+    url = attachment.get("url") or ""
+    if not url.startswith("data:"):
+        return None
+    try:
+        mime, is_b64, start = _split_data_uri(url)
+        head = b""
+        # decode a little past the limit's worth of base64 only, not the whole URI
+        for data in _iter_decoded(url[:start + limit * 4 // 3 + 4], is_b64, start):
+            head += data
+    except (AttachmentError, binascii.Error):
+        return None
+    return mime, estimated_size(url), head[:limit]
+
+
+def check_public_url(url):
+    """Raise AttachmentError unless url's host resolves only to public addresses."""
+    host = urlsplit(url).hostname
+    if not host:
+        raise AttachmentError(f"attachment URL has no host: {url!r}")
+    try:
+        infos = socket.getaddrinfo(host, None)
+    except socket.gaierror as e:
+        raise AttachmentError(f"cannot resolve attachment host {host!r}: {e}")
+    for info in infos:
+        ip = ipaddress.ip_address(info[4][0].split('%')[0])
+        if not ip.is_global or ip.is_multicast:
+            raise AttachmentError(f"attachment host {host!r} is not a public address")
+
+
+_last_prune = 0.0
+
+
+def _prune_spool(spool_dir):
+    global _last_prune
+    now = time.time()
+    if now - _last_prune < 600:
+        return
+    _last_prune = now
+    for d in (spool_dir, os.path.join(spool_dir, "urls")):
+        try:
+            names = os.listdir(d)
+        except OSError:
+            continue
+        for name in names:
+            path = os.path.join(d, name)
+            try:
+                if os.path.isfile(path) and os.path.getmtime(path) < now - ATTACHMENT_SPOOL_MAX_AGE:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+def ingest(body, spool_dir=ATTACHMENT_SPOOL_DIR):
+    """Decode data: attachments in body into content-addressed spool files, in place.
+
+    Each data: attachment becomes {"name", "mime", "size", "sha256", "spool"},
+    so the multi-megabyte URI string is dropped as soon as it is decoded and
+    never reaches the queue, the LLM prompt or the generator. Other
+    attachments are left untouched. Raises AttachmentTooLarge / AttachmentError.
+    """
+    attachments = body.get("attachments") or []
+    check_sizes(attachments)
+    if not any((a.get("url") or "").startswith("data:") for a in attachments):
+        return body
+    os.makedirs(spool_dir, exist_ok=True)
+    _prune_spool(spool_dir)
+    total = 0
+    for i, a in enumerate(attachments):
+        url = a.get("url") or ""
+        if not url.startswith("data:"):
+            continue
+        fd, tmp = tempfile.mkstemp(dir=spool_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                mime, size, digest = _decode_into(url, f, ATTACHMENT_MAX_BYTES)
+            total += size
+            if total > REQUEST_ATTACHMENTS_MAX_BYTES:
+                raise AttachmentTooLarge(f"attachments exceed {REQUEST_ATTACHMENTS_MAX_BYTES} bytes in total")
+            path = os.path.join(spool_dir, digest)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        attachments[i] = {"name": a.get("name"), "mime": mime, "size": size, "sha256": digest, "spool": path}
+    body["attachments"] = attachments
+    return body
+
+
+class _Fetcher:
+    """Download http(s) attachments into the spool with bounded parallelism.
+
+    Bodies are streamed to disk and hashed on the way, capped at
+    ATTACHMENT_MAX_BYTES, and stored under their sha256 like decoded data:
+    attachments. A small index (spool/urls/<sha256 of url>.json) maps each
+    URL to its blob, so an asset referenced by several tasks or rounds is
+    downloaded once; after ATTACHMENT_FETCH_TTL it is revalidated with
+    If-None-Match rather than fetched again.
+    """
+
+    def __init__(self, spool_dir=ATTACHMENT_SPOOL_DIR, concurrency=ATTACHMENT_FETCH_CONCURRENCY,
+                 timeout=ATTACHMENT_FETCH_TIMEOUT, ttl=ATTACHMENT_FETCH_TTL, allow_private=ATTACHMENT_FETCH_ALLOW_PRIVATE):
+        self.spool_dir = spool_dir
+        self.ttl = ttl
+        self.allow_private = allow_private
+        self._http = HttpClient(pool_size=concurrency, timeout=timeout)
+        self._pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="attachment-fetch")
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def _index_path(self, url):
+        return os.path.join(self.spool_dir, "urls", hashlib.sha256(url.encode("utf-8")).hexdigest() + ".json")
+
+    def _read_index(self, url):
+        try:
+            with open(self._index_path(url), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(os.path.join(self.spool_dir, entry["sha256"])):
+            return None
+        return entry
+
+    def _write_index(self, url, entry):
+        path = self._index_path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp, path)
+
+    def _descriptor(self, name, entry):
+        path = os.path.join(self.spool_dir, entry["sha256"])
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return {"name": name, "mime": entry["mime"], "size": entry["size"], "sha256": entry["sha256"], "spool": path}
+
+    def _open(self, url, headers):
+        """Stream a GET of url, following redirects only to public addresses."""
+        for _ in range(_MAX_REDIRECTS + 1):
+            if not self.allow_private:
+                check_public_url(url)
+            r = self._http.get(url, headers=headers, stream=True, allow_redirects=False)
+            if not r.is_redirect:
+                return r
+            r.close()
+            url = urljoin(url, r.headers["Location"])
+        raise AttachmentError(f"too many redirects fetching attachment from {url!r}")
+
+    def fetch(self, name, url):
+        """Return a spool descriptor for url, downloading it only if it is not cached."""
+        entry = self._read_index(url)
+        if entry and time.time() - entry["fetched_at"] < self.ttl:
+            return self._descriptor(name, entry)
+
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        os.makedirs(self.spool_dir, exist_ok=True)
+        with self._open(url, headers) as r:
+            if r.status_code == 304 and entry:
+                entry["fetched_at"] = time.time()
+                self._write_index(url, entry)
+                return self._descriptor(name, entry)
+            r.raise_for_status()
+            length = r.headers.get("Content-Length")
+            if length and length.isdigit() and int(length) > ATTACHMENT_MAX_BYTES:
+                raise AttachmentTooLarge(f"attachment {name!r} exceeds {ATTACHMENT_MAX_BYTES} bytes")
+            h = hashlib.sha256()
+            size = 0
+            fd, tmp = tempfile.mkstemp(dir=self.spool_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    for data in r.iter_content(_CHUNK):
+                        size += len(data)
+                        if size > ATTACHMENT_MAX_BYTES:
+                            raise AttachmentTooLarge(f"attachment {name!r} exceeds {ATTACHMENT_MAX_BYTES} bytes")
+                        h.update(data)
+                        f.write(data)
+                digest = h.hexdigest()
+                os.replace(tmp, os.path.join(self.spool_dir, digest))
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+            mime = (r.headers.get("Content-Type") or "application/octet-stream").split(";")[0].strip()
+            entry = {"sha256": digest, "size": size, "mime": mime,
+                     "etag": r.headers.get("ETag"), "fetched_at": time.time()}
+        self._write_index(url, entry)
+        return self._descriptor(name, entry)
+
+    def _fetch_shared(self, name, url):
+        # concurrent builds asking for the same URL share one download
+        with self._lock:
+            fut = self._flights.get(url)
+            created = fut is None
+            if created:
+                fut = self._flights[url] = self._pool.submit(self.fetch, name, url)
+        if created:
+            # outside the lock: a future that has already finished runs the callback inline
+            fut.add_done_callback(lambda f: self._forget(url, f))
+        return fut
+
+    def _forget(self, url, fut):
+        with self._lock:
+            if self._flights.get(url) is fut:
+                del self._flights[url]
+
+    def fetch_all(self, attachments):
+        """Start downloading every http(s) attachment and return {index: Future of descriptor}."""
+        futures = {}
+        for i, a in enumerate(attachments or []):
+            url = a.get("url") or ""
+            if a.get("name") and url.startswith(("http://", "https://")):
+                futures[i] = self._fetch_shared(a["name"], url)
+        return futures
+
+
+fetcher = _Fetcher()
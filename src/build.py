@@ -0,0 +1,450 @@
+"""Build core shared by the Flask and FastAPI front ends.
+
+Queueing, the build itself, status records and evaluator notifications live
+here, apart from any web framework, so importing this module is cheap and
+makes no network calls. The GitHub token is checked by warm_up(), which the
+front ends run in the background at startup and report on /health.
+"""
+import os
+import sys
+import time
+import uuid
+import logging
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from . import llm_generator
+from .generator import generate_app
+from .github_helper import create_repo_from_dir
+from .notifier import NotificationDispatcher
+from .github_helper import checkout_repo, commit_and_push, get_authenticated_user, get_target_owner
+from .github_helper import DEPLOY_MODE, update_repo_via_api, pages_url_for
+from .github_scheduler import priority, INTERACTIVE, NORMAL, BULK
+from .jobs import QueueFull
+from .admission import admission as ADMISSION
+from .job_store import open_queue
+from .result_store import open_store, RETRYABLE_STATUSES, BUILD_STATUSES, TERMINAL_STATUSES
+from .attachments import ingest, fetcher, AttachmentError, AttachmentTooLarge
+from .pages_watcher import watcher as PAGES_WATCHER, PAGES_TIMEOUT_SECONDS
+from .progress import broker as PROGRESS
+from .metrics import registry as METRICS, stage, failed_stage, BUILDS, BUILD_FAILURES
+
+logger = logging.getLogger(__name__)
+
+# Optional startup check: if set to true, require a valid GitHub token at startup
+REQUIRE_GITHUB_TOKEN_ON_STARTUP = os.environ.get("REQUIRE_GITHUB_TOKEN_ON_STARTUP", "false").lower() in ("1", "true", "yes")
+
+SHARED_SECRET = os.environ.get("secret")
+
+REQUIRED_FIELDS = ("email", "secret", "task", "round", "nonce", "brief", "evaluation_url")
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", "100"))
+# LLM calls a batch runs ahead of its builds, in submission order
+BATCH_PREFETCH_CONCURRENCY = int(os.environ.get("BATCH_PREFETCH_CONCURRENCY", "8"))
+
+# Outcome of warm_up(), reported by /health; "pending" until the check finishes
+WARMUP = {"status": "pending", "github_user": None, "error": None, "seconds": None}
+
+
+def warm_up():
+    """Validate the GitHub token (and prime the login cache) once at startup.
+
+    Updates and returns WARMUP. With REQUIRE_GITHUB_TOKEN_ON_STARTUP the front
+    ends wait for this and refuse to start on failure; otherwise it runs in
+    the background so a slow GitHub API never delays a cold start.
+    """
+    started = time.perf_counter()
+    try:
+        user = get_authenticated_user()
+        WARMUP.update(status="ok", github_user=user, error=None)
+        print(f"GitHub token validated for user: {user}")
+    except Exception as e:
+        WARMUP.update(status="failed", github_user=None, error=str(e))
+        if not REQUIRE_GITHUB_TOKEN_ON_STARTUP:
+            print("GitHub token not validated at startup (set REQUIRE_GITHUB_TOKEN_ON_STARTUP=1 to fail fast)")
+    WARMUP["seconds"] = round(time.perf_counter() - started, 3)
+    return WARMUP
+
+
+def start_warm_up():
+    """Run warm_up for a threaded front end: inline when the token is required, else in a daemon thread."""
+    if REQUIRE_GITHUB_TOKEN_ON_STARTUP:
+        if warm_up()["status"] != "ok":
+            print("GITHUB token validation failed at startup:", WARMUP["error"])
+            sys.exit(1)
+        return
+    t = threading.Thread(target=warm_up, name="warm-up")
+    t.daemon = True
+    t.start()
+
+
+# Shared worker pool for builds; Flask (and FastAPI with ASYNC_PIPELINE=false) submit here.
+# With BUILD_QUEUE_BACKEND=sqlite this is the shared job table served by `python -m src.worker`
+BUILD_QUEUE = open_queue()
+METRICS.gauge("llm_deploy_build_queue_depth", "Builds waiting for a worker.",
+              function=lambda: BUILD_QUEUE.stats()["queued"])
+METRICS.gauge("llm_deploy_builds_in_flight", "Builds currently running on a worker.",
+              function=lambda: BUILD_QUEUE.stats()["running"])
+
+
+def lane_for(body, waiting=None):
+    """Return the queue lane for body (see jobs.LANES).
+
+    `waiting` says whether the caller holds the connection open for the
+    result; it defaults to the request's wait_for_result.
+    """
+    if body.get("wait_for_result") if waiting is None else waiting:
+        return "interactive"
+    if int(body.get("round") or 1) > 1:
+        return "revision"
+    return "bulk"
+
+
+# GitHub calls made by a build are scheduled by its lane
+_GITHUB_PRIORITY = {"interactive": INTERACTIVE, "revision": NORMAL, "bulk": BULK}
+
+
+def github_priority(body):
+    return priority(_GITHUB_PRIORITY[lane_for(body)])
+
+
+def submit_build(body, queue=None, target=None, lane=None):
+    """Queue a build for body, or attach to the one already handling the same request.
+
+    Requests are identified by (email, task, round, nonce), so evaluator retries
+    do not start a second build. Returns (job, record, created): job is the
+    queued or running Job, or None when the request already finished (possibly
+    in another process), in which case record is its stored status. A record
+    still in a build status with no job behind it was orphaned by a restart
+    and is built again. A queued earlier round of the same task is superseded by a later one. New requests
+    must pass the submitter's admission limits and are queued in `lane`
+    (default lane_for(body)).
+    `queue` and `target` default to BUILD_QUEUE and handle_build.
+    Raises QueueFull (SubmitterLimited when only this submitter is refused).
+    """
+    queue = queue or BUILD_QUEUE
+    target = target or handle_build
+    email, task, nonce, round_num = body["email"], body["task"], str(body["nonce"]), int(body["round"])
+    key = (email, task, round_num, nonce)
+    job = queue.find(key)
+    if job is not None:
+        return job, None, False
+    rec = RESULT_STORE.get(email, task, nonce)
+    # no job was found above, so a record in a build status has nothing behind it
+    if rec and rec["round"] is not None and int(rec["round"]) == round_num \
+            and rec["status"] not in RETRYABLE_STATUSES + BUILD_STATUSES:
+        return None, rec, False
+
+    # a refusal (QueueFull) is a 429 for a build that never started, so nothing is recorded
+    job, created = ADMISSION.submit(email, queue, key, target, body, group=(email, task), order=round_num,
+                                    lane=lane or lane_for(body),
+                                    # only for a new job, and before a fast worker can record "generating"
+                                    on_created=lambda: record_status(body, "queued"))
+    for old in job.superseded:
+        record_status(old.args[0], "superseded", error=f"superseded by round {round_num}")
+    return job, None, created
+
+
+def accepted_response(job, rec, created, queue=None):
+    """Response body for an accepted (or de-duplicated) submission."""
+    queue = queue or BUILD_QUEUE
+    if job is None:
+        resp = {"status": "accepted", "duplicate": True, "build_status": rec["status"]}
+        if rec["result"]:
+            resp["result"] = rec["result"]
+        return resp
+    resp = {"status": "accepted", "job_id": job.id,
+            "position": queue.position(job), "queue_depth": queue.stats()["queued"]}
+    if not created:
+        resp["duplicate"] = True
+    return resp
+
+
+def submit_batch(bodies, queue=None, target=None):
+    """Queue each request in bodies as its own build and pipeline their generation.
+
+    Every item is validated, de-duplicated and queued exactly like a single
+    /api-endpoint request, so it gets its own job id and /result record, and a
+    bad item does not reject the others. The LLM calls and attachment
+    downloads of the accepted items are then started in order on a shared
+    prefetch pool, so item k+1 generates while item k is being pushed rather
+    than when a worker frees up; the builds pick the files up from the LLM
+    cache. The token owner is resolved once for the whole batch.
+
+    Returns (batch_id, items): items[i] is the accepted_response for
+    bodies[i], or {"error": ..., "status_code": ...} if it was rejected.
+    """
+    batch_id = uuid.uuid4().hex
+    items, members, accepted = [], [], []
+    for i, body in enumerate(bodies):
+        fields = body if isinstance(body, dict) else {}
+        member = {"index": i, "email": fields.get("email"), "task": fields.get("task"),
+                  "nonce": None if fields.get("nonce") is None else str(fields["nonce"]),
+                  "round": fields.get("round")}
+        try:
+            _check_request(body)
+            # nobody waits on a batch item, whatever its wait_for_result says
+            job, rec, created = submit_build(body, queue, target, lane=lane_for(body, waiting=False))
+        except _Rejected as e:
+            item = {"error": e.error, "status_code": e.status_code}
+        except QueueFull as e:
+            item = {"error": str(e), "status_code": 429, "retry_after": e.retry_after}
+        else:
+            item = accepted_response(job, rec, created, queue)
+            if created:
+                accepted.append(body)
+        if "error" in item:
+            member["error"] = item["error"]
+        items.append(dict(item, index=i, task=member["task"], nonce=member["nonce"]))
+        members.append(member)
+    RESULT_STORE.put_batch(batch_id, members)
+    _prefetch(accepted)
+    return batch_id, items
+
+
+class _Rejected(Exception):
+    def __init__(self, status_code, error):
+        super().__init__(error)
+        self.status_code = status_code
+        self.error = error
+
+
+def _check_request(body):
+    """Validate one request like /api-endpoint does and spool its data: attachments."""
+    if not isinstance(body, dict):
+        raise _Rejected(400, "request must be a JSON object")
+    for k in REQUIRED_FIELDS:
+        if body.get(k) is None:
+            raise _Rejected(400, f"missing {k}")
+    if SHARED_SECRET and body.get("secret") != SHARED_SECRET:
+        raise _Rejected(403, "invalid secret")
+    try:
+        ingest(body)
+    except AttachmentTooLarge as e:
+        raise _Rejected(413, str(e))
+    except AttachmentError as e:
+        raise _Rejected(400, str(e))
+
+
+_prefetch_pool = None
+_prefetch_lock = threading.Lock()
+
+
+def _prefetch(bodies):
+    global _prefetch_pool
+    if not bodies:
+        return
+    with _prefetch_lock:
+        if _prefetch_pool is None:
+            _prefetch_pool = ThreadPoolExecutor(max_workers=max(1, BATCH_PREFETCH_CONCURRENCY),
+                                                thread_name_prefix="batch-prefetch")
+    _prefetch_pool.submit(_quietly, get_target_owner)
+    for body in bodies:
+        _prefetch_pool.submit(_quietly, _prefetch_one, body)
+
+
+def _prefetch_one(body):
+    attachments = body.get("attachments", [])
+    fetcher.fetch_all(attachments)
+    if llm_generator.OPENAI_API_KEY:
+        # same call (and cache key) generate_app makes; the build joins it if still running
+        llm_generator.generate_with_openai(body.get("brief", ""), attachments)
+
+
+def _quietly(fn, *args):
+    # prefetching is best effort: the build repeats anything that failed here
+    try:
+        fn(*args)
+    except Exception:
+        logger.debug("batch prefetch failed", exc_info=True)
+
+
+def get_batch_status(batch_id):
+    """Return per-item and aggregate status for a batch, or None if it is unknown (or expired)."""
+    members = RESULT_STORE.get_batch(batch_id)
+    if members is None:
+        return None
+    items, counts = [], {}
+    for m in members:
+        if m.get("error"):
+            res = {"status": "rejected", "error": m["error"]}
+        else:
+            res = get_result(m["email"], m["task"], m["nonce"]) or {"status": "pending"}
+        counts[res["status"]] = counts.get(res["status"], 0) + 1
+        items.append(dict(res, index=m["index"], task=m["task"], nonce=m["nonce"]))
+    done = all(item["status"] in TERMINAL_STATUSES + ("rejected",) for item in items)
+    return {"batch_id": batch_id, "total": len(items), "done": done, "counts": counts, "items": items}
+
+
+# Build status and evaluator payloads, keyed by (email, task, nonce)
+RESULT_STORE = open_store()
+
+
+def record_status(body, status, result=None, error=None):
+    try:
+        rec = RESULT_STORE.set_status(body["email"], body["task"], str(body["nonce"]), status,
+                                      round=body.get("round"), result=result, error=error)
+        # wake SSE / long-poll clients waiting on this email/task
+        PROGRESS.publish(body["email"], body["task"], rec)
+    except Exception:
+        logger.exception("could not record build status")
+
+
+def _on_notified(meta, delivered, error):
+    if delivered:
+        record_status(meta, "notified")
+    else:
+        record_status(meta, "failed", error=f"notification failed: {error}")
+
+
+def _wait_live(meta, pages_url, deadline):
+    def on_pages(live):
+        if live:
+            record_status(meta, "pages-live")
+
+    return PAGES_WATCHER.watch(pages_url, on_pages, deadline=deadline)
+
+
+# Evaluation callbacks are delivered from a durable outbox on a single asyncio loop
+NOTIFIER = NotificationDispatcher(on_result=_on_notified, wait_live=_wait_live)
+METRICS.gauge("llm_deploy_notifications_pending", "Evaluation callbacks waiting in the outbox.",
+              function=NOTIFIER.pending)
+METRICS.gauge("llm_deploy_pages_pending", "Deployments waiting for their Pages site to go live.",
+              function=PAGES_WATCHER.pending)
+
+
+def notify_and_record(body, eval_payload, wait_for=None):
+    """Queue the evaluation callback; its outcome is recorded in RESULT_STORE."""
+    meta = {k: body.get(k) for k in ("email", "task", "round", "nonce")}
+    NOTIFIER.enqueue(body["evaluation_url"], eval_payload, meta=meta,
+                     wait_for=wait_for, wait_seconds=PAGES_TIMEOUT_SECONDS)
+
+
+def notify_when_live(body, eval_payload):
+    """Queue the evaluation callback to be sent once the Pages site is live.
+
+    The callback is written to the outbox now, so a restart during the Pages
+    wait resumes it. The evaluator is still notified if Pages does not come up
+    before PAGES_TIMEOUT_SECONDS.
+    """
+    notify_and_record(body, eval_payload, wait_for=eval_payload["pages_url"])
+
+
+def handle_build(body):
+    # Delegate to build_repo_payload; the worker is released as soon as the push lands.
+    # Failures are logged by the worker pool and recorded by build_repo_payload.
+    # A caller waiting on the response gets its GitHub calls scheduled first.
+    with github_priority(body):
+        payload, eval_payload = build_repo_payload(body)
+    notify_when_live(body, eval_payload)
+    return payload, eval_payload
+
+
+def build_repo_payload(body):
+    """Build the repo (create or update) and return the evaluation payload dict.
+
+    This function performs the same operations as the previous handle_build but returns
+    the payload instead of notifying. It does not block on notification.
+    """
+    BUILDS.inc(round=body.get("round", 1))
+    try:
+        with stage("build"):
+            return _build_repo_payload(body)
+    except Exception as e:
+        BUILD_FAILURES.inc(stage=failed_stage(e))
+        record_status(body, "failed", error=str(e))
+        raise
+
+
+def _build_repo_payload(body):
+    record_status(body, "generating")
+    # Create temp dir for repo source
+    with tempfile.TemporaryDirectory() as tmpdir:
+        task_name = body["task"]
+        round_num = int(body.get("round", 1))
+
+        if round_num == 1:
+            # Generate app into tmpdir
+            with stage("generate"):
+                generate_app(body, tmpdir)
+            record_status(body, "pushing")
+
+            # Create github repo and push
+            with stage("publish"):
+                repo_url, commit_sha, pages_url = create_repo_from_dir(tmpdir, task_name, wait_for_pages=False)
+        else:
+            # Round 2: attempt to update existing repo
+            owner = get_target_owner()
+            repo_name = task_name.replace(' ', '-').lower()
+            try:
+                if DEPLOY_MODE == "api":
+                    # no clone needed: commit the regenerated files on top of the existing tree
+                    with stage("generate"):
+                        generate_app(body, tmpdir)
+                    record_status(body, "pushing")
+                    with stage("publish"):
+                        commit_sha = update_repo_via_api(tmpdir, owner, repo_name, message=f"Round {round_num} update")
+                else:
+                    # check out from the local mirror cache (incremental fetch, per-repo lock)
+                    with checkout_repo(owner, repo_name) as workdir:
+                        # regenerate (this will overwrite files)
+                        with stage("generate"):
+                            generate_app(body, workdir)
+                        record_status(body, "pushing")
+                        # commit and push
+                        with stage("publish"):
+                            commit_and_push(workdir, message=f"Round {round_num} update")
+                        # get new sha
+                        commit_sha = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=workdir).decode().strip()
+                repo_url = f"https://github.com/{owner}/{repo_name}"
+                pages_url = pages_url_for(owner, repo_name)
+            except Exception:
+                # fallback: create a new repo if update failed
+                with stage("generate"):
+                    generate_app(body, tmpdir)
+                record_status(body, "pushing")
+                with stage("publish"):
+                    repo_url, commit_sha, pages_url = create_repo_from_dir(tmpdir, task_name, wait_for_pages=False)
+
+        payload = {
+            "email": body["email"],
+            "task": body["task"],
+            "round": body["round"],
+            "nonce": body["nonce"],
+            "repo_url": repo_url,
+            "commit_sha": commit_sha,
+            "pages_url": pages_url,
+        }
+
+        # evaluator-style payload (what graders expect)
+        eval_payload = {
+            "commit_sha": commit_sha,
+            "message": "App built and deployed successfully",
+            "pages_url": pages_url,
+            "repo_url": repo_url,
+            "round": body["round"],
+            "task": body["task"],
+        }
+
+        # store result so UI can poll for it (store evaluator payload)
+        record_status(body, "pages-pending", result=eval_payload)
+        return payload, eval_payload
+
+
+def get_result(email, task, nonce=None):
+    """Return stored payload for the given identifiers or None.
+
+    While a build is still running (or if it failed) the build status is returned
+    instead, e.g. {"status": "generating"}.
+    """
+    if nonce:
+        rec = RESULT_STORE.get(email, task, nonce)
+    else:
+        # if nonce not provided, use the most recent build for task/email
+        rec = RESULT_STORE.latest(email, task)
+    if not rec:
+        return None
+    res = dict(rec["result"] or {}, status=rec["status"])
+    if rec["error"]:
+        res["error"] = rec["error"]
+    return res
@@ -1,100 +1,262 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse
-from fastapi.staticfiles import StaticFiles
-from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Any
-import threading
-from src import server
-
-app = FastAPI()
-
-# Mount the static directory so the UI is available when running under uvicorn
-BASE_DIR = Path(__file__).resolve().parent.parent
-STATIC_DIR = BASE_DIR / "static"
-app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
-
-
-@app.get("/", include_in_schema=False)
-async def root():
-    # Serve the static single-page app index
-    return FileResponse(str(STATIC_DIR / "index.html"))
-
-
-from fastapi.responses import JSONResponse, HTMLResponse
-
-
-@app.get("/health")
-async def health():
-    status = {"ok": True}
-    # check github token presence/validity
-    try:
-        user = server.get_authenticated_user()
-        status["github_user"] = user
-        status["github_token_valid"] = True
-    except Exception:
-        status["github_token_valid"] = False
-    return JSONResponse(status)
-
-
-class Attachment(BaseModel):
-    name: str
-    url: str
-
-
-class TaskRequest(BaseModel):
-    email: str = Field(..., example="student@example.com")
-    secret: str = Field(..., example="mysharedsecret")
-    task: str = Field(..., example="demo-task")
-    round: int = Field(..., example=1)
-    nonce: str = Field(..., example="n1")
-    brief: str = Field(..., example="Create a single page showing Hello")
-    checks: List[Any] = Field(default_factory=list)
-    evaluation_url: str = Field(..., example="http://127.0.0.1:9000/eval")
-    attachments: List[Attachment] = Field(default_factory=list)
-    wait_for_result: bool = Field(False, example=False)
-
-
-@app.post("/api-endpoint")
-async def api_endpoint(body: TaskRequest):
-    data = body.dict()
-
-    # Basic validation copied from Flask server (Pydantic ensures types)
-    required = ["email", "secret", "task", "round", "nonce", "brief", "evaluation_url"]
-    for k in required:
-        if k not in data or data.get(k) is None:
-            raise HTTPException(status_code=400, detail={"error": f"missing {k}"})
-
-    if server.SHARED_SECRET and data.get("secret") != server.SHARED_SECRET:
-        raise HTTPException(status_code=403, detail={"error": "invalid secret"})
-
-    # If caller requested synchronous result, run build and return evaluator payload
-    if data.get("wait_for_result"):
-        try:
-            payload, eval_payload = server.build_repo_payload(data)
-            # kick off notifier in background but don't wait for it here
-            notify_thread = threading.Thread(target=server.notify_evaluation, args=(data["evaluation_url"], eval_payload))
-            notify_thread.daemon = True
-            notify_thread.start()
-            return eval_payload
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
-
-    # start background work using the same handler
-    thread = threading.Thread(target=server.handle_build, args=(data,))
-    thread.daemon = True
-    thread.start()
-
-    return {"status": "accepted"}
-
-
-@app.get("/result")
-async def get_result(email: str, task: str, nonce: str = None):
-    """Query the server for the build result matching email/task[/nonce]."""
-    try:
-        res = server.get_result(email, task, nonce)
-        if not res:
-            return {"status": "pending"}
-        return res
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import FileResponse, JSONResponse
+from fastapi.staticfiles import StaticFiles
+from pathlib import Path
+from pydantic import BaseModel, Field
+from typing import List, Any
+import asyncio
+import hashlib
+import os
+import json
+import time
+from src import build, llm_generator
+from src.jobs import QueueFull, AsyncBuildQueue
+from src.job_store import BUILD_QUEUE_BACKEND
+from src.progress import broker as PROGRESS
+from src.result_store import TERMINAL_STATUSES
+from src.metrics import registry as METRICS, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from src.attachments import ingest, AttachmentError, AttachmentTooLarge, MAX_REQUEST_BODY_BYTES
+
+LONG_POLL_MAX_SECONDS = 60
+SSE_KEEPALIVE_SECONDS = 15
+# run builds on the native asyncio pipeline instead of the threaded worker pool
+# (ignored with BUILD_QUEUE_BACKEND=sqlite, where `python -m src.worker` runs them)
+ASYNC_PIPELINE = os.environ.get("ASYNC_PIPELINE", "true").lower() in ("1", "true", "yes")
+
+if ASYNC_PIPELINE and BUILD_QUEUE_BACKEND != "sqlite":
+    from src import async_build
+    BUILD_QUEUE = AsyncBuildQueue()
+    BUILD_TARGET = async_build.handle_build
+    # point the queue gauges registered by src.build at this queue
+    METRICS.gauge("llm_deploy_build_queue_depth", "Builds waiting for a worker.",
+                  function=lambda: BUILD_QUEUE.stats()["queued"])
+    METRICS.gauge("llm_deploy_builds_in_flight", "Builds currently running on a worker.",
+                  function=lambda: BUILD_QUEUE.stats()["running"])
+else:
+    BUILD_QUEUE = build.BUILD_QUEUE
+    BUILD_TARGET = build.handle_build
+
+app = FastAPI()
+
+# Mount the static directory so the UI is available when running under uvicorn
+BASE_DIR = Path(__file__).resolve().parent.parent
+STATIC_DIR = BASE_DIR / "static"
+app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
+
+
+@app.on_event("startup")
+async def startup():
+    # resume notifications left in the outbox by a previous process
+    build.NOTIFIER.start()
+    warm_up = asyncio.to_thread(build.warm_up)
+    if build.REQUIRE_GITHUB_TOKEN_ON_STARTUP:
+        if (await warm_up)["status"] != "ok":
+            raise RuntimeError(f"GITHUB token validation failed at startup: {build.WARMUP['error']}")
+    else:
+        # validate the token in the background; /health reports the outcome
+        app.state.warm_up = asyncio.ensure_future(warm_up)
+
+
+@app.middleware("http")
+async def limit_body_size(request, call_next):
+    # reject oversized bodies from Content-Length, before they are read and parsed
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > MAX_REQUEST_BODY_BYTES:
+        return JSONResponse({"error": "request body too large"}, status_code=413)
+    return await call_next(request)
+
+
+@app.get("/", include_in_schema=False)
+async def root():
+    # Serve the static single-page app index
+    return FileResponse(str(STATIC_DIR / "index.html"))
+
+
+from fastapi.responses import Response, StreamingResponse
+from fastapi import Request
+
+
+@app.get("/health")
+async def health():
+    status = {"ok": True, "warmup": build.WARMUP["status"]}
+    # check github token presence/validity once the startup warm-up has finished
+    if build.WARMUP["status"] != "pending":
+        try:
+            user = await asyncio.to_thread(build.get_authenticated_user)
+            status["github_user"] = user
+            status["github_token_valid"] = True
+        except Exception:
+            status["github_token_valid"] = False
+    status["llm_cache"] = llm_generator.cache_stats()
+    return JSONResponse(status)
+
+
+class Attachment(BaseModel):
+    name: str
+    url: str
+
+
+class TaskRequest(BaseModel):
+    email: str = Field(..., example="student@example.com")
+    secret: str = Field(..., example="mysharedsecret")
+    task: str = Field(..., example="demo-task")
+    round: int = Field(..., example=1)
+    nonce: str = Field(..., example="n1")
+    brief: str = Field(..., example="Create a single page showing Hello")
+    checks: List[Any] = Field(default_factory=list)
+    evaluation_url: str = Field(..., example="http://127.0.0.1:9000/eval")
+    attachments: List[Attachment] = Field(default_factory=list)
+    wait_for_result: bool = Field(False, example=False)
+
+
+class BatchRequest(BaseModel):
+    requests: List[TaskRequest]
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(METRICS.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+@app.post("/api-endpoint")
+async def api_endpoint(body: TaskRequest):
+    data = body.dict()
+
+    # Basic validation copied from Flask server (Pydantic ensures types)
+    required = ["email", "secret", "task", "round", "nonce", "brief", "evaluation_url"]
+    for k in required:
+        if k not in data or data.get(k) is None:
+            raise HTTPException(status_code=400, detail={"error": f"missing {k}"})
+
+    if build.SHARED_SECRET and data.get("secret") != build.SHARED_SECRET:
+        raise HTTPException(status_code=403, detail={"error": "invalid secret"})
+
+    # decode data: attachments to spool files off the event loop, before queueing
+    try:
+        await asyncio.to_thread(ingest, data)
+    except AttachmentTooLarge as e:
+        raise HTTPException(status_code=413, detail={"error": str(e)})
+    except AttachmentError as e:
+        raise HTTPException(status_code=400, detail={"error": str(e)})
+
+    # queue on the shared worker pool, or attach to an identical in-flight/finished request
+    # (the de-duplication lookup and the queue may be SQLite, so this runs in a thread)
+    try:
+        job, rec, created = await asyncio.to_thread(build.submit_build, data, BUILD_QUEUE, BUILD_TARGET)
+    except QueueFull as e:
+        return _queue_full_response(e)
+
+    # If caller requested synchronous result, wait for the build and return evaluator payload
+    if data.get("wait_for_result"):
+        if job is None:
+            if rec["result"]:
+                return rec["result"]
+            return JSONResponse(build.accepted_response(job, rec, created, BUILD_QUEUE), status_code=202)
+        try:
+            # shield: a disconnecting client must not cancel a job other requests may share
+            payload, eval_payload = await asyncio.shield(asyncio.wrap_future(job))
+            return eval_payload
+        except asyncio.CancelledError:
+            if not job.cancelled():
+                raise
+            raise HTTPException(status_code=409, detail="superseded by a later round")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    return build.accepted_response(job, rec, created, BUILD_QUEUE)
+
+
+@app.post("/api-endpoint/batch")
+async def batch_endpoint(body: BatchRequest):
+    """Queue a list of task requests at once; each item gets its own job id (see build.submit_batch)."""
+    if not body.requests:
+        raise HTTPException(status_code=400, detail={"error": "requests must be a non-empty list"})
+    if len(body.requests) > build.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail={"error": f"at most {build.BATCH_MAX_ITEMS} requests per batch"})
+    data = [r.dict() for r in body.requests]
+    # validation spools data: attachments to disk; keep it off the event loop
+    batch_id, items = await asyncio.to_thread(build.submit_batch, data, BUILD_QUEUE, BUILD_TARGET)
+    return {"batch_id": batch_id, "items": items}
+
+
+@app.get("/batch/{batch_id}")
+async def batch_status(batch_id: str):
+    status = await asyncio.to_thread(build.get_batch_status, batch_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail={"error": "unknown batch"})
+    return status
+
+
+def _queue_full_response(e):
+    return JSONResponse(
+        {"error": str(e), "retry_after": e.retry_after},
+        status_code=429,
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+async def _current_result(email, task, nonce):
+    # the result store is synchronous SQLite; read it off the event loop
+    res = await asyncio.to_thread(build.get_result, email, task, nonce)
+    return res or {"status": "pending"}
+
+
+def _etag(res):
+    return '"' + hashlib.sha1(json.dumps(res, sort_keys=True).encode()).hexdigest() + '"'
+
+
+@app.get("/result")
+async def get_result(request: Request, email: str, task: str, nonce: str = None, wait: float = 0):
+    """Query the server for the build result matching email/task[/nonce].
+
+    With `wait` and an If-None-Match header matching the current ETag, the
+    request is held (up to `wait` seconds, capped at 60) until the status changes.
+    """
+    try:
+        res = await _current_result(email, task, nonce)
+        etag = _etag(res)
+        if wait > 0 and request.headers.get("if-none-match") == etag:
+            q = PROGRESS.subscribe(email, task)
+            try:
+                deadline = time.monotonic() + min(wait, LONG_POLL_MAX_SECONDS)
+                while etag == request.headers.get("if-none-match"):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return Response(status_code=304, headers={"ETag": etag})
+                    try:
+                        await asyncio.wait_for(q.get(), timeout=remaining)
+                    except asyncio.TimeoutError:
+                        pass
+                    res = await _current_result(email, task, nonce)
+                    etag = _etag(res)
+            finally:
+                PROGRESS.unsubscribe(email, task, q)
+        return JSONResponse(res, headers={"ETag": etag})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/events")
+async def events(email: str, task: str, nonce: str = None):
+    """Stream build stage transitions for email/task[/nonce] as server-sent events."""
+    async def stream():
+        q = PROGRESS.subscribe(email, task)
+        last = None
+        try:
+            while True:
+                res = await _current_result(email, task, nonce)
+                if res != last:
+                    yield f"event: status\ndata: {json.dumps(res)}\n\n"
+                    last = res
+                    if res.get("status") in TERMINAL_STATUSES:
+                        return
+                try:
+                    await asyncio.wait_for(q.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # comment line keeps proxies from closing an idle stream
+                    yield ": keep-alive\n\n"
+        finally:
+            PROGRESS.unsubscribe(email, task, q)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
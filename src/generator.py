@@ -1,133 +1,249 @@
-import os
-import base64
-from datetime import datetime
-import json
-
-from . import llm_generator
-
-
-def generate_app(request_json, out_dir):
-    """Generate a minimal static app based on brief and attachments.
-
-    This is a simple placeholder generator. Replace with LLM-driven generation
-    as needed. Creates an index.html, README.md, LICENSE, and assets.
-    Returns the path where files were written.
-    """
-    brief = request_json.get("brief", "")
-    attachments = request_json.get("attachments", [])
-
-    # If OPENAI_API_KEY present, ask LLM to generate files; otherwise use placeholder
-    try:
-        files = llm_generator.generate_with_openai(brief, attachments) if llm_generator.OPENAI_API_KEY else None
-    except Exception:
-        files = None
-
-    os.makedirs(out_dir, exist_ok=True)
-
-    if files:
-        # files should be dict filename -> content
-        for name, content in files.items():
-            path = os.path.join(out_dir, name)
-            d = os.path.dirname(path)
-            if d:
-                os.makedirs(d, exist_ok=True)
-            # write as text
-            with open(path, 'w', encoding='utf-8') as f:
-                f.write(content)
-    else:
-        # Write index.html that renders the brief and any ?url param
-        index_html_template = """
-<!doctype html>
-<html>
-<head>
-    <meta charset="utf-8" />
-    <meta name="viewport" content="width=device-width,initial-scale=1" />
-    <title>Student App</title>
-    <style>body{font-family:sans-serif;padding:1rem}#output{white-space:pre-wrap}</style>
-</head>
-<body>
-    <h1>Student App</h1>
-    <p id="brief">{BRIEF}</p>
-    <div id="output">Loading...</div>
-
-    <script>
-    function getParam(name){const u=new URL(location.href);return u.searchParams.get(name)}
-    const url = getParam('url');
-    const out = document.getElementById('output');
-    if(url){
-        out.textContent = 'Provided URL: ' + url;
-        // try to show image if possible
-        const img = document.createElement('img'); img.src = url; img.style.maxWidth='90%'; img.alt='provided';
-        out.innerHTML=''; out.appendChild(img);
-    } else {
-        out.textContent = 'No URL provided — using attachment if present.';
-    }
-    </script>
-</body>
-</html>
-"""
-
-        index_html = index_html_template.replace('{BRIEF}', brief)
-        with open(os.path.join(out_dir, "index.html"), "w", encoding="utf-8") as f:
-            f.write(index_html)
-
-    # Save attachments to assets/
-    assets_dir = os.path.join(out_dir, "assets")
-    os.makedirs(assets_dir, exist_ok=True)
-    for a in attachments:
-        name = a.get("name")
-        url = a.get("url")
-        if not name or not url:
-            continue
-        if url.startswith("data:"):
-            # data URI
-            comma = url.find(',')
-            data = url[comma+1:]
-            try:
-                b = base64.b64decode(data)
-            except Exception:
-                b = data.encode('utf-8')
-            with open(os.path.join(assets_dir, name), "wb") as af:
-                af.write(b)
-
-    # README
-    readme = f"""
-# Student-generated app
-
-Generated from brief:
-
-```
-{brief}
-```
-
-Generated at {datetime.utcnow().isoformat()} UTC.
-
-License: MIT
-"""
-    with open(os.path.join(out_dir, "README.md"), "w", encoding="utf-8") as f:
-        f.write(readme)
-
-    # MIT LICENSE
-    mit = """MIT License
-
-Copyright (c) %d
-
-Permission is hereby granted, free of charge, to any person obtaining a copy
-of this software and associated documentation files (the "Software"), to deal
-in the Software without restriction, including without limitation the rights
-to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
-copies of the Software, and to permit persons to whom the Software is
-furnished to do so, subject to the following conditions:
-
-THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
-IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
-FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
-AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
-LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
-OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
-SOFTWARE.
-""" % (datetime.utcnow().year)
-    with open(os.path.join(out_dir, "LICENSE"), "w", encoding="utf-8") as f:
-        f.write(mit)
-
-    return out_dir
+import os
+import re
+import shutil
+import hashlib
+import logging
+import tempfile
+from datetime import datetime
+
+from . import llm_generator
+from .attachments import decode_data_uri_to_file, fetcher
+
+logger = logging.getLogger(__name__)
+
+
+def _file_sha256(path, size):
+    """Return the sha256 of the file at path, or None if it is missing or not size bytes long."""
+    try:
+        if os.path.getsize(path) != size:
+            return None
+        with open(path, 'rb') as f:
+            return hashlib.file_digest(f, 'sha256').hexdigest()
+    except OSError:
+        return None
+
+
+class _Writer:
+    """Write generated files into out_dir, skipping those already there with the same content.
+
+    manifest maps every generated path to the sha256 of its content; changed
+    lists the paths that were actually written. On a round-2 checkout this
+    leaves unchanged files untouched, so git sees only the real edits.
+
+    From checkpoint() until release() the writer keeps a copy of every file it
+    replaces, so rollback() can put out_dir back as it was.
+    """
+
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        self.manifest = {}
+        self.changed = []
+        self._saved = None  # name -> backup path (None if the file did not exist)
+        self._save_dir = None
+        self._before = None
+
+    def _target(self, name, digest, size):
+        self.manifest[name] = digest
+        path = os.path.join(self.out_dir, name)
+        if _file_sha256(path, size) == digest:
+            return None
+        if self._saved is not None and name not in self._saved:
+            backup = None
+            if os.path.exists(path):
+                backup = os.path.join(self._save_dir, str(len(self._saved)))
+                shutil.copyfile(path, backup)
+            self._saved[name] = backup
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self.changed.append(name)
+        return path
+
+    def checkpoint(self):
+        """Start recording what writes replace, for rollback()."""
+        self._saved = {}
+        self._save_dir = tempfile.mkdtemp(prefix="generate-")
+        self._before = (dict(self.manifest), len(self.changed))
+
+    def rollback(self):
+        """Undo every write since checkpoint(): replaced files are restored, new ones removed."""
+        for name, backup in self._saved.items():
+            path = os.path.join(self.out_dir, name)
+            if backup:
+                shutil.move(backup, path)
+            elif os.path.exists(path):
+                os.remove(path)
+        self.manifest, changed = self._before
+        del self.changed[changed:]
+        self.release()
+
+    def release(self):
+        """Keep the writes since checkpoint() and drop the copies."""
+        if self._save_dir:
+            shutil.rmtree(self._save_dir, ignore_errors=True)
+        self._saved = self._save_dir = None
+
+    def write(self, name, content):
+        data = content.encode('utf-8') if isinstance(content, str) else content
+        path = self._target(name, hashlib.sha256(data).hexdigest(), len(data))
+        if path:
+            with open(path, 'wb') as f:
+                f.write(data)
+
+    def copy(self, name, src, digest=None):
+        if digest is None:
+            digest = _file_sha256(src, os.path.getsize(src))
+        path = self._target(name, digest, os.path.getsize(src))
+        if path:
+            shutil.copyfile(src, path)
+
+
+def _keep_stable(out_dir, name, content, volatile):
+    """Return the existing file's text if it differs from content only in the volatile regex."""
+    try:
+        with open(os.path.join(out_dir, name), 'r', encoding='utf-8') as f:
+            old = f.read()
+    except OSError:
+        return content
+    if re.sub(volatile, '', old) == re.sub(volatile, '', content):
+        return old
+    return content
+
+
+def generate_app(request_json, out_dir, files=None):
+    """Generate a minimal static app based on brief and attachments.
+
+    This is a simple placeholder generator. Replace with LLM-driven generation
+    as needed. Creates an index.html, README.md, LICENSE, and assets.
+    Returns the path where files were written.
+
+    `files` ({filename: content}) skips the LLM call and writes those files
+    instead, for callers that generated them already (the async pipeline);
+    an empty dict gives the placeholder app.
+    """
+    brief = request_json.get("brief", "")
+    attachments = request_json.get("attachments", [])
+
+    os.makedirs(out_dir, exist_ok=True)
+    writer = _Writer(out_dir)
+    # download http(s) attachments while the LLM is generating
+    downloads = fetcher.fetch_all(attachments)
+
+    def write_file(name, content):
+        writer.write(name, content)
+
+    # If OPENAI_API_KEY present, ask LLM to generate files; otherwise use placeholder.
+    # Each file is written as soon as the LLM emits it (while it is still streaming).
+    if files is not None:
+        for name, content in files.items():
+            write_file(name, content)
+    elif llm_generator.OPENAI_API_KEY:
+        writer.checkpoint()
+        try:
+            files = llm_generator.generate_with_openai(brief, attachments, on_file=write_file)
+        except Exception:
+            # a stream that failed part-way may have written some files; don't mix them with the placeholder
+            logger.warning("LLM generation failed, using the placeholder app", exc_info=True)
+            writer.rollback()
+            files = None
+        else:
+            writer.release()
+
+    if not files:
+        # Write index.html that renders the brief and any ?url param
+        index_html_template = """
+<!doctype html>
+<html>
+<head>
+    <meta charset="utf-8" />
+    <meta name="viewport" content="width=device-width,initial-scale=1" />
+    <title>Student App</title>
+    <style>body{font-family:sans-serif;padding:1rem}#output{white-space:pre-wrap}</style>
+</head>
+<body>
+    <h1>Student App</h1>
+    <p id="brief">{BRIEF}</p>
+    <div id="output">Loading...</div>
+
+    <script>
+    function getParam(name){const u=new URL(location.href);return u.searchParams.get(name)}
+    const url = getParam('url');
+    const out = document.getElementById('output');
+    if(url){
+        out.textContent = 'Provided URL: ' + url;
+        // try to show image if possible
+        const img = document.createElement('img'); img.src = url; img.style.maxWidth='90%'; img.alt='provided';
+        out.innerHTML=''; out.appendChild(img);
+    } else {
+        out.textContent = 'No URL provided — using attachment if present.';
+    }
+    </script>
+</body>
+</html>
+"""
+
+        index_html = index_html_template.replace('{BRIEF}', brief)
+        writer.write("index.html", index_html)
+
+    # Save attachments to assets/
+    for a in attachments:
+        name = a.get("name")
+        if not name:
+            continue
+        if a.get("spool"):
+            # already decoded at ingestion time
+            writer.copy(f"assets/{name}", a["spool"], a.get("sha256"))
+        elif (a.get("url") or "").startswith("data:"):
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, name)
+                digest = decode_data_uri_to_file(a["url"], path)[2]
+                writer.copy(f"assets/{name}", path, digest)
+    for i, fut in downloads.items():
+        name = attachments[i]["name"]
+        try:
+            fetched = fut.result()
+            writer.copy(f"assets/{name}", fetched["spool"], fetched["sha256"])
+        except Exception:
+            logger.warning("could not fetch attachment %s from %s", name, attachments[i]["url"], exc_info=True)
+
+    # README
+    readme = f"""
+# Student-generated app
+
+Generated from brief:
+
+```
+{brief}
+```
+
+Generated at {datetime.utcnow().isoformat()} UTC.
+
+License: MIT
+"""
+    # keep the original timestamp unless the brief itself changed
+    writer.write("README.md", _keep_stable(out_dir, "README.md", readme, r"Generated at .* UTC\."))
+
+    # MIT LICENSE
+    mit = """MIT License
+
+Copyright (c) %d
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+""" % (datetime.utcnow().year)
+    writer.write("LICENSE", _keep_stable(out_dir, "LICENSE", mit, r"Copyright \(c\) \d+"))
+
+    logger.info("generated %d files into %s, %d changed", len(writer.manifest), out_dir, len(writer.changed))
+    return out_dir
@@ -0,0 +1,114 @@
+"""Publish a set of files to GitHub through the Git Data API.
+
+This avoids a local working tree and git binary entirely: blobs, a tree and
+a commit are created over HTTPS and the branch ref is moved to the new commit.
+"""
+import os
+import base64
+import hashlib
+import logging
+
+from .http_client import client as http, GITHUB_API_URL
+
+logger = logging.getLogger(__name__)
+
+
+def files_from_dir(source_dir):
+    """Return {relative posix path: bytes} for every file under source_dir, skipping .git."""
+    files = {}
+    for root, dirs, names in os.walk(source_dir):
+        dirs[:] = [d for d in dirs if d != ".git"]
+        for name in names:
+            path = os.path.join(root, name)
+            rel = os.path.relpath(path, source_dir).replace(os.sep, "/")
+            with open(path, "rb") as f:
+                files[rel] = f.read()
+    return files
+
+
+def git_blob_sha(content):
+    """Return the sha git assigns to a blob with this content."""
+    h = hashlib.sha1(b"blob %d\0" % len(content))
+    h.update(content)
+    return h.hexdigest()
+
+
+def _check(r, what):
+    if r.status_code >= 400:
+        logger.error("Git Data API %s failed: %s %s", what, r.status_code, r.text)
+        r.raise_for_status()
+    return r.json()
+
+
+def _get_head(repo_api, headers, branch):
+    """Return (commit_sha, tree_sha) of branch, or (None, None) if the repo is empty."""
+    r = http.get(f"{repo_api}/git/ref/heads/{branch}", headers=headers)
+    # 404 for a missing branch, 409 for a repository without any commits
+    if r.status_code in (404, 409):
+        return None, None
+    commit_sha = _check(r, "get ref")["object"]["sha"]
+    commit = _check(http.get(f"{repo_api}/git/commits/{commit_sha}", headers=headers), "get commit")
+    return commit_sha, commit["tree"]["sha"]
+
+
+def _bootstrap(repo_api, headers, branch, files, message):
+    """Create the first commit of an empty repository via the contents API.
+
+    The Git Data API refuses to create blobs in a repository with no commits,
+    so one file is written through /contents first.
+    """
+    path = "README.md" if "README.md" in files else sorted(files)[0]
+    payload = {
+        "message": message,
+        "content": base64.b64encode(files[path]).decode("ascii"),
+        "branch": branch,
+    }
+    r = http.request("PUT", f"{repo_api}/contents/{path}", headers=headers, json=payload)
+    return _check(r, "bootstrap commit")["commit"]["sha"]
+
+
+def publish_files(owner, repo_name, files, headers, message="Update commit", branch="main", keep_existing=False):
+    """Commit files ({path: bytes}) to owner/repo_name on branch and return the new commit sha.
+
+    The commit replaces the whole tree unless keep_existing is True, in which case
+    files not present in `files` are left untouched. Blobs whose content already
+    exists at the same path in the parent commit are not re-uploaded.
+    """
+    if not files:
+        raise ValueError("no files to publish")
+    repo_api = f"{GITHUB_API_URL}/repos/{owner}/{repo_name}"
+
+    parent, base_tree = _get_head(repo_api, headers, branch)
+    if parent is None:
+        parent = _bootstrap(repo_api, headers, branch, files, message)
+        base_tree = _check(http.get(f"{repo_api}/git/commits/{parent}", headers=headers), "get commit")["tree"]["sha"]
+
+    existing = {}
+    if base_tree:
+        tree = _check(http.get(f"{repo_api}/git/trees/{base_tree}", headers=headers, params={"recursive": "1"}), "get tree")
+        existing = {e["path"]: e["sha"] for e in tree.get("tree", []) if e.get("type") == "blob"}
+
+    entries = []
+    for path in sorted(files):
+        content = files[path]
+        sha = git_blob_sha(content)
+        if existing.get(path) != sha:
+            blob = {"content": base64.b64encode(content).decode("ascii"), "encoding": "base64"}
+            sha = _check(http.post(f"{repo_api}/git/blobs", headers=headers, json=blob), "create blob")["sha"]
+        entries.append({"path": path, "mode": "100644", "type": "blob", "sha": sha})
+
+    tree_payload = {"tree": entries}
+    if keep_existing and base_tree:
+        tree_payload["base_tree"] = base_tree
+    tree_sha = _check(http.post(f"{repo_api}/git/trees", headers=headers, json=tree_payload), "create tree")["sha"]
+
+    if tree_sha == base_tree:
+        logger.info("Tree unchanged for %s/%s, keeping %s", owner, repo_name, parent)
+        return parent
+
+    commit = {"message": message, "tree": tree_sha, "parents": [parent]}
+    commit_sha = _check(http.post(f"{repo_api}/git/commits", headers=headers, json=commit), "create commit")["sha"]
+
+    r = http.request("PATCH", f"{repo_api}/git/refs/heads/{branch}", headers=headers, json={"sha": commit_sha})
+    _check(r, "update ref")
+    return commit_sha
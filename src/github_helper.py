@@ -1,234 +1,405 @@
-import os
-import tempfile
-import subprocess
-import json
-from pathlib import Path
-import logging
-import requests
-
-logger = logging.getLogger(__name__)
-
-GITHUB_OWNER = os.environ.get("GITHUB_OWNER")
-
-
-def _get_token():
-    token = os.environ.get("GITHUB_TOKEN")
-    if not token:
-        raise RuntimeError("GITHUB_TOKEN required. Set it in the environment or in a .env file.")
-    return token
-
-
-def _run(cmd, cwd=None):
-    subprocess.check_call(cmd, cwd=cwd)
-
-
-def create_repo_from_dir(source_dir, task_name):
-    """Create a GitHub repo, push the source, enable Pages, and return (repo_url, commit_sha, pages_url).
-
-    This function uses the REST API to create a repo under the authenticated user or under GITHUB_OWNER.
-    It then pushes the local source using git commands.
-    """
-    GITHUB_TOKEN = _get_token()
-
-    # Build remote repo name safe
-    repo_name = task_name.replace(' ', '-').lower()
-
-    # Create repo via API (or detect if already exists)
-    headers = {"Authorization": f"token {GITHUB_TOKEN}", "Accept": "application/vnd.github+json"}
-    payload = {"name": repo_name, "private": False, "auto_init": False}
-    if GITHUB_OWNER:
-        create_url = f"https://api.github.com/orgs/{GITHUB_OWNER}/repos"
-    else:
-        create_url = "https://api.github.com/user/repos"
-
-    repo = None
-    repo_url = None
-    try:
-        r = requests.post(create_url, headers=headers, json=payload)
-        r.raise_for_status()
-        repo = r.json()
-        repo_url = repo.get("html_url")
-    except requests.HTTPError as e:
-        # If repo already exists (HTTP 422), continue and treat as update
-        resp = e.response
-        if resp is not None and resp.status_code == 422:
-            # repository exists — compute owner/login
-            if GITHUB_OWNER:
-                owner_login = GITHUB_OWNER
-            else:
-                owner_login = _get_authenticated_user(headers)
-            # Construct repo JSON minimal shape
-            repo = {
-                'owner': {'login': owner_login},
-                'name': repo_name,
-                'html_url': f"https://github.com/{owner_login}/{repo_name}",
-                'clone_url': f"https://github.com/{owner_login}/{repo_name}.git",
-                'ssh_url': f"git@github.com:{owner_login}/{repo_name}.git",
-            }
-            repo_url = repo['html_url']
-        else:
-            # Log response body for easier diagnosis (403/401 often include a message)
-            try:
-                body = resp.text if resp is not None else '<no response>'
-            except Exception:
-                body = '<could not read response body>'
-            logger.error("GitHub repo creation failed: %s %s", resp.status_code if resp is not None else 'N/A', body)
-            raise
-
-    # Log which authenticated user the token belongs to and which owner will be used
-    try:
-        token_user = _get_authenticated_user(headers)
-    except Exception:
-        token_user = None
-    logger.info("Authenticated token user: %s, target owner env: %s", token_user, GITHUB_OWNER)
-
-    # Init git, commit, push
-    _run(["git", "init"], cwd=source_dir)
-    _run(["git", "add", "-A"], cwd=source_dir)
-    _run(["git", "-c", "user.name=student", "-c", "user.email=student@example.com", "commit", "-m", "Initial commit"], cwd=source_dir)
-    _run(["git", "branch", "-M", "main"], cwd=source_dir)
-
-    # Use HTTPS push with token; construct remote URL that includes token only for push
-    owner = repo['owner']['login']
-    https_url = repo.get('clone_url')
-    if GITHUB_TOKEN and https_url:
-        # insert token into https url: https://<token>@github.com/owner/repo.git
-        token_url = https_url.replace('https://', f'https://{GITHUB_TOKEN}@')
-        # If origin already exists (possible when reusing temp dirs), set-url instead of add
-        try:
-            existing = subprocess.check_output(["git", "remote"], cwd=source_dir).decode().split()
-        except Exception:
-            existing = []
-
-        if 'origin' in existing:
-            logger.info("Remote 'origin' exists, setting URL to token-authenticated HTTPS URL")
-            _run(["git", "remote", "set-url", "origin", token_url], cwd=source_dir)
-        else:
-            _run(["git", "remote", "add", "origin", token_url], cwd=source_dir)
-
-        # Try normal push; if it fails due to non-fast-forward or auth, try force push
-        try:
-            _run(["git", "push", "-u", "origin", "main"], cwd=source_dir)
-        except Exception:
-            logger.warning("Normal push failed, attempting force push")
-            try:
-                _run(["git", "push", "-u", "origin", "main", "--force"], cwd=source_dir)
-            except Exception as e:
-                logger.error("Force push also failed: %s", e)
-                raise
-        # replace remote to remove token (set back to non-token https)
-        _run(["git", "remote", "set-url", "origin", https_url], cwd=source_dir)
-    else:
-        # fallback to ssh url
-        _run(["git", "remote", "add", "origin", repo["ssh_url"]], cwd=source_dir)
-        try:
-            _run(["git", "push", "-u", "origin", "main"], cwd=source_dir)
-        except Exception:
-            _run(["git", "push", "-u", "origin", "main", "--force"], cwd=source_dir)
-
-    # Get latest commit sha
-    sha = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=source_dir).decode().strip()
-
-    # Enable GitHub Pages via API (use main branch / root) and wait for availability
-    pages_url = f"https://{repo['owner']['login']}.github.io/{repo_name}/"
-    enable_pages_and_wait(repo['owner']['login'], repo_name, headers, pages_url)
-
-    return repo_url, sha, pages_url
-
-
-def _get_authenticated_user(headers):
-    """Return the login of the authenticated user."""
-    r = requests.get('https://api.github.com/user', headers=headers)
-    r.raise_for_status()
-    return r.json().get('login')
-
-
-def get_authenticated_user():
-    token = _get_token()
-    headers = {"Authorization": f"token {token}", "Accept": "application/vnd.github+json"}
-    return _get_authenticated_user(headers)
-
-
-def clone_repo_to_dir(owner, repo_name, dest_dir):
-    """Clone an existing repo into dest_dir using token-authenticated HTTPS clone.
-
-    Returns the https_url used (without token).
-    """
-    token = _get_token()
-    https_url = f"https://github.com/{owner}/{repo_name}.git"
-    token_url = https_url.replace('https://', f'https://{token}@')
-    _run(["git", "clone", token_url, dest_dir])
-    # remove token from remote
-    _run(["git", "remote", "set-url", "origin", https_url], cwd=dest_dir)
-    return https_url
-
-
-def commit_and_push(dest_dir, message="Update commit"):
-    # stage changes
-    _run(["git", "add", "-A"], cwd=dest_dir)
-    # commit if there are changes
-    try:
-        _run(["git", "-c", "user.name=student", "-c", "user.email=student@example.com", "commit", "-m", message], cwd=dest_dir)
-    except Exception:
-        # no changes to commit
-        pass
-    # push (try normal, then force if necessary)
-    try:
-        # attempt push using whatever remote is set
-        _run(["git", "push", "origin", "main"], cwd=dest_dir)
-    except Exception:
-        logger.warning("Push failed, attempting token-authenticated push")
-        # try to push using token-authenticated URL in case origin points to SSH/other account
-        try:
-            token = _get_token()
-            # get origin https url
-            try:
-                https_url = subprocess.check_output(["git", "config", "--get", "remote.origin.url"], cwd=dest_dir).decode().strip()
-            except Exception:
-                https_url = None
-
-            if https_url and https_url.startswith('https://'):
-                token_url = https_url.replace('https://', f'https://{token}@')
-                _run(["git", "remote", "set-url", "origin", token_url], cwd=dest_dir)
-                try:
-                    _run(["git", "push", "origin", "main", "--force"], cwd=dest_dir)
-                finally:
-                    # restore non-token url
-                    if https_url:
-                        _run(["git", "remote", "set-url", "origin", https_url], cwd=dest_dir)
-            else:
-                # no https origin to rewrite; re-raise original error
-                raise
-        except Exception:
-            # final fallback: force push with existing remote
-            _run(["git", "push", "origin", "main", "--force"], cwd=dest_dir)
-
-
-def enable_pages_and_wait(owner, repo_name, headers, pages_url, timeout_seconds=300, poll_interval=5):
-    """Enable GitHub Pages for repository and poll pages_url until it returns HTTP 200 or timeout.
-
-    Returns True if pages_url returned 200 within timeout, otherwise False.
-    """
-    pages_api = f"https://api.github.com/repos/{owner}/{repo_name}/pages"
-    pages_payload = {"source": {"branch": "main", "path": "/"}}
-
-    try:
-        r = requests.post(pages_api, headers=headers, json=pages_payload)
-        # Accept 201, 202 or 204 depending on API; continue to poll regardless
-        r.raise_for_status()
-    except Exception:
-        # non-fatal here; sometimes API responds slowly or with 422 if already configured
-        pass
-
-    import time
-    deadline = time.time() + timeout_seconds
-    while time.time() < deadline:
-        try:
-            pr = requests.get(pages_url, timeout=5)
-            if pr.status_code == 200:
-                return True
-        except Exception:
-            pass
-        time.sleep(poll_interval)
-
-    return False
+import os
+import subprocess
+import logging
+import threading
+import time
+from contextlib import contextmanager
+import requests
+
+from .http_client import client as http, GITHUB_API_URL
+from .git_data import publish_files, files_from_dir
+from .mirror_cache import mirrors
+from .github_scheduler import scheduler
+from .metrics import stage, STAGE_SECONDS, FORCE_PUSHES
+
+logger = logging.getLogger(__name__)
+
+GITHUB_OWNER = os.environ.get("GITHUB_OWNER")
+# "git" pushes with the git binary; "api" commits through the GitHub Git Data API
+DEPLOY_MODE = os.environ.get("DEPLOY_MODE", "git").lower()
+METADATA_TTL_SECONDS = int(os.environ.get("METADATA_TTL_SECONDS", "3600"))
+# where a repo's Pages site is served; overridden by the offline benchmark
+PAGES_URL_TEMPLATE = os.environ.get("PAGES_URL_TEMPLATE", "https://{owner}.github.io/{repo}/")
+
+
+class _MetadataCache:
+    """Thread-safe TTL cache for GitHub metadata that rarely changes.
+
+    Keys are tuples: ("login", auth_header), ("repo", owner, name) and
+    ("pages", owner, name).
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.time():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.time() + self.ttl)
+
+    def invalidate(self, *prefix):
+        """Drop every key starting with prefix (everything when prefix is empty)."""
+        with self._lock:
+            for key in [k for k in self._data if k[:len(prefix)] == prefix]:
+                del self._data[key]
+
+
+metadata = _MetadataCache(METADATA_TTL_SECONDS)
+
+
+def invalidate_metadata(owner=None, repo_name=None):
+    """Forget cached repo/Pages state for owner/repo_name, or all metadata when called without arguments."""
+    if owner is None:
+        metadata.invalidate()
+        return
+    for kind in ("repo", "pages"):
+        if repo_name is None:
+            metadata.invalidate(kind, owner)
+        else:
+            metadata.invalidate(kind, owner, repo_name)
+
+
+def _get_token():
+    # the next token of the GITHUB_TOKENS pool with budget left, else GITHUB_TOKEN
+    token = scheduler.pick_token()
+    if not token:
+        raise RuntimeError("GITHUB_TOKEN required. Set it in the environment or in a .env file.")
+    return token
+
+
+def _run(cmd, cwd=None):
+    subprocess.check_call(cmd, cwd=cwd)
+
+
+def _run_remote(cmd, token, cwd=None):
+    """Run a git command that talks to GitHub (push/clone/fetch) in a scheduler slot."""
+    with scheduler.slot(token):
+        subprocess.check_call(cmd, cwd=cwd)
+
+
+def create_repo_from_dir(source_dir, task_name, wait_for_pages=True):
+    """Create a GitHub repo, push the source, enable Pages, and return (repo_url, commit_sha, pages_url).
+
+    This function uses the REST API to create a repo under the authenticated user or under GITHUB_OWNER.
+    It then pushes the local source using git commands, or through the Git Data API when DEPLOY_MODE=api.
+    With wait_for_pages=False it returns as soon as Pages is enabled, without polling the site.
+    """
+    GITHUB_TOKEN = _get_token()
+
+    # Build remote repo name safe
+    repo_name = task_name.replace(' ', '-').lower()
+
+    # Create repo via API (or detect if already exists)
+    headers = {"Authorization": f"token {GITHUB_TOKEN}", "Accept": "application/vnd.github+json"}
+    payload = {"name": repo_name, "private": False, "auto_init": False}
+    if GITHUB_OWNER:
+        create_url = f"{GITHUB_API_URL}/orgs/{GITHUB_OWNER}/repos"
+    else:
+        create_url = f"{GITHUB_API_URL}/user/repos"
+
+    repo = None
+    repo_url = None
+    owner_login = get_target_owner(headers)
+    if metadata.get(("repo", owner_login, repo_name)):
+        # known to exist (re-submitted task); skip the create-then-422 round trip
+        repo = _existing_repo(owner_login, repo_name)
+        repo_url = repo['html_url']
+    else:
+        with stage("create_repo"):
+            repo, repo_url = _create_repo(create_url, headers, payload, owner_login, repo_name)
+    metadata.set(("repo", repo['owner']['login'], repo_name), True)
+
+    # Log which authenticated user the token belongs to and which owner will be used
+    try:
+        token_user = _get_authenticated_user(headers)
+    except Exception:
+        token_user = None
+    logger.info("Authenticated token user: %s, target owner env: %s", token_user, GITHUB_OWNER)
+
+    if DEPLOY_MODE == "api":
+        # commit straight through the Git Data API; no working tree or git binary involved
+        with stage("git_push"):
+            sha = publish_files(repo['owner']['login'], repo_name, files_from_dir(source_dir), headers, message="Initial commit")
+    else:
+        with stage("git_push"):
+            sha = _push_with_git(source_dir, repo, GITHUB_TOKEN)
+
+    # Enable GitHub Pages via API (use main branch / root) and wait for availability
+    pages_url = pages_url_for(repo['owner']['login'], repo_name)
+    if wait_for_pages:
+        enable_pages_and_wait(repo['owner']['login'], repo_name, headers, pages_url)
+    else:
+        enable_pages(repo['owner']['login'], repo_name, headers)
+
+    return repo_url, sha, pages_url
+
+
+def pages_url_for(owner, repo_name):
+    return PAGES_URL_TEMPLATE.format(owner=owner, repo=repo_name)
+
+
+def _push_with_git(source_dir, repo, token):
+    """Commit source_dir with a fresh local git repo, push it to main and return the commit sha."""
+    # Init git, commit, push
+    _run(["git", "init"], cwd=source_dir)
+    _run(["git", "add", "-A"], cwd=source_dir)
+    _run(["git", "-c", "user.name=student", "-c", "user.email=student@example.com", "commit", "-m", "Initial commit"], cwd=source_dir)
+    _run(["git", "branch", "-M", "main"], cwd=source_dir)
+
+    # Use HTTPS push with token; construct remote URL that includes token only for push
+    https_url = repo.get('clone_url')
+    if token and https_url:
+        # insert token into https url: https://<token>@github.com/owner/repo.git
+        token_url = https_url.replace('https://', f'https://{token}@')
+        # If origin already exists (possible when reusing temp dirs), set-url instead of add
+        try:
+            existing = subprocess.check_output(["git", "remote"], cwd=source_dir).decode().split()
+        except Exception:
+            existing = []
+
+        if 'origin' in existing:
+            logger.info("Remote 'origin' exists, setting URL to token-authenticated HTTPS URL")
+            _run(["git", "remote", "set-url", "origin", token_url], cwd=source_dir)
+        else:
+            _run(["git", "remote", "add", "origin", token_url], cwd=source_dir)
+
+        # Try normal push; if it fails due to non-fast-forward or auth, try force push
+        try:
+            _run_remote(["git", "push", "-u", "origin", "main"], token, cwd=source_dir)
+        except Exception:
+            logger.warning("Normal push failed, attempting force push")
+            FORCE_PUSHES.inc()
+            try:
+                _run_remote(["git", "push", "-u", "origin", "main", "--force"], token, cwd=source_dir)
+            except Exception as e:
+                logger.error("Force push also failed: %s", e)
+                raise
+        # replace remote to remove token (set back to non-token https)
+        _run(["git", "remote", "set-url", "origin", https_url], cwd=source_dir)
+    else:
+        # fallback to ssh url
+        _run(["git", "remote", "add", "origin", repo["ssh_url"]], cwd=source_dir)
+        try:
+            _run(["git", "push", "-u", "origin", "main"], cwd=source_dir)
+        except Exception:
+            FORCE_PUSHES.inc()
+            _run(["git", "push", "-u", "origin", "main", "--force"], cwd=source_dir)
+
+    # Get latest commit sha
+    return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=source_dir).decode().strip()
+
+
+def _existing_repo(owner_login, repo_name):
+    """Return the minimal repo JSON shape for a repository that already exists."""
+    return {
+        'owner': {'login': owner_login},
+        'name': repo_name,
+        'html_url': f"https://github.com/{owner_login}/{repo_name}",
+        'clone_url': f"https://github.com/{owner_login}/{repo_name}.git",
+        'ssh_url': f"git@github.com:{owner_login}/{repo_name}.git",
+    }
+
+
+def _create_repo(create_url, headers, payload, owner_login, repo_name):
+    """Create the repo via the API; an existing repo (HTTP 422) is treated as an update."""
+    try:
+        r = http.post(create_url, headers=headers, json=payload)
+        r.raise_for_status()
+        repo = r.json()
+        return repo, repo.get("html_url")
+    except requests.HTTPError as e:
+        resp = e.response
+        if resp is not None and resp.status_code == 422:
+            repo = _existing_repo(owner_login, repo_name)
+            return repo, repo['html_url']
+        # Log response body for easier diagnosis (403/401 often include a message)
+        try:
+            body = resp.text if resp is not None else '<no response>'
+        except Exception:
+            body = '<could not read response body>'
+        logger.error("GitHub repo creation failed: %s %s", resp.status_code if resp is not None else 'N/A', body)
+        if resp is not None and resp.status_code == 401:
+            metadata.invalidate("login", headers.get("Authorization"))
+        raise
+
+
+def _get_authenticated_user(headers):
+    """Return the login of the authenticated user (cached per token)."""
+    key = ("login", headers.get("Authorization"))
+    login = metadata.get(key)
+    if login:
+        return login
+    r = http.get(f'{GITHUB_API_URL}/user', headers=headers, cache=True)
+    r.raise_for_status()
+    login = r.json().get('login')
+    metadata.set(key, login)
+    return login
+
+
+def get_authenticated_user():
+    token = _get_token()
+    headers = {"Authorization": f"token {token}", "Accept": "application/vnd.github+json"}
+    return _get_authenticated_user(headers)
+
+
+def get_target_owner(headers=None):
+    """Return the account repos are created under: GITHUB_OWNER, else the token owner."""
+    if GITHUB_OWNER:
+        return GITHUB_OWNER
+    if headers is None:
+        return get_authenticated_user()
+    return _get_authenticated_user(headers)
+
+
+def update_repo_via_api(source_dir, owner, repo_name, message="Update commit"):
+    """Commit the files in source_dir on top of owner/repo_name's main branch and return the new sha.
+
+    Files not present in source_dir are kept, matching a clone-regenerate-push update.
+    """
+    token = _get_token()
+    headers = {"Authorization": f"token {token}", "Accept": "application/vnd.github+json"}
+    with stage("git_push"):
+        sha = publish_files(owner, repo_name, files_from_dir(source_dir), headers, message=message, keep_existing=True)
+    metadata.set(("repo", owner, repo_name), True)
+    return sha
+
+
+def clone_repo_to_dir(owner, repo_name, dest_dir):
+    """Clone an existing repo into dest_dir using token-authenticated HTTPS clone.
+
+    Returns the https_url used (without token).
+    """
+    token = _get_token()
+    https_url = f"https://github.com/{owner}/{repo_name}.git"
+    token_url = https_url.replace('https://', f'https://{token}@')
+    try:
+        _run_remote(["git", "clone", token_url, dest_dir], token)
+    except Exception:
+        invalidate_metadata(owner, repo_name)
+        raise
+    metadata.set(("repo", owner, repo_name), True)
+    # remove token from remote
+    _run(["git", "remote", "set-url", "origin", https_url], cwd=dest_dir)
+    return https_url
+
+
+@contextmanager
+def checkout_repo(owner, repo_name):
+    """Yield a working copy of owner/repo_name made from the local mirror cache.
+
+    Only new objects are fetched from GitHub. The per-repo lock is held until the
+    block exits, so concurrent rounds for the same task are serialized; push inside it.
+    """
+    token = _get_token()
+    https_url = f"https://github.com/{owner}/{repo_name}.git"
+    token_url = https_url.replace('https://', f'https://{token}@')
+    try:
+        with mirrors.checkout(owner, repo_name, token_url, network=lambda: scheduler.slot(token)) as workdir:
+            # remove token from remote, as clone_repo_to_dir does
+            _run(["git", "remote", "set-url", "origin", https_url], cwd=workdir)
+            metadata.set(("repo", owner, repo_name), True)
+            yield workdir
+    except subprocess.CalledProcessError:
+        invalidate_metadata(owner, repo_name)
+        raise
+
+
+def commit_and_push(dest_dir, message="Update commit"):
+    """Commit and push the working tree in dest_dir. Returns False if there was nothing to commit."""
+    # stage changes
+    _run(["git", "add", "-A"], cwd=dest_dir)
+    # nothing staged: the regenerated tree matches HEAD, so skip the commit and the push
+    if subprocess.call(["git", "diff", "--cached", "--quiet"], cwd=dest_dir) == 0:
+        logger.info("No changes in %s, skipping commit and push", dest_dir)
+        return False
+    _run(["git", "-c", "user.name=student", "-c", "user.email=student@example.com", "commit", "-m", message], cwd=dest_dir)
+    # push (try normal, then force if necessary)
+    start = time.perf_counter()
+    try:
+        # attempt push using whatever remote is set
+        _run_remote(["git", "push", "origin", "main"], scheduler.pick_token(), cwd=dest_dir)
+    except Exception:
+        logger.warning("Push failed, attempting token-authenticated push")
+        # try to push using token-authenticated URL in case origin points to SSH/other account
+        try:
+            token = _get_token()
+            # get origin https url
+            try:
+                https_url = subprocess.check_output(["git", "config", "--get", "remote.origin.url"], cwd=dest_dir).decode().strip()
+            except Exception:
+                https_url = None
+
+            if https_url and https_url.startswith('https://'):
+                token_url = https_url.replace('https://', f'https://{token}@')
+                _run(["git", "remote", "set-url", "origin", token_url], cwd=dest_dir)
+                FORCE_PUSHES.inc()
+                try:
+                    _run_remote(["git", "push", "origin", "main", "--force"], token, cwd=dest_dir)
+                finally:
+                    # restore non-token url
+                    if https_url:
+                        _run(["git", "remote", "set-url", "origin", https_url], cwd=dest_dir)
+            else:
+                # no https origin to rewrite; re-raise original error
+                raise
+        except Exception:
+            # final fallback: force push with existing remote
+            FORCE_PUSHES.inc()
+            _run_remote(["git", "push", "origin", "main", "--force"], scheduler.pick_token(), cwd=dest_dir)
+    STAGE_SECONDS.observe(time.perf_counter() - start, stage="git_push")
+    return True
+
+
+def enable_pages(owner, repo_name, headers):
+    """Enable GitHub Pages (main branch, root) for the repository unless it is known to be on."""
+    pages_api = f"{GITHUB_API_URL}/repos/{owner}/{repo_name}/pages"
+    pages_payload = {"source": {"branch": "main", "path": "/"}}
+
+    if not metadata.get(("pages", owner, repo_name)):
+        start = time.perf_counter()
+        try:
+            # Pages may already be configured (e.g. round 2); a cached GET avoids the POST
+            existing = http.get(pages_api, headers=headers, cache=True)
+            if existing.status_code != 200:
+                r = http.post(pages_api, headers=headers, json=pages_payload)
+                # Accept 201, 202 or 204 depending on API; continue to poll regardless
+                r.raise_for_status()
+            metadata.set(("pages", owner, repo_name), True)
+        except Exception:
+            # non-fatal here; sometimes API responds slowly or with 422 if already configured
+            pass
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage="pages_enable")
+
+
+def enable_pages_and_wait(owner, repo_name, headers, pages_url, timeout_seconds=300, poll_interval=5):
+    """Enable GitHub Pages for repository and poll pages_url until it returns HTTP 200 or timeout.
+
+    Returns True if pages_url returned 200 within timeout, otherwise False.
+    Builds use enable_pages plus the shared pages_watcher instead, so no worker blocks here.
+    """
+    enable_pages(owner, repo_name, headers)
+
+    with STAGE_SECONDS.time(stage="pages_wait"):
+        deadline = time.time() + timeout_seconds
+        while time.time() < deadline:
+            try:
+                pr = http.get(pages_url, timeout=5)
+                if pr.status_code == 200:
+                    return True
+            except Exception:
+                pass
+            time.sleep(poll_interval)
+
+    return False
@@ -0,0 +1,341 @@
+"""Central scheduler for GitHub API and git-over-HTTPS traffic.
+
+Every GitHub request goes through the shared `scheduler`:
+
+- each token has a budget fed by the X-RateLimit-Remaining / -Reset headers;
+  once it is down to GITHUB_RATE_RESERVE calls it rests until the window resets;
+- content-creating calls (POST/PATCH/PUT/DELETE) are paced per token by a
+  token bucket refilled at GITHUB_WRITES_PER_MINUTE, GitHub's documented
+  secondary limit;
+- 403/429 responses carrying Retry-After, an exhausted budget or a
+  secondary-limit message rest the token for that long (secondary limits
+  without Retry-After back off exponentially) and the call is retried;
+- at most GITHUB_MAX_CONCURRENCY calls are in flight, and waiting calls are
+  admitted by priority, so interactive (wait_for_result) builds go first;
+- GITHUB_TOKENS (comma-separated) are handed out round-robin, skipping
+  tokens that are resting, to multiply the available rate limit.
+
+Git pushes and clones carry no rate-limit headers; they take a concurrency
+slot and wait out a resting token, but are not paced as writes.
+"""
+import os
+import time
+import asyncio
+import logging
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager, asynccontextmanager
+
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+GITHUB_MAX_CONCURRENCY = int(os.environ.get("GITHUB_MAX_CONCURRENCY", "32"))
+# calls kept back from each token's hourly budget (health checks, manual use)
+GITHUB_RATE_RESERVE = int(os.environ.get("GITHUB_RATE_RESERVE", "5"))
+# 0 disables write pacing
+GITHUB_WRITES_PER_MINUTE = float(os.environ.get("GITHUB_WRITES_PER_MINUTE", "80"))
+GITHUB_SECONDARY_BACKOFF = float(os.environ.get("GITHUB_SECONDARY_BACKOFF", "60"))
+GITHUB_RATE_LIMIT_RETRIES = int(os.environ.get("GITHUB_RATE_LIMIT_RETRIES", "3"))
+# a call that would have to wait longer than this fails instead
+GITHUB_MAX_WAIT = float(os.environ.get("GITHUB_MAX_WAIT", "900"))
+
+WRITE_METHODS = ("POST", "PATCH", "PUT", "DELETE")
+
+# priorities: lower goes first
+INTERACTIVE, NORMAL, BULK = 0, 1, 2
+_PRIORITY_NAMES = {INTERACTIVE: "interactive", NORMAL: "normal", BULK: "bulk"}
+_priority = contextvars.ContextVar("github_priority", default=NORMAL)
+
+WAIT_SECONDS = registry.histogram(
+    "llm_deploy_github_wait_seconds", "Time GitHub calls waited for the scheduler, by priority.", ["priority"])
+THROTTLED = registry.counter(
+    "llm_deploy_github_throttled_total", "GitHub rate-limit responses, by kind.", ["reason"])
+REMAINING = registry.gauge(
+    "llm_deploy_github_rate_remaining", "X-RateLimit-Remaining last reported for each pooled token.", ["token"])
+
+
+class RateLimited(RuntimeError):
+    """Raised when a GitHub call would have to wait longer than GITHUB_MAX_WAIT."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"GitHub rate limit: retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+@contextmanager
+def priority(level):
+    """Run the block's GitHub calls (including those in threads/tasks it starts) at level."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def token_from_header(authorization):
+    """Return the token in an "Authorization: token X" / "Bearer X" header value."""
+    if not authorization:
+        return None
+    return authorization.split(" ", 1)[-1]
+
+
+def _tokens():
+    pooled = [t.strip() for t in os.environ.get("GITHUB_TOKENS", "").split(",") if t.strip()]
+    if pooled:
+        return pooled
+    token = os.environ.get("GITHUB_TOKEN")
+    return [token] if token else []
+
+
+class _Bucket:
+    """Rate-limit state of one token."""
+
+    def __init__(self, writes_per_minute):
+        self.remaining = None
+        self.reset_at = 0.0
+        self.blocked_until = 0.0
+        self.backoff = 0.0
+        self.write_rate = writes_per_minute / 60.0
+        # a minute's worth of writes may go out in a burst
+        self.write_capacity = writes_per_minute
+        self.write_tokens = writes_per_minute
+        self.refilled_at = time.time()
+
+    def wait_time(self, now, write, reserve):
+        """Seconds until a call (a write if `write`) may use this token."""
+        wait = self.blocked_until - now
+        if self.remaining is not None and self.remaining <= reserve and self.reset_at > now:
+            wait = max(wait, self.reset_at - now)
+        if write and self.write_rate:
+            self.write_tokens = min(self.write_capacity,
+                                    self.write_tokens + (now - self.refilled_at) * self.write_rate)
+            self.refilled_at = now
+            if self.write_tokens < 1:
+                wait = max(wait, (1 - self.write_tokens) / self.write_rate)
+        return max(0.0, wait)
+
+    def take(self, now, write):
+        # spend locally too, so a burst does not overshoot before the headers come back
+        if self.remaining is not None and self.reset_at > now:
+            self.remaining -= 1
+        if write and self.write_rate:
+            self.write_tokens -= 1
+
+    def observe(self, status, headers, text, now, secondary_backoff):
+        """Update from a response; return (seconds to rest the token, reason) or None."""
+        if headers.get("X-RateLimit-Remaining") is not None:
+            try:
+                self.remaining = int(headers["X-RateLimit-Remaining"])
+                self.reset_at = float(headers.get("X-RateLimit-Reset") or 0)
+            except ValueError:
+                pass
+        if status not in (403, 429):
+            self.backoff = 0.0
+            return None
+        retry_after = headers.get("Retry-After")
+        if retry_after:
+            try:
+                delay, reason = float(retry_after), "retry_after"
+            except ValueError:
+                delay, reason = secondary_backoff, "retry_after"
+        elif self.remaining == 0 and self.reset_at > now:
+            delay, reason = self.reset_at - now + 1, "primary"
+        elif status == 429 or "secondary rate limit" in text.lower():
+            self.backoff = min(max(self.backoff * 2, secondary_backoff), 16 * secondary_backoff)
+            delay, reason = self.backoff, "secondary"
+        else:
+            # an ordinary 403 (permissions); not ours to retry
+            return None
+        self.blocked_until = max(self.blocked_until, now + delay)
+        return delay, reason
+
+
+class GitHubScheduler:
+    def __init__(self, max_concurrency=GITHUB_MAX_CONCURRENCY, reserve=GITHUB_RATE_RESERVE,
+                 writes_per_minute=GITHUB_WRITES_PER_MINUTE, secondary_backoff=GITHUB_SECONDARY_BACKOFF,
+                 retries=GITHUB_RATE_LIMIT_RETRIES, max_wait=GITHUB_MAX_WAIT):
+        self.max_concurrency = max(1, max_concurrency)
+        self.reserve = reserve
+        self.writes_per_minute = writes_per_minute
+        self.secondary_backoff = secondary_backoff
+        self.retries = retries
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._buckets = {}
+        self._waiters = []  # [priority, seq, token, write] of calls waiting for a slot
+        self._seq = itertools.count()
+        self._inflight = 0
+        self._next = 0
+        self._warned_pool = False
+
+    def _bucket(self, token):
+        bucket = self._buckets.get(token)
+        if bucket is None:
+            bucket = self._buckets[token] = _Bucket(self.writes_per_minute)
+        return bucket
+
+    # -- tokens -----------------------------------------------------------
+
+    def pick_token(self):
+        """Return the next pooled token with budget left (round-robin), or None if none is configured."""
+        tokens = _tokens()
+        if len(tokens) > 1 and not os.environ.get("GITHUB_OWNER"):
+            # repos are created under the token's account; mixing accounts would split a task's rounds
+            if not self._warned_pool:
+                logger.warning("GITHUB_TOKENS needs GITHUB_OWNER (an org all tokens can write to); using the first token")
+                self._warned_pool = True
+            tokens = tokens[:1]
+        if not tokens:
+            return None
+        now = time.time()
+        with self._cond:
+            for i in range(len(tokens)):
+                token = tokens[(self._next + i) % len(tokens)]
+                if self._bucket(token).wait_time(now, False, self.reserve) == 0:
+                    self._next = (self._next + i + 1) % len(tokens)
+                    return token
+            # every token is resting: take the one that comes back first
+            return min(tokens, key=lambda t: self._bucket(t).wait_time(now, False, self.reserve))
+
+    # -- admission --------------------------------------------------------
+
+    def _try(self, waiter):
+        """Admit waiter if possible. Returns 0 if admitted, else seconds to wait (None: until notified)."""
+        # caller holds self._cond
+        if self._inflight >= self.max_concurrency:
+            return None
+        now = time.time()
+        level, _, token, write = waiter
+        wait = self._bucket(token).wait_time(now, write, self.reserve)
+        if wait > 0:
+            return wait
+        for other in self._waiters:
+            # a more urgent call that could run right now goes first
+            if other[0] < level and self._bucket(other[2]).wait_time(now, other[3], self.reserve) == 0:
+                return None
+        self._bucket(token).take(now, write)
+        self._inflight += 1
+        return 0
+
+    def _check_wait(self, wait):
+        if wait is not None and wait > self.max_wait:
+            raise RateLimited(wait)
+
+    def acquire(self, token, write=False):
+        level = _priority.get()
+        waiter = [level, next(self._seq), token, write]
+        started = time.perf_counter()
+        with self._cond:
+            self._waiters.append(waiter)
+            try:
+                while True:
+                    wait = self._try(waiter)
+                    if wait == 0:
+                        break
+                    self._check_wait(wait)
+                    self._cond.wait(min(wait, 1.0) if wait else 1.0)
+            finally:
+                self._waiters.remove(waiter)
+                self._cond.notify_all()
+        WAIT_SECONDS.observe(time.perf_counter() - started, priority=_PRIORITY_NAMES.get(level, str(level)))
+
+    async def aacquire(self, token, write=False):
+        """acquire() for coroutines: polls instead of blocking the event loop."""
+        level = _priority.get()
+        waiter = [level, next(self._seq), token, write]
+        started = time.perf_counter()
+        with self._cond:
+            self._waiters.append(waiter)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try(waiter)
+                if wait == 0:
+                    break
+                self._check_wait(wait)
+                await asyncio.sleep(min(wait, 0.25) if wait else 0.05)
+        finally:
+            with self._cond:
+                self._waiters.remove(waiter)
+                self._cond.notify_all()
+        WAIT_SECONDS.observe(time.perf_counter() - started, priority=_PRIORITY_NAMES.get(level, str(level)))
+
+    def release(self):
+        with self._cond:
+            self._inflight -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, token):
+        """Hold a concurrency slot for a git-over-HTTPS operation using token."""
+        self.acquire(token)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self, token):
+        await self.aacquire(token)
+        try:
+            yield
+        finally:
+            self.release()
+
+    # -- API calls --------------------------------------------------------
+
+    def observe(self, token, response):
+        """Feed a response's rate-limit headers back; return seconds to wait before a retry, or None."""
+        text = response.text if response.status_code in (403, 429) else ""
+        with self._cond:
+            limited = self._bucket(token).observe(
+                response.status_code, response.headers, text, time.time(), self.secondary_backoff)
+            remaining = self._bucket(token).remaining
+            self._cond.notify_all()
+        if remaining is not None:
+            tokens = _tokens()
+            REMAINING.set(remaining, token=str(tokens.index(token)) if token in tokens else "other")
+        if limited is None:
+            return None
+        delay, reason = limited
+        THROTTLED.inc(reason=reason)
+        logger.warning("GitHub rate limit (%s, HTTP %s): resting token for %.1fs", reason, response.status_code, delay)
+        return delay
+
+    def call(self, token, method, send):
+        """Run send() (one GitHub API request) under the scheduler, retrying rate-limited responses."""
+        write = method.upper() in WRITE_METHODS
+        for attempt in range(self.retries + 1):
+            self.acquire(token, write)
+            try:
+                r = send()
+            finally:
+                self.release()
+            delay = self.observe(token, r)
+            if delay is None or attempt == self.retries or delay > self.max_wait:
+                return r
+        return r
+
+    async def acall(self, token, method, send):
+        """call() for coroutines; send() returns an awaitable response."""
+        write = method.upper() in WRITE_METHODS
+        for attempt in range(self.retries + 1):
+            await self.aacquire(token, write)
+            try:
+                r = await send()
+            finally:
+                self.release()
+            delay = self.observe(token, r)
+            if delay is None or attempt == self.retries or delay > self.max_wait:
+                return r
+        return r
+
+    def stats(self):
+        with self._cond:
+            return {"in_flight": self._inflight, "waiting": len(self._waiters)}
+
+
+# Shared by every GitHub caller (REST via http_client / httpx, and git pushes and clones)
+scheduler = GitHubScheduler()
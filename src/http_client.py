@@ -0,0 +1,80 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .jobs import BUILD_WORKERS
+from .github_scheduler import scheduler, token_from_header
+
+logger = logging.getLogger(__name__)
+
+GITHUB_API_URL = os.environ.get("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", "15"))
+# each build worker may hold an API call and a Pages probe at the same time
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", str(BUILD_WORKERS * 2)))
+
+
+class HttpClient:
+    """Thread-safe wrapper around a pooled requests.Session.
+
+    Every request gets a default timeout. GETs made with `cache=True` are
+    revalidated with If-None-Match: a 304 returns the previously cached
+    response, which costs less than a full response and does not count
+    against the GitHub rate limit. Calls to GITHUB_API_URL are admitted and
+    retried by the GitHub scheduler.
+    """
+
+    def __init__(self, pool_size=HTTP_POOL_SIZE, timeout=HTTP_TIMEOUT, cache_size=256):
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._etags = OrderedDict()  # (url, authorization) -> (etag, response)
+        self._lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        if not url.startswith(GITHUB_API_URL):
+            return self.session.request(method, url, **kwargs)
+        token = token_from_header((kwargs.get("headers") or {}).get("Authorization"))
+        return scheduler.call(token, method, lambda: self.session.request(method, url, **kwargs))
+
+    def get(self, url, headers=None, cache=False, **kwargs):
+        if not cache:
+            return self.request("GET", url, headers=headers, **kwargs)
+        headers = dict(headers or {})
+        key = (url, headers.get("Authorization"))
+        with self._lock:
+            cached = self._etags.get(key)
+        if cached:
+            headers["If-None-Match"] = cached[0]
+        r = self.request("GET", url, headers=headers, **kwargs)
+        if r.status_code == 304 and cached:
+            with self._lock:
+                self._etags.move_to_end(key)
+            return cached[1]
+        etag = r.headers.get("ETag")
+        with self._lock:
+            if etag and r.status_code == 200:
+                self._etags[key] = (etag, r)
+                self._etags.move_to_end(key)
+                while len(self._etags) > self.cache_size:
+                    self._etags.popitem(last=False)
+            else:
+                self._etags.pop(key, None)
+        return r
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request("HEAD", url, **kwargs)
+
+
+# Shared by all GitHub API and Pages calls
+client = HttpClient()
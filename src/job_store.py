@@ -0,0 +1,402 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import tempfile
+import threading
+
+from .jobs import (
+    Job, BuildQueue, QueueFull, LANES, LANE_WEIGHTS, BUILD_WORKERS, BUILD_QUEUE_SIZE, SUPERSEDE_WINDOW_SECONDS,
+    lane_capacity, _pick, _too_many,
+)
+
+logger = logging.getLogger(__name__)
+
+# "thread": builds run on in-process worker threads (default). "sqlite": API processes
+# only enqueue, and `python -m src.worker` processes lease jobs from BUILD_QUEUE_PATH
+BUILD_QUEUE_BACKEND = os.environ.get("BUILD_QUEUE_BACKEND", "thread").lower()
+BUILD_QUEUE_PATH = os.environ.get(
+    "BUILD_QUEUE_PATH", os.path.join(tempfile.gettempdir(), "llm-deploy", "jobs.db")
+)
+# a running job whose lease is not renewed for this long is handed to another worker
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+# how often API processes check on jobs they are waiting for
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "0.5"))
+# finished jobs are kept this long (for de-duplication), then deleted
+JOB_RETENTION_SECONDS = int(os.environ.get("JOB_RETENTION_SECONDS", str(24 * 3600)))
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _target_name(target):
+    return f"{target.__module__}:{target.__qualname__}"
+
+
+class SQLiteBuildQueue:
+    """BuildQueue backed by a SQLite table, shared by every process on the host.
+
+    API processes call the same methods as on BuildQueue (submit_keyed, find,
+    position, stats) and get Job futures back; a poller thread resolves them
+    once a worker finishes the job. Workers (see src.worker) call lease() to
+    claim queued jobs, renew their leases with heartbeat(), and report with
+    complete() or fail(). A job whose lease expires -- its worker crashed or
+    was killed -- is leased again, up to JOB_MAX_ATTEMPTS times.
+
+    Targets are stored by name ("module:function") and must be importable,
+    synchronous callables in the worker.
+
+    Workers pick a lane by the same weighted round robin as BuildQueue, and
+    within it the oldest job of the submitter with the fewest running jobs,
+    so a flood from one submitter is shared out across every process.
+    """
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        key TEXT NOT NULL,
+        grp TEXT,
+        ord INTEGER,
+        target TEXT NOT NULL,
+        args TEXT NOT NULL,
+        state TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        lease_owner TEXT,
+        lease_expires REAL,
+        result TEXT,
+        error TEXT,
+        submitted_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL,
+        lane TEXT NOT NULL DEFAULT 'bulk',
+        submitter TEXT
+    );
+    CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key, state);
+    CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, submitted_at);
+    CREATE TABLE IF NOT EXISTS workers (
+        id TEXT PRIMARY KEY,
+        concurrency INTEGER NOT NULL,
+        heartbeat_at REAL NOT NULL
+    );
+    """
+
+    def __init__(self, path=BUILD_QUEUE_PATH, maxsize=BUILD_QUEUE_SIZE, supersede_window=SUPERSEDE_WINDOW_SECONDS,
+                 lease_seconds=JOB_LEASE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS):
+        self.path = path
+        self.maxsize = max(1, maxsize)
+        self.supersede_window = supersede_window
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max(1, max_attempts)
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(self._SCHEMA)
+        if "lane" not in [r["name"] for r in self._conn.execute("PRAGMA table_info(jobs)")]:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN lane TEXT NOT NULL DEFAULT 'bulk'")
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN submitter TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_lane ON jobs (state, lane, submitted_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_submitter ON jobs (submitter, state)")
+        self._lock = threading.Lock()
+        self._lane_credit = {}
+        self._waiting = {}  # job id -> Job this process handed out
+        self._poller = None
+
+    # -- API side ---------------------------------------------------------
+
+    def submit_keyed(self, key, target, *args, group=None, order=None, lane="bulk", submitter=None,
+                     on_created=None, max_active=0):
+        """Same contract as BuildQueue.submit_keyed; the job runs in a worker process."""
+        key_json, group_json = json.dumps(key), json.dumps(group)
+        lane = lane if lane in LANES else "bulk"
+        now = time.time()
+        superseded = []
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._active(key_json)
+                created = row is None
+                if created:
+                    # inside the write transaction, so concurrent submits in any process see each other
+                    if max_active and self._conn.execute(
+                            "SELECT COUNT(*) FROM jobs WHERE submitter = ? AND state IN ('queued', 'running')",
+                            (submitter,)).fetchone()[0] >= max_active:
+                        raise _too_many(self._estimate_wait(0), max_active)
+                    if group is not None and order is not None and self.supersede_window > 0:
+                        rows = self._conn.execute(
+                            "SELECT * FROM jobs WHERE state = 'queued' AND grp = ? AND ord < ? AND submitted_at >= ?",
+                            (group_json, order, now - self.supersede_window),
+                        ).fetchall()
+                        for old in rows:
+                            self._conn.execute(
+                                "UPDATE jobs SET state = 'cancelled', finished_at = ? WHERE id = ?", (now, old["id"]))
+                            superseded.append(self._job(old))
+                    depth = self._conn.execute("SELECT COUNT(*) FROM jobs WHERE state = 'queued'").fetchone()[0]
+                    if depth >= lane_capacity(self.maxsize, lane):
+                        raise QueueFull(self._estimate_wait(depth))
+                    if on_created:
+                        # before the INSERT commits, so no worker has started the job yet
+                        on_created()
+                    job_id = uuid.uuid4().hex
+                    self._conn.execute(
+                        "INSERT INTO jobs (id, key, grp, ord, target, args, state, submitted_at, lane, submitter) "
+                        "VALUES (?, ?, ?, ?, ?, ?, 'queued', ?, ?, ?)",
+                        (job_id, key_json, group_json, order, _target_name(target), json.dumps(args), now,
+                         lane, submitter),
+                    )
+                    row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        job = self._track(row)
+        if created:
+            for old in superseded:
+                old.cancel()
+            job.superseded = superseded
+            job.position = self.position(job)
+            job.queue_depth = depth + 1
+        return job, created
+
+    def find(self, key):
+        """Return the queued or running job for key (in any process), or None."""
+        with self._lock:
+            row = self._active(json.dumps(key))
+        return self._track(row) if row is not None else None
+
+    def position(self, job):
+        """Return the 1-based queue position of job, or 0 if it is no longer queued.
+
+        Approximate: jobs in higher lanes, plus older jobs in its own lane.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT state, submitted_at, lane FROM jobs WHERE id = ?", (job.id,)).fetchone()
+            if row is None or row["state"] != "queued":
+                return 0
+            higher = LANES[:LANES.index(row["lane"])] if row["lane"] in LANES else LANES
+            marks = ",".join("?" * len(higher)) or "NULL"
+            return self._conn.execute(
+                f"SELECT COUNT(*) FROM jobs WHERE state = 'queued' AND (lane IN ({marks}) "
+                "OR (lane = ? AND submitted_at <= ?))", (*higher, row["lane"], row["submitted_at"]),
+            ).fetchone()[0]
+
+    def active(self, submitter):
+        """Return how many of submitter's jobs are queued or running, in any process."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE submitter = ? AND state IN ('queued', 'running')", (submitter,)
+            ).fetchone()[0]
+
+    def estimate_wait(self, depth=None):
+        with self._lock:
+            if depth is None:
+                depth = self._conn.execute("SELECT COUNT(*) FROM jobs WHERE state = 'queued'").fetchone()[0]
+            return self._estimate_wait(depth)
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            counts = dict(self._conn.execute(
+                "SELECT state, COUNT(*) FROM jobs WHERE state IN ('queued', 'running') GROUP BY state").fetchall())
+            lanes = dict(self._conn.execute(
+                "SELECT lane, COUNT(*) FROM jobs WHERE state = 'queued' GROUP BY lane").fetchall())
+            workers = self._conn.execute(
+                "SELECT COALESCE(SUM(concurrency), 0) FROM workers WHERE heartbeat_at >= ?",
+                (now - self.lease_seconds,),
+            ).fetchone()[0]
+        return {
+            "workers": workers,
+            "running": counts.get("running", 0),
+            "queued": counts.get("queued", 0),
+            "capacity": self.maxsize,
+            "lanes": {lane: lanes.get(lane, 0) for lane in LANES},
+        }
+
+    def _active(self, key_json):
+        # caller holds self._lock
+        return self._conn.execute(
+            "SELECT * FROM jobs WHERE key = ? AND state IN ('queued', 'running') ORDER BY submitted_at DESC LIMIT 1",
+            (key_json,),
+        ).fetchone()
+
+    def _job(self, row):
+        job = Job(None, tuple(json.loads(row["args"])), {})
+        job.id = row["id"]
+        job.submitted_at = row["submitted_at"]
+        job.key = tuple(json.loads(row["key"]))
+        job.group = tuple(json.loads(row["grp"])) if row["grp"] != "null" else None
+        job.order = row["ord"]
+        job.lane = row["lane"]
+        job.submitter = row["submitter"]
+        return job
+
+    def _track(self, row):
+        """Return this process's Job for row, resolved by the poller when the job finishes."""
+        with self._lock:
+            job = self._waiting.get(row["id"])
+            if job is None:
+                job = self._waiting[row["id"]] = self._job(row)
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll, name="job-poller")
+                self._poller.daemon = True
+                self._poller.start()
+        return job
+
+    def _poll(self):
+        while True:
+            time.sleep(JOB_POLL_INTERVAL)
+            with self._lock:
+                ids = list(self._waiting)
+                if not ids:
+                    continue
+                marks = ",".join("?" * len(ids))
+                rows = self._conn.execute(
+                    f"SELECT id, state, result, error FROM jobs WHERE id IN ({marks}) "
+                    "AND state NOT IN ('queued', 'running')", ids,
+                ).fetchall()
+                done = [(self._waiting.pop(r["id"]), r) for r in rows]
+            for job, row in done:
+                if row["state"] == "done":
+                    result = json.loads(row["result"])
+                    job.set_result(tuple(result) if isinstance(result, list) else result)
+                elif row["state"] == "cancelled":
+                    job.cancel()
+                else:
+                    job.set_exception(RuntimeError(row["error"] or "build failed"))
+
+    def _estimate_wait(self, depth):
+        # caller holds self._lock
+        row = self._conn.execute(
+            "SELECT AVG(finished_at - started_at) FROM (SELECT finished_at, started_at FROM jobs "
+            "WHERE state = 'done' ORDER BY finished_at DESC LIMIT 20)").fetchone()
+        avg = row[0] or 60.0
+        workers = self._conn.execute(
+            "SELECT COALESCE(SUM(concurrency), 0) FROM workers WHERE heartbeat_at >= ?",
+            (time.time() - self.lease_seconds,),
+        ).fetchone()[0] or BUILD_WORKERS
+        return max(1, int(avg * (depth / workers + 1)))
+
+    # -- worker side ------------------------------------------------------
+
+    def lease(self, owner=WORKER_ID):
+        """Claim a job whose lease expired, else the next queued job (see the class docstring), for owner.
+
+        Returns (job_id, target_name, args, attempt) or None when there is nothing to run.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE state = 'running' AND lease_expires < ? AND attempts < ? "
+                    "ORDER BY submitted_at LIMIT 1",
+                    (now, self.max_attempts),
+                ).fetchone() or self._next_queued()
+                if row is not None:
+                    if row["state"] == "running":
+                        logger.warning("re-leasing job %s after %s lost its lease", row["id"], row["lease_owner"])
+                    self._conn.execute(
+                        "UPDATE jobs SET state = 'running', lease_owner = ?, lease_expires = ?, "
+                        "attempts = attempts + 1, started_at = ? WHERE id = ?",
+                        (owner, now + self.lease_seconds, now, row["id"]),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return row["id"], row["target"], tuple(json.loads(row["args"])), row["attempts"] + 1
+
+    def _next_queued(self):
+        # caller holds self._lock, inside a transaction
+        waiting = [r[0] for r in self._conn.execute(
+            "SELECT DISTINCT lane FROM jobs WHERE state = 'queued'").fetchall() if r[0] in LANES]
+        if not waiting:
+            return None
+        # the round-robin credit is this worker's own; lanes that emptied drop out of it
+        credit = {lane: self._lane_credit.get(lane, 0) for lane in waiting}
+        lane = _pick(credit, LANE_WEIGHTS.get)
+        self._lane_credit = credit
+        return self._conn.execute(
+            "SELECT * FROM jobs AS j WHERE state = 'queued' AND lane = ? ORDER BY "
+            "(SELECT COUNT(*) FROM jobs AS r WHERE r.state = 'running' AND r.submitter IS j.submitter), "
+            "submitted_at LIMIT 1",
+            (lane,),
+        ).fetchone()
+
+    def heartbeat(self, owner=WORKER_ID, concurrency=1):
+        """Renew owner's leases and liveness record; returns the jobs that ran out of attempts.
+
+        Jobs whose lease expired after their last allowed attempt are marked
+        failed here and returned as (job_id, args) so the caller can record it.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE state = 'running' AND lease_owner = ?",
+                (now + self.lease_seconds, owner),
+            )
+            self._conn.execute(
+                "INSERT INTO workers (id, concurrency, heartbeat_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET concurrency = excluded.concurrency, heartbeat_at = excluded.heartbeat_at",
+                (owner, concurrency, now),
+            )
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                dead = self._conn.execute(
+                    "SELECT id, args FROM jobs WHERE state = 'running' AND lease_expires < ? AND attempts >= ?",
+                    (now, self.max_attempts),
+                ).fetchall()
+                for row in dead:
+                    self._conn.execute(
+                        "UPDATE jobs SET state = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                        (f"worker lost after {self.max_attempts} attempt(s)", now, row["id"]),
+                    )
+                self._conn.execute(
+                    "DELETE FROM jobs WHERE state IN ('done', 'failed', 'cancelled') AND finished_at < ?",
+                    (now - JOB_RETENTION_SECONDS,))
+                self._conn.execute("DELETE FROM workers WHERE heartbeat_at < ?", (now - JOB_RETENTION_SECONDS,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [(row["id"], tuple(json.loads(row["args"]))) for row in dead]
+
+    def complete(self, job_id, result, owner=WORKER_ID):
+        """Store job_id's result. Returns False if owner no longer holds the lease."""
+        return self._finish(job_id, owner, "done", json.dumps(result), None)
+
+    def fail(self, job_id, error, owner=WORKER_ID):
+        """Mark job_id failed. Returns False if owner no longer holds the lease."""
+        return self._finish(job_id, owner, "failed", None, error)
+
+    def retire(self, owner=WORKER_ID):
+        """Drop owner's liveness record (clean worker shutdown)."""
+        with self._lock:
+            self._conn.execute("DELETE FROM workers WHERE id = ?", (owner,))
+
+    def _finish(self, job_id, owner, state, result, error):
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET state = ?, result = ?, error = ?, finished_at = ?, lease_owner = NULL "
+                "WHERE id = ? AND state = 'running' AND lease_owner = ?",
+                (state, result, error, time.time(), job_id, owner),
+            )
+        if not cur.rowcount:
+            logger.warning("job %s finished after its lease was taken over; result dropped", job_id)
+        return bool(cur.rowcount)
+
+
+def open_queue(backend=BUILD_QUEUE_BACKEND):
+    """Return the build queue selected by BUILD_QUEUE_BACKEND ("thread" or "sqlite")."""
+    if backend == "sqlite":
+        return SQLiteBuildQueue()
+    if backend != "thread":
+        logger.warning("unknown BUILD_QUEUE_BACKEND %r, using worker threads", backend)
+    return BuildQueue()
@@ -0,0 +1,400 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from collections import deque, OrderedDict
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+BUILD_WORKERS = int(os.environ.get("BUILD_WORKERS", "4"))
+BUILD_QUEUE_SIZE = int(os.environ.get("BUILD_QUEUE_SIZE", "32"))
+# a queued round is dropped if a later round of the same task arrives within this many seconds
+SUPERSEDE_WINDOW_SECONDS = float(os.environ.get("SUPERSEDE_WINDOW_SECONDS", "120"))
+# builds in flight at once on the asyncio pipeline (they mostly wait on I/O)
+ASYNC_BUILD_CONCURRENCY = int(os.environ.get("ASYNC_BUILD_CONCURRENCY", "32"))
+
+# Priority lanes, highest first: synchronous (wait_for_result) requests, round-2+
+# revisions, and everything else. Workers take from the lanes in proportion to
+# their weights, so the bulk lane slows down under load but is never starved.
+LANES = ("interactive", "revision", "bulk")
+
+
+def _weights(spec, default):
+    weights = dict(default)
+    for item in spec.split(","):
+        name, _, weight = item.strip().rpartition("=")
+        if name:
+            try:
+                weights[name] = max(0.01, float(weight))
+            except ValueError:
+                logger.warning("ignoring bad weight %r", item)
+    return weights
+
+
+LANE_WEIGHTS = _weights(os.environ.get("BUILD_LANE_WEIGHTS", ""), {"interactive": 6, "revision": 3, "bulk": 1})
+# "email=weight,...": submitters with a larger share of the workers (default 1)
+SUBMITTER_WEIGHTS = _weights(os.environ.get("SUBMITTER_WEIGHTS", ""), {})
+# bulk jobs are refused once the queue is this full, keeping room for the other lanes
+BULK_QUEUE_FRACTION = float(os.environ.get("BULK_QUEUE_FRACTION", "0.75"))
+
+
+class QueueFull(RuntimeError):
+    """Raised by BuildQueue.submit when no more work can be accepted.
+
+    `retry_after` is a rough estimate (seconds) of when a slot should free up.
+    """
+
+    def __init__(self, retry_after, message="build queue is full"):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class SubmitterLimited(QueueFull):
+    """Raised when a submitter has too many builds in flight or submits too fast."""
+
+
+def _too_many(retry_after, max_active):
+    # one of the submitter's builds should finish in about a build's time
+    return SubmitterLimited(retry_after, f"too many builds in progress for this submitter (limit {max_active})")
+
+
+class Job(Future):
+    """A queued build. Behaves like a concurrent.futures.Future."""
+
+    def __init__(self, target, args, kwargs):
+        super().__init__()
+        self.id = uuid.uuid4().hex
+        self.target = target
+        self.args = args
+        self.kwargs = kwargs
+        self.submitted_at = time.time()
+        self.key = None
+        self.group = None
+        self.order = None
+        self.lane = "bulk"
+        self.submitter = None
+        # jobs this one replaced (see BuildQueue.submit_keyed)
+        self.superseded = []
+
+
+def lane_capacity(maxsize, lane):
+    """Queued jobs at which a job for lane is refused."""
+    if lane == "bulk":
+        return max(1, int(maxsize * BULK_QUEUE_FRACTION))
+    return maxsize
+
+
+def _pick(credit, weights):
+    """Smooth weighted round robin: return the key of `credit` whose turn it is."""
+    total = 0
+    for key in credit:
+        credit[key] += weights(key)
+        total += weights(key)
+    best = max(credit, key=credit.get)
+    credit[best] -= total
+    return best
+
+
+class FairQueue:
+    """Queued jobs, taken by weighted round robin over lanes, then over submitters.
+
+    Each (lane, submitter) pair has its own FIFO. popleft() picks a lane in
+    proportion to LANE_WEIGHTS among the non-empty lanes, then a submitter in
+    proportion to SUBMITTER_WEIGHTS among those waiting in that lane, so a
+    single submitter's flood cannot hold up anyone else's builds.
+    """
+
+    def __init__(self):
+        self._lanes = {lane: OrderedDict() for lane in LANES}  # lane -> submitter -> deque of jobs
+        self._lane_credit = {}
+        self._credit = {lane: {} for lane in LANES}
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for subs in self._lanes.values():
+            for jobs in subs.values():
+                yield from jobs
+
+    def count(self, lane):
+        return sum(len(jobs) for jobs in self._lanes[lane].values())
+
+    def queued_by(self, submitter):
+        return sum(len(subs.get(submitter, ())) for subs in self._lanes.values())
+
+    def append(self, job):
+        self._lanes[job.lane].setdefault(job.submitter, deque()).append(job)
+        self._lane_credit.setdefault(job.lane, 0)
+        self._credit[job.lane].setdefault(job.submitter, 0)
+        self._len += 1
+
+    def remove(self, job):
+        for lane, subs in self._lanes.items():
+            jobs = subs.get(job.submitter)
+            if jobs is not None and job in jobs:
+                jobs.remove(job)
+                self._len -= 1
+                self._prune(lane, job.submitter)
+                return
+        raise ValueError("job is not queued")
+
+    def popleft(self):
+        if not self._len:
+            raise IndexError("pop from an empty queue")
+        lane = _pick(self._lane_credit, LANE_WEIGHTS.get)
+        submitter = _pick(self._credit[lane], lambda s: SUBMITTER_WEIGHTS.get(s, 1))
+        job = self._lanes[lane][submitter].popleft()
+        self._len -= 1
+        self._prune(lane, submitter)
+        return job
+
+    def _prune(self, lane, submitter):
+        # an emptied FIFO drops out of the rotation, and so does its credit
+        if not self._lanes[lane][submitter]:
+            del self._lanes[lane][submitter]
+            del self._credit[lane][submitter]
+            if not self._lanes[lane]:
+                del self._lane_credit[lane]
+
+    def index(self, job):
+        """Return how many jobs will be taken before job if nothing else is queued."""
+        sim = FairQueue.__new__(FairQueue)
+        sim._lanes = {lane: OrderedDict((s, deque(j)) for s, j in subs.items()) for lane, subs in self._lanes.items()}
+        sim._lane_credit = dict(self._lane_credit)
+        sim._credit = {lane: dict(c) for lane, c in self._credit.items()}
+        sim._len = self._len
+        for i in range(self._len):
+            if sim.popleft() is job:
+                return i
+        raise ValueError("job is not queued")
+
+
+class BuildQueue:
+    """Fixed-size worker pool fed by a bounded, fair queue.
+
+    Unlike ThreadPoolExecutor the queue is bounded (submit raises QueueFull
+    instead of growing forever) and reports each job's position so callers can
+    surface it to clients. Jobs are taken by lane and submitter (see FairQueue).
+    Workers are started lazily on first submit.
+    """
+
+    def __init__(self, workers=BUILD_WORKERS, maxsize=BUILD_QUEUE_SIZE, supersede_window=SUPERSEDE_WINDOW_SECONDS):
+        self.workers = max(1, workers)
+        self.maxsize = max(1, maxsize)
+        self.supersede_window = supersede_window
+        self._pending = FairQueue()
+        self._by_key = {}  # idempotency key -> queued or running Job
+        self._running_by = {}  # submitter -> running jobs
+        self._cond = threading.Condition()
+        self._threads = []
+        self._running = 0
+        # moving average of build duration, used for Retry-After estimates
+        self._avg_duration = 60.0
+
+    def _ensure_workers(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"build-worker-{i}")
+            t.daemon = True
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, target, *args, **kwargs):
+        """Queue `target(*args, **kwargs)` and return its Job.
+
+        The returned job has `position` (1-based place in the queue) and
+        `queue_depth` attributes captured at submit time.
+        """
+        job = Job(target, args, kwargs)
+        with self._cond:
+            self._enqueue(job)
+        return job
+
+    def submit_keyed(self, key, target, *args, group=None, order=None, lane="bulk", submitter=None,
+                     on_created=None, max_active=0):
+        """Like submit, but idempotent on `key`. Returns (job, created).
+
+        If a job with the same key is still queued or running it is returned
+        with created=False and nothing new is queued. When `group` and `order`
+        are given (e.g. (email, task) and round), queued jobs of the same group
+        with a lower order submitted within the supersede window are cancelled
+        and listed in the new job's `superseded` attribute. `lane` and
+        `submitter` decide when the job runs (see FairQueue). `on_created` is
+        called only for a new job that fits in the queue, before any worker
+        can start it. A new job is refused with SubmitterLimited if submitter
+        already has `max_active` jobs queued or running (0 disables); the
+        count and the insert happen under one lock.
+        """
+        with self._cond:
+            existing = self._by_key.get(key)
+            if existing is not None:
+                return existing, False
+            if max_active and self._pending.queued_by(submitter) + self._running_by.get(submitter, 0) >= max_active:
+                raise _too_many(self._estimate_wait(0), max_active)
+            job = Job(target, args, {})
+            job.key, job.group, job.order = key, group, order
+            job.lane = lane if lane in LANES else "bulk"
+            job.submitter = submitter
+            if group is not None and order is not None and self.supersede_window > 0:
+                cutoff = time.time() - self.supersede_window
+                for old in list(self._pending):
+                    if old.group == group and old.order is not None and old.order < order \
+                            and old.submitted_at >= cutoff:
+                        self._pending.remove(old)
+                        old.cancel()
+                        job.superseded.append(old)
+            self._enqueue(job, on_created)
+            self._by_key[key] = job
+            job.add_done_callback(self._forget)
+        return job, True
+
+    def find(self, key):
+        """Return the queued or running job for key, or None."""
+        with self._cond:
+            return self._by_key.get(key)
+
+    def _forget(self, job):
+        with self._cond:
+            if self._by_key.get(job.key) is job:
+                del self._by_key[job.key]
+
+    def _enqueue(self, job, on_created=None):
+        # caller holds self._cond
+        if len(self._pending) >= lane_capacity(self.maxsize, job.lane):
+            raise QueueFull(self._estimate_wait(len(self._pending)))
+        if on_created:
+            on_created()
+        self._ensure_workers()
+        self._pending.append(job)
+        job.position = self._pending.index(job) + 1
+        job.queue_depth = len(self._pending)
+        self._cond.notify()
+
+    def position(self, job):
+        """Return the current 1-based queue position of job, or 0 if it is no longer queued."""
+        with self._cond:
+            try:
+                return self._pending.index(job) + 1
+            except ValueError:
+                return 0
+
+    def active(self, submitter):
+        """Return how many of submitter's jobs are queued or running."""
+        with self._cond:
+            return self._pending.queued_by(submitter) + self._running_by.get(submitter, 0)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "workers": self.workers,
+                "running": self._running,
+                "queued": len(self._pending),
+                "capacity": self.maxsize,
+                "lanes": {lane: self._pending.count(lane) for lane in LANES},
+            }
+
+    def estimate_wait(self, depth=None):
+        """Rough seconds until a job queued behind `depth` others (default: the whole queue) starts."""
+        with self._cond:
+            return self._estimate_wait(len(self._pending) if depth is None else depth)
+
+    def _estimate_wait(self, depth):
+        return max(1, int(self._avg_duration * (depth / self.workers + 1)))
+
+    def _started(self, job):
+        # caller holds self._cond
+        self._running += 1
+        self._running_by[job.submitter] = self._running_by.get(job.submitter, 0) + 1
+
+    def _stopped(self, job, elapsed):
+        with self._cond:
+            self._running -= 1
+            n = self._running_by.pop(job.submitter) - 1
+            if n:
+                self._running_by[job.submitter] = n
+            self._avg_duration = 0.8 * self._avg_duration + 0.2 * elapsed
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                job = self._pending.popleft()
+                self._started(job)
+            started = time.time()
+            try:
+                if job.set_running_or_notify_cancel():
+                    try:
+                        job.set_result(job.target(*job.args, **job.kwargs))
+                    except BaseException as e:
+                        logger.exception("build job %s failed", job.id)
+                        job.set_exception(e)
+            finally:
+                self._stopped(job, time.time() - started)
+
+
+class AsyncBuildQueue(BuildQueue):
+    """BuildQueue whose targets are coroutine functions run on one event loop thread.
+
+    Queueing, idempotency, superseding and QueueFull behave exactly as in
+    BuildQueue, and jobs are still concurrent Futures, but `workers` is the
+    number of builds in flight on the loop rather than a thread count.
+    """
+
+    def __init__(self, workers=ASYNC_BUILD_CONCURRENCY, maxsize=BUILD_QUEUE_SIZE,
+                 supersede_window=SUPERSEDE_WINDOW_SECONDS):
+        super().__init__(workers, maxsize, supersede_window)
+        self._loop = None
+        self._wakeup = None
+
+    def _ensure_workers(self):
+        # caller holds self._cond
+        if self._loop is not None:
+            return
+        self._loop = asyncio.new_event_loop()
+        self._wakeup = asyncio.Event()
+        for _ in range(self.workers):
+            self._loop.call_soon_threadsafe(self._loop.create_task, self._async_worker())
+        t = threading.Thread(target=self._loop.run_forever, name="async-build-loop")
+        t.daemon = True
+        t.start()
+        self._threads.append(t)
+
+    def _enqueue(self, job, on_created=None):
+        super()._enqueue(job, on_created)
+        self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _next(self):
+        with self._cond:
+            if not self._pending:
+                return None
+            job = self._pending.popleft()
+            self._started(job)
+            return job
+
+    async def _async_worker(self):
+        while True:
+            job = self._next()
+            if job is None:
+                self._wakeup.clear()
+                # re-check: a job may have been queued before the clear
+                job = self._next()
+                if job is None:
+                    await self._wakeup.wait()
+                    continue
+            started = time.time()
+            try:
+                if job.set_running_or_notify_cancel():
+                    try:
+                        job.set_result(await job.target(*job.args, **job.kwargs))
+                    except BaseException as e:
+                        logger.exception("build job %s failed", job.id)
+                        job.set_exception(e)
+            finally:
+                self._stopped(job, time.time() - started)
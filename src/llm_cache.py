@@ -0,0 +1,210 @@
+import os
+import json
+import asyncio
+import hashlib
+import logging
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_DIR = os.environ.get(
+    "LLM_CACHE_DIR", os.path.join(tempfile.gettempdir(), "llm-deploy", "llm-cache")
+)
+# 0 disables the disk cache; single-flight coalescing still applies
+LLM_CACHE_MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# eviction trims the cache to this fraction of max_bytes, so the next one is many writes away
+_LOW_WATER = 0.9
+
+
+def cache_key(**parts):
+    """Return a stable content hash for the given request parts."""
+    blob = json.dumps(parts, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class LLMCache:
+    """Disk-backed, content-addressed cache of generated file sets.
+
+    Entries are JSON files named by key; reading one bumps its mtime so the
+    size-based eviction drops the least recently used first. Writes keep a
+    running total of the cache size, and the directory is only scanned when
+    that total crosses max_bytes (and once, to start the total). get_or_compute
+    also coalesces concurrent identical requests: only the first caller runs
+    `compute`, the rest wait for its result.
+    """
+
+    def __init__(self, root=LLM_CACHE_DIR, max_bytes=LLM_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._flights = {}
+        self._async_flights = {}
+        self._lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+        self._bytes = None  # running size of the cache; None until evict() has measured it
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0}
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key + ".json")
+
+    def get(self, key):
+        if not self.max_bytes:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)
+            return value
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, value):
+        if not self.max_bytes:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(value, f)
+            os.replace(tmp, path)
+        except Exception:
+            os.unlink(tmp)
+            raise
+        size = os.path.getsize(path)
+        with self._lock:
+            if self._bytes is not None:
+                self._bytes += size - replaced
+            over = self._bytes is None or self._bytes > self.max_bytes
+        if over:
+            self.evict()
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is not None:
+            with self._lock:
+                self.stats["hits"] += 1
+            return value
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.stats["misses"] += 1
+            else:
+                self.stats["coalesced"] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = compute()
+            try:
+                self.put(key, flight.result)
+            except Exception:
+                logger.exception("could not write LLM cache entry %s", key)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    async def aget_or_compute(self, key, compute):
+        """Coroutine version of get_or_compute; `compute` is a coroutine function.
+
+        Concurrent identical requests on the same event loop share one call, and
+        wait for an identical get_or_compute already running in a thread.
+        """
+        value = self.get(key)
+        if value is not None:
+            with self._lock:
+                self.stats["hits"] += 1
+            return value
+
+        with self._lock:
+            # also join a computation already running in a thread (e.g. a batch prefetch)
+            thread_flight = self._flights.get(key)
+            flight = self._async_flights.get(key)
+            leader = flight is None and thread_flight is None
+            if leader:
+                flight = self._async_flights[key] = asyncio.get_running_loop().create_future()
+                self.stats["misses"] += 1
+            else:
+                self.stats["coalesced"] += 1
+
+        if thread_flight is not None:
+            await asyncio.to_thread(thread_flight.done.wait)
+            if thread_flight.error is not None:
+                raise thread_flight.error
+            return thread_flight.result
+        if not leader:
+            return await asyncio.shield(flight)
+
+        try:
+            result = await compute()
+            try:
+                self.put(key, result)
+            except Exception:
+                logger.exception("could not write LLM cache entry %s", key)
+            flight.set_result(result)
+            return result
+        except BaseException as e:
+            flight.set_exception(e)
+            # waiters re-raise it; don't warn when there are none
+            flight.exception()
+            raise
+        finally:
+            with self._lock:
+                del self._async_flights[key]
+
+    def evict(self):
+        """Measure the cache and, if it is over max_bytes, drop least recently used entries.
+
+        The measured size (shared with other processes using the same
+        directory) replaces the running total.
+        """
+        with self._evict_lock:
+            entries = []
+            total = 0
+            for root, _, names in os.walk(self.root):
+                for name in names:
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, path))
+                    total += st.st_size
+            if total > self.max_bytes:
+                target = self.max_bytes * _LOW_WATER
+                for _, size, path in sorted(entries):
+                    if total <= target:
+                        break
+                    try:
+                        os.unlink(path)
+                        total -= size
+                    except OSError:
+                        pass
+            with self._lock:
+                self._bytes = total
+
+cache = LLMCache()
@@ -1,56 +1,322 @@
-import os
-import requests
-import json
-
-OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
-
-
-def generate_with_openai(brief, attachments):
-    """Call OpenAI Chat Completions to generate a small web app scaffold.
-
-    Returns a dict of filename -> content. Keep this simple and expect small outputs.
-    """
-    if not OPENAI_API_KEY:
-        raise RuntimeError('OPENAI_API_KEY not set')
-
-    system = (
-        "You are a code generator. Given a brief and attachments, produce a JSON object mapping filenames to file contents. "
-        "Only return the JSON object and nothing else. Files should be small and safe (no secrets)."
-    )
-
-    user = json.dumps({"brief": brief, "attachments": attachments})
-
-    url = "https://api.openai.com/v1/chat/completions"
-    headers = {
-        'Authorization': f'Bearer {OPENAI_API_KEY}',
-        'Content-Type': 'application/json'
-    }
-    payload = {
-        'model': 'gpt-4o-mini',
-        'messages': [
-            {'role': 'system', 'content': system},
-            {'role': 'user', 'content': user}
-        ],
-        'temperature': 0.2,
-        'max_tokens': 1500
-    }
-
-    r = requests.post(url, headers=headers, json=payload, timeout=30)
-    r.raise_for_status()
-    data = r.json()
-
-    # Get the assistant text
-    text = data['choices'][0]['message']['content']
-
-    # Expect the model to return pure JSON mapping filenames to contents
-    try:
-        files = json.loads(text)
-    except Exception:
-        # If the model returns code fences or surrounding text, attempt to extract JSON
-        import re
-        m = re.search(r"(\{[\s\S]*\})", text)
-        if not m:
-            raise
-        files = json.loads(m.group(1))
-
-    return files
+import os
+import requests
+import json
+import logging
+import threading
+
+from . import llm_prompt
+from .llm_cache import cache, cache_key
+from .llm_providers import OPENAI_API_KEY, MODEL, hedged, ahedged
+from .metrics import registry, stage
+
+logger = logging.getLogger(__name__)
+
+# Stream the completion and hand each file to the caller as soon as it is complete
+LLM_STREAM = os.environ.get('LLM_STREAM', 'false').lower() in ('1', 'true', 'yes')
+
+TEMPERATURE = 0.2
+SYSTEM_PROMPT = (
+    "You are a code generator. Given a brief and attachments, produce a JSON object mapping filenames to file contents. "
+    "Only return the JSON object and nothing else. Files should be small and safe (no secrets). "
+    "Attachments are described rather than included; each is saved in the repository at its \"path\"."
+)
+
+PROMPT_TOKENS = registry.histogram(
+    "llm_deploy_llm_prompt_tokens", "Prompt tokens per LLM request, estimated before sending and as reported by the API.",
+    ["source"], buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000))
+TOKENS = registry.counter(
+    "llm_deploy_llm_tokens_total", "Tokens reported by the API, by provider and prompt/completion.",
+    ["provider", "kind"])
+
+
+def generate_with_openai(brief, attachments, on_file=None):
+    """Call OpenAI Chat Completions to generate a small web app scaffold.
+
+    Returns a dict of filename -> content. Keep this simple and expect small outputs.
+    Identical requests are answered from the LLM cache, and concurrent identical
+    requests share a single upstream call.
+
+    If on_file is given it is called once per (filename, content). With LLM_STREAM
+    enabled that happens while the completion is still streaming.
+
+    A slow or failed call is hedged with a second request (see llm_providers).
+    The prompt describes attachments rather than inlining them and is kept
+    within LLM_INPUT_TOKEN_BUDGET (see llm_prompt).
+    """
+    if not OPENAI_API_KEY:
+        raise RuntimeError('OPENAI_API_KEY not set')
+
+    prompt = _build_prompt(brief, attachments)
+    emitted = {}
+
+    def emit(name, content):
+        emitted[name] = content
+        on_file(name, content)
+
+    def compute():
+        # only upstream calls are timed; cache hits never get here
+        with stage("llm"):
+            if LLM_STREAM and on_file:
+                return _hedged_stream(prompt, emit)
+            return hedged(lambda provider: _call_openai(provider, prompt))
+
+    files = cache.get_or_compute(_cache_key(prompt), compute)
+    if on_file:
+        # cache hits, coalesced waiters and non-streamed calls emit everything now
+        # (as does a hedge that won after a failed stream had written some files)
+        for name, content in files.items():
+            if emitted.get(name) != content:
+                emit(name, content)
+    return files
+
+
+class _Superseded(Exception):
+    """A hedged stream finished after the other one had started writing files."""
+
+
+def _hedged_stream(prompt, emit):
+    """Hedge a streamed completion. The first stream to produce a file is the one used."""
+    lock = threading.Lock()
+    claimed = []
+    spare = []
+
+    def attempt(provider):
+        me = object()
+
+        def gated(name, content):
+            with lock:
+                if not claimed:
+                    claimed.append(me)
+                if claimed[0] is not me:
+                    return
+            emit(name, content)
+
+        files = _call_openai_stream(provider, prompt, gated)
+        with lock:
+            if claimed and claimed[0] is not me:
+                # keep it in case the stream that is writing files fails
+                spare.append(files)
+                raise _Superseded()
+        return files
+
+    try:
+        return hedged(attempt)
+    except Exception:
+        if spare:
+            return spare[0]
+        raise
+
+
+def _build_prompt(brief, attachments):
+    prompt = llm_prompt.build(brief, attachments, SYSTEM_PROMPT)
+    if prompt.truncated:
+        logger.warning("LLM prompt cut to ~%d tokens to fit LLM_INPUT_TOKEN_BUDGET (dropped: %s)",
+                       prompt.tokens, ", ".join(prompt.truncated))
+    return prompt
+
+
+def _record_usage(provider, prompt, usage):
+    """Report the prompt's estimated size against the usage the API returned for it."""
+    PROMPT_TOKENS.observe(prompt.tokens, source="estimated")
+    if not usage:
+        logger.info("%s request: ~%d prompt tokens estimated, no usage reported", provider.name, prompt.tokens)
+        return
+    actual = usage.get('prompt_tokens') or 0
+    completion = usage.get('completion_tokens') or 0
+    PROMPT_TOKENS.observe(actual, source="reported")
+    TOKENS.inc(actual, provider=provider.name, kind="prompt")
+    TOKENS.inc(completion, provider=provider.name, kind="completion")
+    logger.info("%s request: ~%d prompt tokens estimated, %d reported, %d completion tokens",
+                provider.name, prompt.tokens, actual, completion)
+
+
+def cache_stats():
+    """Return LLM cache hit/miss/coalesced counters."""
+    return dict(cache.stats)
+
+
+for _name in ("hits", "misses", "coalesced"):
+    registry.counter(f"llm_deploy_llm_cache_{_name}_total", f"LLM cache {_name}.",
+                     function=lambda _name=_name: cache.stats[_name])
+
+
+async def agenerate_with_openai(brief, attachments, client):
+    """Coroutine version of generate_with_openai using an httpx.AsyncClient.
+
+    Shares the LLM cache with the synchronous path. The completion is not
+    streamed; callers write the returned files themselves.
+    """
+    if not OPENAI_API_KEY:
+        raise RuntimeError('OPENAI_API_KEY not set')
+    prompt = _build_prompt(brief, attachments)
+
+    async def call(provider):
+        headers, payload = _request(provider, prompt)
+        r = await client.post(provider.url, headers=headers, json=payload, timeout=provider.timeout)
+        r.raise_for_status()
+        data = r.json()
+        _record_usage(provider, prompt, data.get('usage'))
+        return _parse_files(data['choices'][0]['message']['content'])
+
+    async def compute():
+        with stage("llm"):
+            return await ahedged(call)
+
+    return await cache.aget_or_compute(_cache_key(prompt), compute)
+
+
+def _cache_key(prompt):
+    return cache_key(model=MODEL, system=SYSTEM_PROMPT, user=prompt.user, temperature=TEMPERATURE)
+
+
+def _request(provider, prompt, stream=False):
+    """Return (headers, payload) for a Chat Completions request to provider."""
+    headers = {
+        'Authorization': f'Bearer {provider.api_key}',
+        'Content-Type': 'application/json'
+    }
+    payload = {
+        'model': provider.model,
+        'messages': [
+            {'role': 'system', 'content': SYSTEM_PROMPT},
+            {'role': 'user', 'content': prompt.user}
+        ],
+        'temperature': TEMPERATURE,
+        'max_tokens': 1500
+    }
+    if stream:
+        payload['stream'] = True
+        # a final chunk carries the token usage
+        payload['stream_options'] = {'include_usage': True}
+    return headers, payload
+
+
+def _parse_files(text):
+    # Expect the model to return pure JSON mapping filenames to contents
+    try:
+        return json.loads(text)
+    except Exception:
+        # If the model returns code fences or surrounding text, attempt to extract JSON
+        import re
+        m = re.search(r"(\{[\s\S]*\})", text)
+        if not m:
+            raise
+        return json.loads(m.group(1))
+
+
+def _call_openai(provider, prompt):
+    headers, payload = _request(provider, prompt)
+    r = requests.post(provider.url, headers=headers, json=payload, timeout=provider.timeout)
+    r.raise_for_status()
+    data = r.json()
+    _record_usage(provider, prompt, data.get('usage'))
+
+    # Get the assistant text
+    text = data['choices'][0]['message']['content']
+    return _parse_files(text)
+
+
+class IncrementalFileParser:
+    """Incrementally parse a JSON object of filename -> content from streamed text.
+
+    feed() returns the (filename, content) pairs completed by the new text.
+    Anything before the first "{" (such as a code fence) is skipped. Non-string
+    values are serialized back to JSON text.
+    """
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._buf = ''
+        self._started = False
+        self._key = None
+        self._waiting_on_string = False
+        self.done = False
+
+    def feed(self, text):
+        if self.done:
+            return []
+        self._buf += text
+        # an unfinished string can only complete once a new quote arrives
+        if self._waiting_on_string and '"' not in text:
+            return []
+        self._waiting_on_string = False
+        out = []
+        buf = self._buf
+        pos = 0
+        while True:
+            if not self._started:
+                i = buf.find('{', pos)
+                if i < 0:
+                    pos = len(buf)
+                    break
+                self._started = True
+                pos = i + 1
+            while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                pos += 1
+            if pos >= len(buf):
+                break
+            if self._key is None and buf[pos] == '}':
+                self.done = True
+                pos += 1
+                break
+            try:
+                value, end = self._decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                self._waiting_on_string = buf[pos] == '"'
+                break
+            if end == len(buf) and not isinstance(value, (str, dict, list)):
+                # a number or literal may continue in the next chunk
+                break
+            if self._key is None:
+                j = end
+                while j < len(buf) and buf[j] in ' \t\r\n':
+                    j += 1
+                if j >= len(buf):
+                    break
+                if buf[j] != ':' or not isinstance(value, str):
+                    raise ValueError('expected "filename": content pair in LLM output')
+                self._key = value
+                pos = j + 1
+            else:
+                if not isinstance(value, str):
+                    value = json.dumps(value, indent=2)
+                out.append((self._key, value))
+                self._key = None
+                pos = end
+        self._buf = buf[pos:]
+        return out
+
+    def close(self):
+        if not self.done:
+            raise ValueError('LLM output ended before the JSON object was complete')
+
+
+def _call_openai_stream(provider, prompt, on_file):
+    """Streaming variant of _call_openai: files are passed to on_file as soon as each is complete."""
+    headers, payload = _request(provider, prompt, stream=True)
+
+    parser = IncrementalFileParser()
+    files = {}
+    usage = None
+    with requests.post(provider.url, headers=headers, json=payload, timeout=provider.timeout, stream=True) as r:
+        r.raise_for_status()
+        for line in r.iter_lines(decode_unicode=True):
+            # server-sent events: "data: {json chunk}" lines, terminated by "data: [DONE]"
+            if not line or not line.startswith('data:'):
+                continue
+            data = line[5:].strip()
+            if data == '[DONE]':
+                break
+            chunk = json.loads(data)
+            usage = chunk.get('usage') or usage
+            choices = chunk.get('choices') or [{}]
+            text = (choices[0].get('delta') or {}).get('content')
+            if not text:
+                continue
+            # keep reading after the object is complete: the usage chunk comes last
+            for name, content in parser.feed(text):
+                files[name] = content
+                on_file(name, content)
+    parser.close()
+    _record_usage(provider, prompt, usage)
+    return files
@@ -0,0 +1,177 @@
+"""Build the Chat Completions user message within an input-token budget.
+
+Attachments are described, never inlined. Each becomes {"name", "path",
+"mime", "size"}, plus what can be read cheaply from the first bytes of its
+spool file or data: URI: an image's "width" and "height", or a "preview" of
+the first LLM_PREVIEW_ROWS rows of a CSV, JSON or text file. http(s)
+attachments are downloaded during generation, so only their URL is given.
+
+If the estimated prompt exceeds LLM_INPUT_TOKEN_BUDGET, previews are dropped
+(largest first), then attachment details, then attachments past the first
+few, and finally the end of the brief. Tokens are estimated at about four
+characters each; llm_generator reports the estimate against the usage the
+API returns.
+"""
+import os
+import json
+import math
+import struct
+from collections import namedtuple
+
+from .attachments import peek
+from .metrics import registry
+
+# estimated input tokens (system + user message) allowed per request; 0 disables the limit
+LLM_INPUT_TOKEN_BUDGET = int(os.environ.get('LLM_INPUT_TOKEN_BUDGET', '8000'))
+# rows of a CSV / JSON / text attachment shown to the model
+LLM_PREVIEW_ROWS = int(os.environ.get('LLM_PREVIEW_ROWS', '5'))
+
+_CHARS_PER_TOKEN = 4
+# per-message framing the API adds around the system and user messages
+_MESSAGE_OVERHEAD = 8
+_HEAD_BYTES = 64 * 1024
+_PREVIEW_CHARS = 2000
+# attachments still listed (by name and path) once the rest are cut for the budget
+_MIN_ATTACHMENTS = 8
+_TEXT_MIMES = ('application/json', 'application/xml', 'application/javascript', 'application/x-ndjson')
+_TEXT_EXTENSIONS = ('.csv', '.tsv', '.json', '.jsonl', '.ndjson', '.txt', '.md', '.xml', '.svg', '.html', '.js', '.css')
+
+TRUNCATIONS = registry.counter(
+    "llm_deploy_llm_prompt_truncations_total", "Prompts cut to fit LLM_INPUT_TOKEN_BUDGET, by what was cut.",
+    ["part"])
+
+Prompt = namedtuple("Prompt", "user tokens truncated")
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / _CHARS_PER_TOKEN)
+
+
+def _image_size(head):
+    """Return (width, height) from a PNG, GIF or JPEG header, or None."""
+    if head[:8] == b'\x89PNG\r\n\x1a\n' and len(head) >= 24:
+        return struct.unpack('>II', head[16:24])
+    if head[:6] in (b'GIF87a', b'GIF89a') and len(head) >= 10:
+        return struct.unpack('<HH', head[6:10])
+    if head[:2] == b'\xff\xd8':
+        i = 2
+        while i + 9 <= len(head) and head[i] == 0xFF:
+            marker = head[i + 1]
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                h, w = struct.unpack('>HH', head[i + 5:i + 9])
+                return w, h
+            i += 2 + struct.unpack('>H', head[i + 2:i + 4])[0]
+    return None
+
+
+def _is_text(mime, name):
+    return (mime or '').startswith('text/') or mime in _TEXT_MIMES or mime == 'image/svg+xml' \
+        or (name or '').lower().endswith(_TEXT_EXTENSIONS)
+
+
+def _json_preview(text):
+    data = json.loads(text)
+    if isinstance(data, list):
+        return {"rows": len(data), "preview": data[:LLM_PREVIEW_ROWS]}
+    if isinstance(data, dict):
+        # one level deep: long arrays inside the object are cut to the first rows too
+        return {"keys": len(data), "preview": {
+            k: v[:LLM_PREVIEW_ROWS] if isinstance(v, list) else v for k, v in list(data.items())[:20]}}
+    return {"preview": data}
+
+
+def _inspect(mime, name, size, head):
+    """Return the details of an attachment that can be read from its first bytes."""
+    dims = _image_size(head)
+    if dims:
+        return {"width": dims[0], "height": dims[1]}
+    if not _is_text(mime, name):
+        return {}
+    complete = size is not None and len(head) >= size
+    text = head.decode('utf-8', errors='replace')
+    lower = (name or '').lower()
+    if complete and (mime == 'application/json' or lower.endswith('.json')):
+        try:
+            info = _json_preview(text)
+            if len(json.dumps(info["preview"])) <= _PREVIEW_CHARS:
+                return info
+        except ValueError:
+            pass
+    lines = text.splitlines()
+    if not complete:
+        # the last line may have been cut off by the read
+        lines = lines[:-1]
+    is_csv = mime in ('text/csv', 'text/tab-separated-values') or lower.endswith(('.csv', '.tsv'))
+    # header plus rows for a table, the first lines for anything else
+    info = {"preview": '\n'.join(lines[:LLM_PREVIEW_ROWS + is_csv])[:_PREVIEW_CHARS]}
+    if complete and is_csv:
+        info["rows"] = max(0, len(lines) - 1)
+    return info
+
+
+def describe(attachment):
+    """Return the prompt descriptor for one attachment (see the module docstring)."""
+    name = attachment.get("name")
+    d = {"name": name}
+    if name:
+        # where generator.generate_app saves it in the repo
+        d["path"] = f"assets/{name}"
+    peeked = peek(attachment, _HEAD_BYTES)
+    if peeked is not None:
+        mime, size, head = peeked
+        d["mime"] = mime
+        d["size"] = size
+        d.update(_inspect(mime, name, size, head))
+    elif attachment.get("url"):
+        d["url"] = attachment["url"]
+    return d
+
+
+def build(brief, attachments, system='', budget=LLM_INPUT_TOKEN_BUDGET):
+    """Return Prompt(user, tokens, truncated) for brief and attachments.
+
+    `tokens` is the estimated size of system plus the user message;
+    `truncated` lists what was cut to bring it within budget.
+    """
+    described = [describe(a) for a in attachments or []]
+    extra = {}
+    fixed = estimate_tokens(system) + _MESSAGE_OVERHEAD
+    truncated = []
+
+    def render():
+        return json.dumps(dict({"brief": brief, "attachments": described}, **extra), ensure_ascii=False)
+
+    def fits():
+        return not budget or fixed + estimate_tokens(render()) <= budget
+
+    def cut(part):
+        truncated.append(part)
+        TRUNCATIONS.inc(part=part)
+
+    if not fits():
+        # previews first, largest first: they are the least essential
+        with_preview = sorted((d for d in described if "preview" in d), key=lambda d: -len(json.dumps(d["preview"])))
+        for d in with_preview:
+            del d["preview"]
+            if fits():
+                break
+        if with_preview:
+            cut("previews")
+    if not fits() and any(len(d) > 2 for d in described):
+        described = [{"name": d["name"], "path": d["path"]} if d.get("name") else d for d in described]
+        cut("attachment_details")
+    if not fits() and len(described) > _MIN_ATTACHMENTS:
+        extra["attachments_omitted"] = len(described) - _MIN_ATTACHMENTS
+        described = described[:_MIN_ATTACHMENTS]
+        cut("attachments")
+    if not fits():
+        full = brief
+        keep = len(full)
+        while not fits() and keep:
+            # JSON escaping can make the rendered brief longer than its text, so recheck
+            over = fixed + estimate_tokens(render()) - budget
+            keep = max(0, keep - over * _CHARS_PER_TOKEN)
+            brief = full[:keep] + f"\n[brief truncated: {len(full) - keep} characters omitted]"
+        cut("brief")
+    user = render()
+    return Prompt(user, fixed + estimate_tokens(user), truncated)
@@ -0,0 +1,190 @@
+"""Chat Completions providers with hedged and fallback requests.
+
+`hedged(attempt)` runs attempt(provider) against the primary provider. If it
+has not answered within the hedge delay (a percentile of the primary's
+recent latencies) or fails, the same request goes to the fallback provider
+(or the primary again if none is configured). The first successful answer
+wins; the other request is cancelled (async) or abandoned (threads). A
+request the API rejected (4xx other than 408/429) is not sent again.
+
+The fallback is configured with LLM_FALLBACK_API_URL / _MODEL / _API_KEY,
+each defaulting to the primary's. Without LLM_FALLBACK_API_URL hedging is off
+unless LLM_HEDGE_PERCENTILE is set, since every hedge would be a second paid
+request to the same endpoint. Per-provider latencies are exported as
+llm_deploy_llm_request_seconds to tune LLM_HEDGE_PERCENTILE.
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
+OPENAI_API_URL = os.environ.get('OPENAI_API_URL', 'https://api.openai.com/v1/chat/completions')
+MODEL = 'gpt-4o-mini'
+LLM_TIMEOUT = float(os.environ.get('LLM_TIMEOUT', '30'))
+
+LLM_FALLBACK_API_URL = os.environ.get('LLM_FALLBACK_API_URL')
+LLM_FALLBACK_MODEL = os.environ.get('LLM_FALLBACK_MODEL')
+LLM_FALLBACK_API_KEY = os.environ.get('LLM_FALLBACK_API_KEY')
+# hedge once the primary is slower than this percentile of its recent calls; 0 disables hedging.
+# Off by default when there is no separate fallback endpoint to hedge against.
+LLM_HEDGE_PERCENTILE = float(os.environ.get('LLM_HEDGE_PERCENTILE', '95' if LLM_FALLBACK_API_URL else '0'))
+# hedge delay until enough latencies have been seen, and its lower bound afterwards
+LLM_HEDGE_INITIAL_SECONDS = float(os.environ.get('LLM_HEDGE_INITIAL_SECONDS', '10'))
+LLM_HEDGE_MIN_SECONDS = float(os.environ.get('LLM_HEDGE_MIN_SECONDS', '1'))
+# latencies kept per provider for the percentile, and how many are needed before it is used
+_WINDOW = 200
+_MIN_SAMPLES = 20
+
+REQUEST_SECONDS = registry.histogram(
+    "llm_deploy_llm_request_seconds", "Chat Completions request time, by provider and outcome.",
+    ["provider", "outcome"])
+HEDGES = registry.counter(
+    "llm_deploy_llm_hedges_total", "Second LLM requests, by why they were sent and which request won.",
+    ["reason", "winner"])
+
+
+class Provider:
+    """One Chat Completions endpoint and model, with its recent latencies."""
+
+    def __init__(self, name, url, model, api_key, timeout=LLM_TIMEOUT):
+        self.name = name
+        self.url = url
+        self.model = model
+        self.api_key = api_key
+        self.timeout = timeout
+        self._latencies = deque(maxlen=_WINDOW)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, ok):
+        REQUEST_SECONDS.observe(seconds, provider=self.name, outcome="ok" if ok else "error")
+        if ok:
+            with self._lock:
+                self._latencies.append(seconds)
+
+    def hedge_delay(self):
+        """Seconds to wait on this provider before hedging, or None if hedging is off."""
+        if LLM_HEDGE_PERCENTILE <= 0:
+            return None
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < _MIN_SAMPLES:
+            return LLM_HEDGE_INITIAL_SECONDS
+        k = min(len(samples) - 1, int(len(samples) * LLM_HEDGE_PERCENTILE / 100))
+        return max(LLM_HEDGE_MIN_SECONDS, samples[k])
+
+
+primary = Provider("primary", OPENAI_API_URL, MODEL, OPENAI_API_KEY)
+if LLM_FALLBACK_API_URL or LLM_FALLBACK_MODEL:
+    fallback = Provider("fallback", LLM_FALLBACK_API_URL or OPENAI_API_URL,
+                        LLM_FALLBACK_MODEL or MODEL, LLM_FALLBACK_API_KEY or OPENAI_API_KEY)
+else:
+    # hedge with a second request to the same endpoint
+    fallback = primary
+
+
+def _retryable(exc):
+    """False for errors another request would only repeat: 4xx responses other than 408 and 429."""
+    # requests.HTTPError and httpx.HTTPStatusError both carry the response
+    status = getattr(getattr(exc, "response", None), "status_code", None)
+    if isinstance(status, int) and 400 <= status < 500:
+        return status in (408, 429)
+    return True
+
+
+def _timed(provider, attempt):
+    start = time.perf_counter()
+    try:
+        result = attempt(provider)
+    except BaseException:
+        provider.observe(time.perf_counter() - start, False)
+        raise
+    provider.observe(time.perf_counter() - start, True)
+    return result
+
+
+def _start(provider, attempt):
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(_timed(provider, attempt))
+        except BaseException as e:
+            future.set_exception(e)
+
+    # a thread per request: an abandoned loser must not hold up anyone else's request
+    threading.Thread(target=run, name=f"llm-{provider.name}", daemon=True).start()
+    return future
+
+
+def hedged(attempt):
+    """Return attempt(provider) from whichever of primary and fallback answers first."""
+    delay = primary.hedge_delay()
+    if delay is None:
+        return _timed(primary, attempt)
+    first = _start(primary, attempt)
+    done, _ = wait([first], timeout=delay)
+    if done and (first.exception() is None or not _retryable(first.exception())):
+        return first.result()
+    reason = "error" if done else "slow"
+    logger.info("primary LLM request %s, sending it to %s", "failed" if done else f"slower than {delay:.1f}s", fallback.name)
+    second = _start(fallback, attempt)
+    pending = {second} if done else {first, second}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                HEDGES.inc(reason=reason, winner="first" if future is first else "second")
+                return future.result()
+    HEDGES.inc(reason=reason, winner="none")
+    raise second.exception()
+
+
+async def _atimed(provider, attempt):
+    start = time.perf_counter()
+    try:
+        result = await attempt(provider)
+    except asyncio.CancelledError:
+        raise
+    except BaseException:
+        provider.observe(time.perf_counter() - start, False)
+        raise
+    provider.observe(time.perf_counter() - start, True)
+    return result
+
+
+async def ahedged(attempt):
+    """Coroutine version of hedged(); attempt(provider) is a coroutine function and the loser is cancelled."""
+    delay = primary.hedge_delay()
+    if delay is None:
+        return await _atimed(primary, attempt)
+    first = asyncio.ensure_future(_atimed(primary, attempt))
+    tasks = [first]
+    try:
+        done, _ = await asyncio.wait([first], timeout=delay)
+        if done and (first.exception() is None or not _retryable(first.exception())):
+            return first.result()
+        reason = "error" if done else "slow"
+        logger.info("primary LLM request %s, sending it to %s", "failed" if done else f"slower than {delay:.1f}s", fallback.name)
+        second = asyncio.ensure_future(_atimed(fallback, attempt))
+        tasks.append(second)
+        pending = {second} if done else {first, second}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    HEDGES.inc(reason=reason, winner="first" if task is first else "second")
+                    return task.result()
+        HEDGES.inc(reason=reason, winner="none")
+        raise second.exception()
+    finally:
+        # the loser, or both if we were cancelled ourselves
+        for task in tasks:
+            task.cancel()
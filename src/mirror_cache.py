@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import shutil
+import logging
+import tempfile
+import threading
+import subprocess
+from contextlib import contextmanager, nullcontext
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MIRROR_CACHE_DIR = os.environ.get(
+    "MIRROR_CACHE_DIR", os.path.join(tempfile.gettempdir(), "llm-deploy", "mirrors")
+)
+MIRROR_CACHE_MAX_BYTES = int(os.environ.get("MIRROR_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+
+def _git(args, cwd=None):
+    subprocess.run(["git"] + args, cwd=cwd, check=True, stdout=subprocess.DEVNULL)
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class MirrorCache:
+    """On-disk cache of bare mirrors keyed by owner/repo.
+
+    The first checkout of a repo makes a `git clone --mirror`; later ones only
+    fetch what changed. Working copies are `--shared` clones of the mirror, so
+    objects are borrowed rather than copied. A per-repo lock (also a file lock
+    where fcntl is available) is held for the whole checkout so concurrent
+    rounds of the same task run one after another. Least recently used
+    mirrors are evicted once the cache exceeds max_bytes.
+
+    Mirror sizes and last-use times live in index.json under root. Each entry
+    is refreshed when its mirror is fetched, so eviction never has to walk
+    the whole cache.
+    """
+
+    def __init__(self, root=MIRROR_CACHE_DIR, max_bytes=MIRROR_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._index_guard = threading.Lock()
+
+    def mirror_path(self, owner, repo_name):
+        return os.path.join(self.root, owner, f"{repo_name}.git")
+
+    def _lock(self, owner, repo_name):
+        key = (owner, repo_name)
+        with self._locks_guard:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.Lock()
+            return lock
+
+    @contextmanager
+    def _file_lock(self, path, blocking=True):
+        """Hold an exclusive flock on path; yield False if non-blocking and it is taken."""
+        if fcntl is None:
+            yield True
+            return
+        with open(path, "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def locked(self, owner, repo_name):
+        """Hold the per-repo lock (in-process and, if possible, across processes)."""
+        with self._lock(owner, repo_name):
+            os.makedirs(os.path.join(self.root, owner), exist_ok=True)
+            with self._file_lock(self.mirror_path(owner, repo_name) + ".lock"):
+                yield
+
+    @contextmanager
+    def _index(self):
+        """Yield the size index ({"owner/repo": {"size", "used"}}) for update; it is saved on exit."""
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, "index.json")
+        with self._index_guard, self._file_lock(path + ".lock"):
+            try:
+                with open(path) as f:
+                    index = json.load(f)
+            except (OSError, ValueError):
+                index = self._scan()
+            yield index
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(index, f)
+            os.replace(tmp, path)
+
+    def _scan(self):
+        """Rebuild the index from the mirrors on disk (first use, or a lost index)."""
+        index = {}
+        for owner in os.listdir(self.root):
+            owner_dir = os.path.join(self.root, owner)
+            if not os.path.isdir(owner_dir):
+                continue
+            for name in os.listdir(owner_dir):
+                path = os.path.join(owner_dir, name)
+                if name.endswith(".git") and os.path.isdir(path):
+                    index[f"{owner}/{name[:-4]}"] = {"size": _dir_size(path), "used": os.path.getmtime(path)}
+        return index
+
+    def _record(self, owner, repo_name):
+        """Measure one mirror after a fetch or clone and store it in the index."""
+        size = _dir_size(self.mirror_path(owner, repo_name))
+        with self._index() as index:
+            index[f"{owner}/{repo_name}"] = {"size": size, "used": time.time()}
+
+    def _update(self, owner, repo_name, remote_url):
+        """Create or incrementally fetch the mirror. Caller must hold the repo lock."""
+        path = self.mirror_path(owner, repo_name)
+        if os.path.isdir(path):
+            try:
+                # fetch from the URL directly so credentials never land in the mirror config
+                _git(["fetch", "--quiet", "--prune", remote_url, "+refs/heads/*:refs/heads/*"], cwd=path)
+                os.utime(path)
+                return path
+            except subprocess.CalledProcessError:
+                logger.warning("Fetch into mirror %s failed, re-cloning", path)
+                shutil.rmtree(path, ignore_errors=True)
+        _git(["clone", "--mirror", "--quiet", remote_url, path])
+        # drop the origin config (and the credentials in its URL); refs are kept
+        _git(["config", "--remove-section", "remote.origin"], cwd=path)
+        return path
+
+    @contextmanager
+    def checkout(self, owner, repo_name, remote_url, branch="main", network=nullcontext):
+        """Yield a temporary working copy of branch, refreshed from remote_url.
+
+        The working copy's origin points at remote_url; the repo lock is held
+        until the context exits, so push from inside the block. `network()` is
+        entered around the fetch or clone from remote_url only.
+        """
+        try:
+            with self.locked(owner, repo_name):
+                with network():
+                    mirror = self._update(owner, repo_name, remote_url)
+                self._record(owner, repo_name)
+                with tempfile.TemporaryDirectory() as tmp:
+                    workdir = os.path.join(tmp, repo_name)
+                    _git(["clone", "--quiet", "--shared", "--branch", branch, mirror, workdir])
+                    _git(["remote", "set-url", "origin", remote_url], cwd=workdir)
+                    yield workdir
+        finally:
+            # also after a failed build, so the cache never outgrows max_bytes for long
+            try:
+                self.evict()
+            except Exception:
+                logger.exception("Mirror cache eviction failed")
+
+    def evict(self):
+        """Remove least recently used mirrors until the cache fits in max_bytes."""
+        if not os.path.isdir(self.root):
+            return
+        with self._index() as index:
+            total = sum(entry["size"] for entry in index.values())
+            for key, entry in sorted(index.items(), key=lambda item: item[1]["used"]):
+                if total <= self.max_bytes:
+                    break
+                owner, _, repo_name = key.partition("/")
+                path = self.mirror_path(owner, repo_name)
+                lock = self._lock(owner, repo_name)
+                # skip mirrors that are in use right now, here or in another process
+                if not lock.acquire(blocking=False):
+                    continue
+                try:
+                    with self._file_lock(path + ".lock", blocking=False) as acquired:
+                        if not acquired:
+                            continue
+                        shutil.rmtree(path, ignore_errors=True)
+                        del index[key]
+                        total -= entry["size"]
+                        logger.info("Evicted mirror %s (%d bytes)", path, entry["size"])
+                finally:
+                    lock.release()
+
+mirrors = MirrorCache()
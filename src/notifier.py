@@ -1,19 +1,310 @@
-import time
-import requests
-import datetime
-
-
-def notify_evaluation(evaluation_url, payload, timeout_minutes=10):
-    headers = {"Content-Type": "application/json"}
-    deadline = datetime.datetime.utcnow() + datetime.timedelta(minutes=timeout_minutes)
-    delay = 1
-    while datetime.datetime.utcnow() < deadline:
-        try:
-            r = requests.post(evaluation_url, json=payload, headers=headers, timeout=10)
-            if r.status_code == 200:
-                return True
-        except Exception:
-            pass
-        time.sleep(delay)
-        delay = min(delay * 2, 60)
-    raise TimeoutError("Failed to notify evaluation URL within timeout")
+import os
+import time
+import json
+import random
+import socket
+import sqlite3
+import asyncio
+import logging
+import tempfile
+import threading
+import datetime
+import contextlib
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .metrics import NOTIFY_ATTEMPTS, NOTIFICATIONS, STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_OUTBOX_PATH = os.environ.get(
+    "NOTIFY_OUTBOX_PATH", os.path.join(tempfile.gettempdir(), "llm-deploy", "outbox.db")
+)
+NOTIFY_MAX_CONCURRENCY = int(os.environ.get("NOTIFY_MAX_CONCURRENCY", "16"))
+NOTIFY_PER_HOST_CONCURRENCY = int(os.environ.get("NOTIFY_PER_HOST_CONCURRENCY", "4"))
+
+# outbox rows are owned by the process that delivers them (several may share the outbox)
+_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _owner_alive(owner):
+    """True if owner (host:pid) may still be delivering its outbox rows."""
+    host, _, pid = (owner or "").rpartition(":")
+    if not pid.isdigit() or owner == _OWNER:
+        return False
+    if host != socket.gethostname():
+        # another machine sharing the file; its rows are not ours to take
+        return True
+    if os.name == "nt":
+        # no cheap liveness probe (os.kill would terminate the process); resume as before
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+def notify_evaluation(evaluation_url, payload, timeout_minutes=10):
+    headers = {"Content-Type": "application/json"}
+    deadline = datetime.datetime.utcnow() + datetime.timedelta(minutes=timeout_minutes)
+    delay = 1
+    while datetime.datetime.utcnow() < deadline:
+        NOTIFY_ATTEMPTS.inc()
+        try:
+            r = requests.post(evaluation_url, json=payload, headers=headers, timeout=10)
+            if r.status_code == 200:
+                return True
+        except Exception:
+            pass
+        time.sleep(delay)
+        delay = min(delay * 2, 60)
+    raise TimeoutError("Failed to notify evaluation URL within timeout")
+
+
+class NotificationDispatcher:
+    """Deliver evaluation callbacks from a single asyncio loop.
+
+    Notifications are written to a SQLite outbox before delivery is attempted,
+    so anything still pending when the process stops is resumed by the next
+    start() -- of this process, or of another one sharing the outbox once the
+    process that queued them has exited. Retries use jittered exponential backoff and sleep on the event
+    loop rather than parking a thread; HTTP calls share one keep-alive
+    connection pool and are capped per evaluation host; a host's limit is
+    dropped once nothing is being delivered to it.
+
+    `on_result(meta, delivered, error)` is called from the loop thread once a
+    notification is delivered or gives up; `meta` is the dict passed to enqueue.
+
+    A notification enqueued with `wait_for` (a Pages URL) is held until
+    `wait_live(meta, url, deadline)` -- which returns a concurrent future --
+    has finished waiting for that site. The wait is part of the outbox row, so
+    a restart during it resumes the wait rather than losing the notification.
+    """
+
+    def __init__(self, path=NOTIFY_OUTBOX_PATH, on_result=None, wait_live=None, timeout_minutes=10,
+                 max_concurrency=NOTIFY_MAX_CONCURRENCY, per_host=NOTIFY_PER_HOST_CONCURRENCY,
+                 base_delay=1.0, max_delay=60.0):
+        self.path = path
+        self.on_result = on_result
+        self.wait_live = wait_live
+        self.timeout_seconds = timeout_minutes * 60
+        self.per_host = per_host
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_concurrency, pool_maxsize=max_concurrency)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="notify")
+        self._host_limits = {}  # host -> [semaphore, deliveries using it]; loop thread only
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._db = None
+        self.metrics = {
+            "enqueued": 0,
+            "delivered": 0,
+            "failed": 0,
+            "attempts": 0,
+            "latency_seconds_sum": 0.0,
+            "latency_seconds_max": 0.0,
+        }
+
+    def _open_db(self):
+        d = os.path.dirname(self.path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                meta TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                deadline REAL NOT NULL,
+                owner TEXT,
+                wait_for TEXT,
+                wait_deadline REAL
+            )
+            """
+        )
+        columns = [r["name"] for r in db.execute("PRAGMA table_info(outbox)")]
+        for column, kind in (("owner", "TEXT"), ("wait_for", "TEXT"), ("wait_deadline", "REAL")):
+            if column not in columns:
+                db.execute(f"ALTER TABLE outbox ADD COLUMN {column} {kind}")
+        return db
+
+    def start(self):
+        """Start the loop thread and resume any notifications left in the outbox."""
+        with self._lock:
+            if self._loop is not None:
+                return
+            self._db = self._open_db()
+            self._loop = asyncio.new_event_loop()
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(ready,), name="notification-dispatcher")
+            self._thread.daemon = True
+            self._thread.start()
+            ready.wait()
+            rows = [dict(r) for r in self._db.execute("SELECT * FROM outbox ORDER BY id").fetchall()
+                    if not _owner_alive(r["owner"])]
+            for row in rows:
+                self._db.execute("UPDATE outbox SET owner = ? WHERE id = ?", (_OWNER, row["id"]))
+        for row in rows:
+            self._schedule(row)
+        if rows:
+            logger.info("resuming %d pending notifications", len(rows))
+
+    def stop(self, timeout=10):
+        """Cancel the deliveries in progress and stop the loop thread.
+
+        Their rows stay in the outbox, so the next start() (here or in another
+        process) resumes them.
+        """
+        with self._lock:
+            loop, thread = self._loop, self._thread
+        if loop is None:
+            return
+
+        async def cancel():
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(cancel(), loop).result(timeout)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        loop.close()
+        self._host_limits.clear()
+        with self._lock:
+            self._db.close()
+            self._loop = self._thread = self._db = None
+
+    def _run(self, ready):
+        asyncio.set_event_loop(self._loop)
+        self._loop.call_soon(ready.set)
+        self._loop.run_forever()
+
+    def enqueue(self, url, payload, meta=None, wait_for=None, wait_seconds=0):
+        """Persist a notification and schedule its delivery. Returns immediately.
+
+        With `wait_for`, delivery starts once wait_live has waited (up to
+        wait_seconds) for that URL to go live.
+        """
+        self.start()
+        now = time.time()
+        wait_deadline = now + wait_seconds if wait_for else None
+        with self._lock:
+            cur = self._db.execute(
+                "INSERT INTO outbox (url, payload, meta, created_at, deadline, owner, wait_for, wait_deadline)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, json.dumps(payload), json.dumps(meta), now, (wait_deadline or now) + self.timeout_seconds,
+                 _OWNER, wait_for, wait_deadline),
+            )
+            row = self._db.execute("SELECT * FROM outbox WHERE id = ?", (cur.lastrowid,)).fetchone()
+            self.metrics["enqueued"] += 1
+        self._schedule(dict(row))
+
+    def pending(self):
+        with self._lock:
+            if self._db is None:
+                return 0
+            return self._db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def _schedule(self, row):
+        asyncio.run_coroutine_threadsafe(self._deliver(row), self._loop)
+
+    @contextlib.asynccontextmanager
+    async def _host_limit(self, url):
+        host = urlsplit(url).netloc
+        entry = self._host_limits.get(host)
+        if entry is None:
+            entry = self._host_limits[host] = [asyncio.Semaphore(self.per_host), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            # only hosts with deliveries in flight are kept, so the map stays small
+            entry[1] -= 1
+            if not entry[1]:
+                del self._host_limits[host]
+
+    def _post(self, url, payload):
+        r = self._session.post(url, json=payload, headers={"Content-Type": "application/json"}, timeout=10)
+        return r.status_code
+
+    async def _deliver(self, row):
+        url = row["url"]
+        payload = json.loads(row["payload"])
+        meta = json.loads(row["meta"]) if row["meta"] else None
+        attempts = row["attempts"]
+        error = None
+        if row.get("wait_for"):
+            await self._wait_live(row, meta)
+        while time.time() < row["deadline"]:
+            attempts += 1
+            self.metrics["attempts"] += 1
+            NOTIFY_ATTEMPTS.inc()
+            try:
+                async with self._host_limit(url):
+                    status = await self._loop.run_in_executor(self._executor, self._post, url, payload)
+                if status == 200:
+                    self._finish(row, meta, attempts, None)
+                    return
+                error = f"HTTP {status}"
+            except Exception as e:
+                error = str(e)
+            with self._lock:
+                self._db.execute("UPDATE outbox SET attempts = ? WHERE id = ?", (attempts, row["id"]))
+            # full jitter keeps many retries to the same evaluator from synchronizing
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempts))
+            await asyncio.sleep(min(delay, max(0.0, row["deadline"] - time.time())))
+        self._finish(row, meta, attempts, error or "timed out")
+
+    async def _wait_live(self, row, meta):
+        if self.wait_live:
+            try:
+                await asyncio.wrap_future(self.wait_live(meta, row["wait_for"], row["wait_deadline"]))
+            except Exception:
+                logger.exception("waiting for %s failed; notifying anyway", row["wait_for"])
+        # the wait is over (live or timed out); a restart from here goes straight to delivery,
+        # and delivery latency is measured from now
+        row["created_at"] = time.time()
+        with self._lock:
+            self._db.execute("UPDATE outbox SET wait_for = NULL, created_at = ? WHERE id = ?",
+                             (row["created_at"], row["id"]))
+
+    def _finish(self, row, meta, attempts, error):
+        with self._lock:
+            self._db.execute("DELETE FROM outbox WHERE id = ?", (row["id"],))
+            if error is None:
+                latency = time.time() - row["created_at"]
+                self.metrics["delivered"] += 1
+                self.metrics["latency_seconds_sum"] += latency
+                self.metrics["latency_seconds_max"] = max(self.metrics["latency_seconds_max"], latency)
+                STAGE_SECONDS.observe(latency, stage="notify")
+            else:
+                self.metrics["failed"] += 1
+        NOTIFICATIONS.inc(outcome="delivered" if error is None else "failed")
+        if error is None:
+            logger.info("delivered notification to %s after %d attempt(s)", row["url"], attempts)
+        else:
+            logger.error("giving up notifying %s after %d attempt(s): %s", row["url"], attempts, error)
+        if self.on_result:
+            try:
+                self.on_result(meta, error is None, error)
+            except Exception:
+                logger.exception("notification result hook failed")
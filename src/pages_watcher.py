@@ -0,0 +1,100 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .http_client import client as http
+from .metrics import STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+PAGES_TIMEOUT_SECONDS = int(os.environ.get("PAGES_TIMEOUT_SECONDS", "300"))
+PAGES_MIN_INTERVAL = float(os.environ.get("PAGES_MIN_INTERVAL", "2"))
+PAGES_MAX_INTERVAL = float(os.environ.get("PAGES_MAX_INTERVAL", "30"))
+
+
+class PagesWatcher:
+    """Wait for GitHub Pages sites to go live without holding a build worker.
+
+    All pending deployments are tracked as coroutines on one asyncio loop
+    thread. Each is probed with a HEAD request, starting at min_interval and
+    backing off towards max_interval (Pages builds usually finish within the
+    first minute or two, so early probes are the ones worth spending).
+
+    watch() returns a concurrent.futures.Future resolving to True once the
+    site answers 200, or False after timeout_seconds (or at `deadline`, a
+    time.time() value, for a wait resumed after a restart). The optional
+    callback is invoked with the same value from the loop thread.
+    """
+
+    def __init__(self, timeout_seconds=PAGES_TIMEOUT_SECONDS, min_interval=PAGES_MIN_INTERVAL,
+                 max_interval=PAGES_MAX_INTERVAL, probe_threads=4):
+        self.timeout_seconds = timeout_seconds
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._executor = ThreadPoolExecutor(max_workers=probe_threads, thread_name_prefix="pages-probe")
+        self._loop = None
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def start(self):
+        with self._lock:
+            if self._loop is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            t = threading.Thread(target=self._loop.run_forever, name="pages-watcher")
+            t.daemon = True
+            t.start()
+
+    def watch(self, pages_url, callback=None, deadline=None):
+        self.start()
+        return asyncio.run_coroutine_threadsafe(self._watch(pages_url, callback, deadline), self._loop)
+
+    def pending(self):
+        return self._pending
+
+    def _probe(self, url):
+        r = http.head(url, timeout=5, allow_redirects=True)
+        if r.status_code == 405:
+            r = http.get(url, timeout=5)
+        return r.status_code
+
+    async def _watch(self, pages_url, callback, deadline=None):
+        self._pending += 1
+        started = time.time()
+        if deadline is None:
+            deadline = started + self.timeout_seconds
+        interval = self.min_interval
+        live = False
+        try:
+            while True:
+                try:
+                    status = await self._loop.run_in_executor(self._executor, self._probe, pages_url)
+                    if status == 200:
+                        live = True
+                        break
+                except Exception:
+                    pass
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                await asyncio.sleep(min(interval, remaining))
+                interval = min(self.max_interval, interval * 1.5)
+        finally:
+            self._pending -= 1
+            STAGE_SECONDS.observe(time.time() - started, stage="pages_wait")
+        if live:
+            logger.info("Pages live at %s after %.1fs", pages_url, time.time() - started)
+        else:
+            logger.warning("Pages at %s not live after %.0fs", pages_url, time.time() - started)
+        if callback:
+            try:
+                callback(live)
+            except Exception:
+                logger.exception("pages watcher callback failed")
+        return live
+
+
+watcher = PagesWatcher()
@@ -0,0 +1,44 @@
+import asyncio
+import threading
+
+
+class ProgressBroker:
+    """Fan out build status changes to asyncio subscribers (SSE and long-poll clients).
+
+    Subscriptions are keyed by (email, task). publish() may be called from any
+    thread; events are delivered to each subscriber's loop with
+    call_soon_threadsafe. Events only wake subscribers up: they re-read the
+    result store, which stays the source of truth.
+    """
+
+    def __init__(self):
+        self._subs = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, email, task):
+        """Return an asyncio.Queue bound to the running loop that receives status events."""
+        q = asyncio.Queue()
+        with self._lock:
+            self._subs.setdefault((email, task), []).append((asyncio.get_running_loop(), q))
+        return q
+
+    def unsubscribe(self, email, task, q):
+        with self._lock:
+            subs = self._subs.get((email, task))
+            if subs is not None:
+                subs[:] = [entry for entry in subs if entry[1] is not q]
+                if not subs:
+                    del self._subs[(email, task)]
+
+    def publish(self, email, task, event):
+        with self._lock:
+            subs = list(self._subs.get((email, task), ()))
+        for loop, q in subs:
+            try:
+                loop.call_soon_threadsafe(q.put_nowait, event)
+            except RuntimeError:
+                # subscriber's loop has closed
+                pass
+
+
+broker = ProgressBroker()
@@ -0,0 +1,269 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+RESULT_STORE_PATH = os.environ.get(
+    "RESULT_STORE_PATH", os.path.join(tempfile.gettempdir(), "llm-deploy", "results.db")
+)
+RESULT_TTL_SECONDS = int(os.environ.get("RESULT_TTL_SECONDS", str(7 * 24 * 3600)))
+RESULT_MAX_ENTRIES = int(os.environ.get("RESULT_MAX_ENTRIES", "10000"))
+# reads refresh a record's LRU timestamp at most this often, so polling /result does not write
+RESULT_ACCESS_RESOLUTION = float(os.environ.get("RESULT_ACCESS_RESOLUTION", "300"))
+
+# Build lifecycle, in order. "failed" may replace any of them; a queued
+# build that is replaced by a later round becomes "superseded".
+STATUSES = ("queued", "generating", "pushing", "pages-pending", "pages-live", "notified", "failed", "superseded")
+TERMINAL_STATUSES = ("notified", "failed", "superseded")
+# a resubmission of a request in one of these states starts a new build
+RETRYABLE_STATUSES = ("failed", "superseded")
+# set while a build job holds the request; with no such job left (the process
+# running it stopped) a resubmission starts a new build as well
+BUILD_STATUSES = ("queued", "generating", "pushing")
+
+
+class MemoryResultStore:
+    """In-process result store with TTL and LRU eviction.
+
+    Records are keyed by (email, task, nonce); a secondary index keeps the
+    most recently created nonce per (email, task) so "latest" lookups do not
+    scan every key.
+    """
+
+    def __init__(self, ttl=RESULT_TTL_SECONDS, max_entries=RESULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._records = OrderedDict()  # (email, task, nonce) -> record, LRU order
+        self._by_task = {}  # (email, task) -> {nonce: created_at}
+        self._batches = OrderedDict()  # batch_id -> (items, created_at)
+        self._lock = threading.Lock()
+
+    def set_status(self, email, task, nonce, status, round=None, result=None, error=None):
+        now = time.time()
+        key = (email, task, nonce)
+        with self._lock:
+            rec = self._records.get(key)
+            if rec is None:
+                rec = {"email": email, "task": task, "nonce": nonce, "round": round,
+                       "status": status, "result": None, "error": None,
+                       "created_at": now, "updated_at": now}
+                self._records[key] = rec
+                self._by_task.setdefault((email, task), {})[nonce] = now
+            if status == "queued":
+                # a new build of the request; drop the previous attempt's outcome
+                rec["result"] = rec["error"] = None
+            rec["status"] = status
+            rec["updated_at"] = now
+            if round is not None:
+                rec["round"] = round
+            if result is not None:
+                rec["result"] = result
+            if error is not None:
+                rec["error"] = error
+            self._records.move_to_end(key)
+            self._evict(now)
+            return dict(rec)
+
+    def get(self, email, task, nonce):
+        key = (email, task, nonce)
+        with self._lock:
+            rec = self._records.get(key)
+            if rec is None or self._expired(rec, time.time()):
+                return None
+            self._records.move_to_end(key)
+            return dict(rec)
+
+    def latest(self, email, task):
+        with self._lock:
+            nonces = self._by_task.get((email, task))
+            if not nonces:
+                return None
+            # dicts keep insertion order, so the last nonce is the newest
+            nonce = next(reversed(nonces))
+        return self.get(email, task, nonce)
+
+    def put_batch(self, batch_id, items):
+        """Remember the items (dicts with email, task, nonce, ...) submitted as one batch."""
+        now = time.time()
+        with self._lock:
+            self._batches[batch_id] = (list(items), now)
+            while len(self._batches) > self.max_entries:
+                self._batches.popitem(last=False)
+            while self._batches:
+                oldest = next(iter(self._batches.values()))
+                if not (self.ttl and oldest[1] < now - self.ttl):
+                    break
+                self._batches.popitem(last=False)
+
+    def get_batch(self, batch_id):
+        with self._lock:
+            entry = self._batches.get(batch_id)
+            if entry is None or (self.ttl and entry[1] < time.time() - self.ttl):
+                return None
+            return [dict(item) for item in entry[0]]
+
+    def _expired(self, rec, now):
+        return self.ttl and rec["updated_at"] < now - self.ttl
+
+    def _remove(self, key):
+        self._records.pop(key, None)
+        email, task, nonce = key
+        nonces = self._by_task.get((email, task))
+        if nonces is not None:
+            nonces.pop(nonce, None)
+            if not nonces:
+                del self._by_task[(email, task)]
+
+    def _evict(self, now):
+        while len(self._records) > self.max_entries:
+            self._remove(next(iter(self._records)))
+        # LRU order approximates age, so expired records cluster at the front
+        for key in list(self._records):
+            if not self._expired(self._records[key], now):
+                break
+            self._remove(key)
+
+
+class SQLiteResultStore:
+    """Result store persisted in a SQLite database so results survive restarts.
+
+    Reads only write back a record's accessed_at (used for LRU eviction) once
+    it is more than access_resolution seconds old, so frequent polling of the
+    same result stays read-only.
+    """
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS results (
+        email TEXT NOT NULL,
+        task TEXT NOT NULL,
+        nonce TEXT NOT NULL,
+        round INTEGER,
+        status TEXT NOT NULL,
+        result TEXT,
+        error TEXT,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL,
+        accessed_at REAL NOT NULL,
+        PRIMARY KEY (email, task, nonce)
+    );
+    CREATE INDEX IF NOT EXISTS results_latest ON results (email, task, created_at);
+    CREATE INDEX IF NOT EXISTS results_updated ON results (updated_at);
+    CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed_at);
+    CREATE TABLE IF NOT EXISTS batches (
+        batch_id TEXT PRIMARY KEY,
+        items TEXT NOT NULL,
+        created_at REAL NOT NULL
+    );
+    """
+
+    # run eviction every N writes rather than on each one
+    EVICT_EVERY = 100
+
+    def __init__(self, path=RESULT_STORE_PATH, ttl=RESULT_TTL_SECONDS, max_entries=RESULT_MAX_ENTRIES,
+                 access_resolution=RESULT_ACCESS_RESOLUTION):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.access_resolution = access_resolution
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(self._SCHEMA)
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def set_status(self, email, task, nonce, status, round=None, result=None, error=None):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO results (email, task, nonce, round, status, result, error, created_at, updated_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (email, task, nonce) DO UPDATE SET
+                    status = excluded.status,
+                    round = COALESCE(excluded.round, round),
+                    -- "queued" starts a new build, so the previous attempt's outcome is dropped
+                    result = CASE WHEN excluded.status = 'queued' THEN excluded.result
+                                  ELSE COALESCE(excluded.result, result) END,
+                    error = CASE WHEN excluded.status = 'queued' THEN excluded.error
+                                 ELSE COALESCE(excluded.error, error) END,
+                    updated_at = excluded.updated_at,
+                    accessed_at = excluded.accessed_at
+                """,
+                (email, task, nonce, round, status,
+                 json.dumps(result) if result is not None else None, error, now, now, now),
+            )
+            self._writes += 1
+            if self._writes % self.EVICT_EVERY == 0:
+                self._evict(now)
+        return self.get(email, task, nonce)
+
+    def get(self, email, task, nonce):
+        return self._fetch("email = ? AND task = ? AND nonce = ?", (email, task, nonce))
+
+    def latest(self, email, task):
+        return self._fetch("email = ? AND task = ? ORDER BY created_at DESC LIMIT 1", (email, task))
+
+    def put_batch(self, batch_id, items):
+        """Remember the items (dicts with email, task, nonce, ...) submitted as one batch."""
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO batches (batch_id, items, created_at) VALUES (?, ?, ?)",
+                               (batch_id, json.dumps(list(items)), time.time()))
+
+    def get_batch(self, batch_id):
+        with self._lock:
+            row = self._conn.execute("SELECT items, created_at FROM batches WHERE batch_id = ?", (batch_id,)).fetchone()
+        if row is None or (self.ttl and row["created_at"] < time.time() - self.ttl):
+            return None
+        return json.loads(row["items"])
+
+    def _fetch(self, where, args):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(f"SELECT * FROM results WHERE {where}", args).fetchone()
+            if row is None:
+                return None
+            if self.ttl and row["updated_at"] < now - self.ttl:
+                return None
+            if row["accessed_at"] < now - self.access_resolution:
+                self._conn.execute(
+                    "UPDATE results SET accessed_at = ? WHERE email = ? AND task = ? AND nonce = ?",
+                    (now, row["email"], row["task"], row["nonce"]),
+                )
+        rec = dict(row)
+        rec.pop("accessed_at", None)
+        rec["result"] = json.loads(rec["result"]) if rec["result"] else None
+        return rec
+
+    def _evict(self, now):
+        if self.ttl:
+            self._conn.execute("DELETE FROM results WHERE updated_at < ?", (now - self.ttl,))
+            self._conn.execute("DELETE FROM batches WHERE created_at < ?", (now - self.ttl,))
+        count = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM results WHERE rowid IN (SELECT rowid FROM results ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+
+def open_store(path=RESULT_STORE_PATH):
+    """Return a SQLite-backed store, falling back to memory if the database can't be opened.
+
+    Set RESULT_STORE_PATH=:memory: to use the in-process store explicitly.
+    """
+    if path and path != ":memory:":
+        try:
+            return SQLiteResultStore(path)
+        except Exception:
+            logger.exception("could not open result store at %s, falling back to memory", path)
+    return MemoryResultStore()
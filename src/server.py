@@ -1,178 +1,130 @@
-import os
-import json
-import tempfile
-import threading
-from flask import Flask, request, jsonify
-from .generator import generate_app
-from .github_helper import create_repo_from_dir
-from .notifier import notify_evaluation
-from .github_helper import clone_repo_to_dir, commit_and_push, get_authenticated_user
-import sys
-
-# Optional startup check: if set to true, require a valid GitHub token at startup
-REQUIRE_GITHUB_TOKEN_ON_STARTUP = os.environ.get("REQUIRE_GITHUB_TOKEN_ON_STARTUP", "false").lower() in ("1", "true", "yes")
-if REQUIRE_GITHUB_TOKEN_ON_STARTUP:
-    try:
-        user = get_authenticated_user()
-        print(f"GitHub token validated for user: {user}")
-    except Exception as e:
-        print("GITHUB token validation failed at startup:", e)
-        sys.exit(1)
-else:
-    # Try a non-fatal check so logs show helpful info when token missing
-    try:
-        user = get_authenticated_user()
-        print(f"GitHub token present for user: {user}")
-    except Exception:
-        print("GitHub token not validated at startup (set REQUIRE_GITHUB_TOKEN_ON_STARTUP=1 to fail fast)")
-import subprocess
-
-app = Flask(__name__, static_folder='../static', static_url_path='/static')
-
-
-@app.route('/')
-def index():
-    return app.send_static_file('index.html')
-
-SHARED_SECRET = os.environ.get("secret") 
-
-
-@app.route("/api-endpoint", methods=["POST"])
-def api_endpoint():
-    body = request.get_json(force=True)
-    # Basic validation
-    required = ["email", "secret", "task", "round", "nonce", "brief", "evaluation_url"]
-    for k in required:
-        if k not in body:
-            return jsonify({"error": f"missing {k}"}), 400
-
-    if SHARED_SECRET and body.get("secret") != SHARED_SECRET:
-        return jsonify({"error": "invalid secret"}), 403
-
-    # If client requests to wait for the result (useful for testing), run build synchronously
-    wait = bool(body.get("wait_for_result", False))
-    if wait:
-        try:
-            payload, eval_payload = build_repo_payload(body)
-            # store for polling
-            try:
-                key = f"{payload.get('email')}:{payload.get('task')}:{payload.get('nonce')}"
-                RESULTS[key] = eval_payload
-            except Exception:
-                pass
-            # kick off notifier in background but do not wait for it here
-            notify_thread = threading.Thread(target=notify_evaluation, args=(body["evaluation_url"], eval_payload))
-            notify_thread.daemon = True
-            notify_thread.start()
-            return jsonify(eval_payload), 200
-        except Exception as e:
-            app.logger.exception("synchronous build failed")
-            return jsonify({"error": str(e)}), 500
-
-    # immediate response for async mode
-    resp = {"status": "accepted"}
-    thread = threading.Thread(target=handle_build, args=(body,))
-    thread.daemon = True
-    thread.start()
-
-    return jsonify(resp), 200
-
-
-# In-memory store for last results. Key: "email:task:nonce" -> payload
-RESULTS = {}
-
-
-def handle_build(body):
-    # Delegate to build_repo_payload and then notify
-    try:
-        payload, eval_payload = build_repo_payload(body)
-        # store payload for UI polling
-        key = f"{payload.get('email')}:{payload.get('task')}:{payload.get('nonce')}"
-        RESULTS[key] = eval_payload
-        notify_evaluation(body["evaluation_url"], eval_payload)
-    except Exception:
-        app.logger.exception("build failed")
-
-
-def build_repo_payload(body):
-    """Build the repo (create or update) and return the evaluation payload dict.
-
-    This function performs the same operations as the previous handle_build but returns
-    the payload instead of notifying. It does not block on notification.
-    """
-    # Create temp dir for repo source
-    with tempfile.TemporaryDirectory() as tmpdir:
-        task_name = body["task"]
-        round_num = int(body.get("round", 1))
-
-        if round_num == 1:
-            # Generate app into tmpdir
-            generate_app(body, tmpdir)
-
-            # Create github repo and push
-            repo_url, commit_sha, pages_url = create_repo_from_dir(tmpdir, task_name)
-        else:
-            # Round 2: attempt to update existing repo
-            owner = get_authenticated_user()
-            repo_name = task_name.replace(' ', '-').lower()
-            try:
-                # clone repo into tmpdir
-                clone_repo_to_dir(owner, repo_name, tmpdir)
-                # regenerate (this will overwrite files)
-                generate_app(body, tmpdir)
-                # commit and push
-                commit_and_push(tmpdir, message=f"Round {round_num} update")
-                # get new sha
-                commit_sha = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=tmpdir).decode().strip()
-                repo_url = f"https://github.com/{owner}/{repo_name}"
-                pages_url = f"https://{owner}.github.io/{repo_name}/"
-            except Exception:
-                # fallback: create a new repo if update failed
-                generate_app(body, tmpdir)
-                repo_url, commit_sha, pages_url = create_repo_from_dir(tmpdir, task_name)
-
-        payload = {
-            "email": body["email"],
-            "task": body["task"],
-            "round": body["round"],
-            "nonce": body["nonce"],
-            "repo_url": repo_url,
-            "commit_sha": commit_sha,
-            "pages_url": pages_url,
-        }
-
-        # evaluator-style payload (what graders expect)
-        eval_payload = {
-            "commit_sha": commit_sha,
-            "message": "App built and deployed successfully",
-            "pages_url": pages_url,
-            "repo_url": repo_url,
-            "round": body["round"],
-            "task": body["task"],
-        }
-
-        # store result so UI can poll for it (store evaluator payload)
-        try:
-            key = f"{payload.get('email')}:{payload.get('task')}:{payload.get('nonce')}"
-            RESULTS[key] = eval_payload
-        except Exception:
-            pass
-        return payload, eval_payload
-
-
-def get_result(email, task, nonce=None):
-    """Return stored payload for the given identifiers or None."""
-    if nonce:
-        key = f"{email}:{task}:{nonce}"
-        return RESULTS.get(key)
-    # if nonce not provided, try to find most recent matching task/email
-    prefix = f"{email}:{task}:"
-    # find last inserted matching key
-    for k in reversed(list(RESULTS.keys())):
-        if k.startswith(prefix):
-            return RESULTS.get(k)
-    return None
-
-
-if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+"""Flask front end. The build itself lives in src.build, shared with src.fastapi_app."""
+from concurrent.futures import CancelledError
+from flask import Flask, request, jsonify
+from .jobs import QueueFull
+from .metrics import registry as METRICS, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from .attachments import ingest, AttachmentError, AttachmentTooLarge, MAX_REQUEST_BODY_BYTES
+from .build import (
+    SHARED_SECRET, BUILD_QUEUE, RESULT_STORE, NOTIFIER, WARMUP, start_warm_up, submit_build,
+    accepted_response, record_status, notify_and_record, notify_when_live, handle_build,
+    build_repo_payload, get_result, get_authenticated_user, submit_batch, get_batch_status, BATCH_MAX_ITEMS,
+)
+
+# the build helpers are re-exported for callers that import them from here
+__all__ = [
+    "app", "SHARED_SECRET", "BUILD_QUEUE", "RESULT_STORE", "NOTIFIER", "WARMUP", "start_warm_up", "submit_build",
+    "accepted_response", "record_status", "notify_and_record", "notify_when_live", "handle_build",
+    "build_repo_payload", "get_result", "get_authenticated_user", "submit_batch", "get_batch_status",
+    "BATCH_MAX_ITEMS",
+]
+
+app = Flask(__name__, static_folder='../static', static_url_path='/static')
+# reject oversized bodies from Content-Length, before reading them
+app.config["MAX_CONTENT_LENGTH"] = MAX_REQUEST_BODY_BYTES
+
+
+@app.route('/')
+def index():
+    return app.send_static_file('index.html')
+
+
+def queue_full_response(e):
+    resp = jsonify({"error": str(e), "retry_after": e.retry_after})
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp, 429
+
+
+@app.route("/metrics")
+def metrics():
+    return app.response_class(METRICS.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+@app.route("/health")
+def health():
+    # the token is checked once by the startup warm-up; until it finishes validity is unknown
+    status = {"ok": True, "warmup": WARMUP["status"]}
+    if WARMUP["status"] != "pending":
+        try:
+            status["github_user"] = get_authenticated_user()
+            status["github_token_valid"] = True
+        except Exception:
+            status["github_token_valid"] = False
+    return jsonify(status)
+
+
+@app.errorhandler(413)
+def too_large(e):
+    return jsonify({"error": "request body too large"}), 413
+
+
+@app.route("/api-endpoint", methods=["POST"])
+def api_endpoint():
+    body = request.get_json(force=True)
+    # Basic validation
+    required = ["email", "secret", "task", "round", "nonce", "brief", "evaluation_url"]
+    for k in required:
+        if k not in body:
+            return jsonify({"error": f"missing {k}"}), 400
+
+    if SHARED_SECRET and body.get("secret") != SHARED_SECRET:
+        return jsonify({"error": "invalid secret"}), 403
+
+    # decode data: attachments to spool files now, so queued jobs never hold them in memory
+    try:
+        ingest(body)
+    except AttachmentTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except AttachmentError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        job, rec, created = submit_build(body)
+    except QueueFull as e:
+        return queue_full_response(e)
+
+    # If client requests to wait for the result (useful for testing), run build synchronously
+    wait = bool(body.get("wait_for_result", False))
+    if wait:
+        if job is None:
+            # duplicate of a build that already finished
+            if rec["result"]:
+                return jsonify(rec["result"]), 200
+            return jsonify(accepted_response(job, rec, created)), 202
+        try:
+            payload, eval_payload = job.result()
+            return jsonify(eval_payload), 200
+        except CancelledError:
+            return jsonify({"error": "superseded by a later round"}), 409
+        except Exception as e:
+            app.logger.exception("synchronous build failed")
+            return jsonify({"error": str(e)}), 500
+
+    # immediate response for async mode
+    return jsonify(accepted_response(job, rec, created)), 200
+
+
+@app.route("/api-endpoint/batch", methods=["POST"])
+def batch_endpoint():
+    """Accept {"requests": [...]} (or a bare list) of /api-endpoint bodies; see build.submit_batch."""
+    body = request.get_json(force=True)
+    reqs = body.get("requests") if isinstance(body, dict) else body
+    if not isinstance(reqs, list) or not reqs:
+        return jsonify({"error": "requests must be a non-empty list"}), 400
+    if len(reqs) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"at most {BATCH_MAX_ITEMS} requests per batch"}), 413
+    batch_id, items = submit_batch(reqs)
+    return jsonify({"batch_id": batch_id, "items": items}), 200
+
+
+@app.route("/batch/<batch_id>")
+def batch_status(batch_id):
+    status = get_batch_status(batch_id)
+    if status is None:
+        return jsonify({"error": "unknown batch"}), 404
+    return jsonify(status)
+
+
+if __name__ == "__main__":
+    start_warm_up()
+    NOTIFIER.start()
+    app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,143 @@
+"""Standalone build worker for the shared SQLite job queue.
+
+Run one or more of these next to API processes started with
+BUILD_QUEUE_BACKEND=sqlite (they only enqueue):
+
+    python -m src.worker --concurrency 4
+
+Each worker leases jobs from BUILD_QUEUE_PATH and runs them on its own
+threads, renewing its leases while they run. If a worker dies, its jobs are
+leased again by another one once the lease expires. On SIGTERM/SIGINT the
+worker stops taking jobs, finishes the ones it holds and waits (up to
+WORKER_DRAIN_SECONDS) for their Pages sites so the evaluator is notified.
+Waits still pending at exit stay in the notification outbox and are resumed
+by the next process to start.
+"""
+import os
+import sys
+import time
+import signal
+import logging
+import argparse
+import importlib
+import threading
+
+from . import build
+from .jobs import BUILD_WORKERS
+from .job_store import SQLiteBuildQueue, BUILD_QUEUE_PATH, JOB_LEASE_SECONDS, WORKER_ID
+from .pages_watcher import watcher as PAGES_WATCHER
+
+logger = logging.getLogger(__name__)
+
+# how long an idle worker thread sleeps before polling the queue again
+WORKER_IDLE_SECONDS = float(os.environ.get("WORKER_IDLE_SECONDS", "1"))
+WORKER_DRAIN_SECONDS = float(os.environ.get("WORKER_DRAIN_SECONDS", "600"))
+
+
+def _resolve(name):
+    """Import a "module:qualname" target."""
+    module, _, qualname = name.partition(":")
+    obj = importlib.import_module(module)
+    for part in qualname.split("."):
+        obj = getattr(obj, part)
+    return obj
+
+
+class Worker:
+    """Lease and run jobs from a SQLiteBuildQueue on `concurrency` threads."""
+
+    def __init__(self, queue, concurrency=BUILD_WORKERS, owner=WORKER_ID):
+        self.queue = queue
+        self.concurrency = max(1, concurrency)
+        self.owner = owner
+        self._stop = threading.Event()
+        self._threads = []
+
+    def run(self):
+        """Work until stop() is called, then drain. Heartbeats run on the calling thread."""
+        build.NOTIFIER.start()
+        self._heartbeat()
+        for i in range(self.concurrency):
+            t = threading.Thread(target=self._work, name=f"build-worker-{i}")
+            t.daemon = True
+            t.start()
+            self._threads.append(t)
+        logger.info("worker %s running %d build thread(s) on %s", self.owner, self.concurrency, self.queue.path)
+        while not self._stop.wait(self.queue.lease_seconds / 3):
+            self._heartbeat()
+        # keep renewing leases while the running jobs finish
+        while any(t.is_alive() for t in self._threads):
+            self._heartbeat()
+            for t in self._threads:
+                t.join(self.queue.lease_seconds / 3)
+        self._drain()
+        self.queue.retire(self.owner)
+
+    def stop(self):
+        self._stop.set()
+
+    def _heartbeat(self):
+        try:
+            for job_id, args in self.queue.heartbeat(self.owner, self.concurrency):
+                logger.error("build job %s abandoned after %d attempt(s)", job_id, self.queue.max_attempts)
+                if args:
+                    build.record_status(args[0], "failed", error="build worker lost")
+        except Exception:
+            logger.exception("heartbeat failed")
+
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                leased = self.queue.lease(self.owner)
+            except Exception:
+                logger.exception("could not lease a job")
+                leased = None
+            if leased is None:
+                self._stop.wait(WORKER_IDLE_SECONDS)
+                continue
+            job_id, target, args, attempt = leased
+            logger.info("running build job %s (attempt %d)", job_id, attempt)
+            try:
+                result = _resolve(target)(*args)
+            except Exception as e:
+                logger.exception("build job %s failed", job_id)
+                self.queue.fail(job_id, str(e), self.owner)
+            else:
+                self.queue.complete(job_id, result, self.owner)
+
+    def _drain(self):
+        deadline = time.time() + WORKER_DRAIN_SECONDS
+        while PAGES_WATCHER.pending() and time.time() < deadline:
+            time.sleep(1)
+        if PAGES_WATCHER.pending():
+            logger.warning("exiting with %d deployment(s) still waiting for Pages", PAGES_WATCHER.pending())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run builds from the shared SQLite job queue.")
+    parser.add_argument("--concurrency", type=int, default=BUILD_WORKERS,
+                        help="builds run at once by this process (default: BUILD_WORKERS)")
+    parser.add_argument("--queue-path", default=BUILD_QUEUE_PATH, help="job queue database (default: BUILD_QUEUE_PATH)")
+    parser.add_argument("--lease-seconds", type=float, default=JOB_LEASE_SECONDS,
+                        help="lease length; a job is re-run elsewhere if not renewed in time")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    build.start_warm_up()
+    worker = Worker(SQLiteBuildQueue(args.queue_path, lease_seconds=args.lease_seconds), args.concurrency)
+
+    def on_signal(signum, frame):
+        if worker._stop.is_set():
+            # second signal: give up on the running jobs; their leases will expire
+            sys.exit(1)
+        logger.info("stopping: finishing running builds (signal again to exit now)")
+        worker.stop()
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+    worker.run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
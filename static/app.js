@@ -1,64 +1,107 @@
-const form = document.getElementById('deploy-form');
-const status = document.getElementById('status');
-const preview = document.getElementById('preview');
-
-function setStatus(msg){ status.textContent = msg }
-
-form.addEventListener('submit', async (e)=>{
-  e.preventDefault();
-  setStatus('Submitting...')
-  const payload = {
-    email: document.getElementById('email').value,
-    secret: document.getElementById('secret').value,
-    task: document.getElementById('task').value,
-    round: Number(document.getElementById('round').value),
-    nonce: 'n-' + Math.random().toString(36).slice(2,9),
-    brief: document.getElementById('brief').value,
-    checks: JSON.parse(document.getElementById('checks').value || '[]'),
-    evaluation_url: document.getElementById('evaluation_url').value,
-    attachments: JSON.parse(document.getElementById('attachments').value || '[]'),
-    wait_for_result: document.getElementById('wait_for_result').checked
-  }
-
-  try{
-    const res = await fetch('/api-endpoint',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify(payload)})
-    const data = await res.json()
-    if(payload.wait_for_result){
-      setStatus('Done — repo: ' + data.repo_url)
-      showPreview(data.pages_url)
-    } else {
-      setStatus('Accepted — build running in background')
-      // start polling for result every 3s
-      pollForResult(payload.email, payload.task, payload.nonce)
-    }
-  }catch(err){
-    setStatus('Error: ' + err.message)
-  }
-})
-
-function showPreview(url){
-  if(!url) return;
-  preview.innerHTML = `<iframe src="${url}"></iframe>`
-}
-
-let _pollHandle = null
-function pollForResult(email, task, nonce){
-  if(_pollHandle) clearInterval(_pollHandle)
-  _pollHandle = setInterval(async ()=>{
-    try{
-      const q = new URLSearchParams({email, task, nonce})
-      const r = await fetch('/result?'+q.toString())
-      const j = await r.json()
-      if(j && j.repo_url){
-        setStatus('Build complete — ' + j.repo_url)
-        showPreview(j.pages_url)
-        clearInterval(_pollHandle)
-        _pollHandle = null
-      }
-    }catch(e){
-      // ignore transient errors
-    }
-  }, 3000)
-}
-
-document.getElementById('clear').addEventListener('click',(e)=>{form.reset(); setStatus('')})
+const form = document.getElementById('deploy-form');
+const status = document.getElementById('status');
+const preview = document.getElementById('preview');
+
+function setStatus(msg){ status.textContent = msg }
+
+form.addEventListener('submit', async (e)=>{
+  e.preventDefault();
+  setStatus('Submitting...')
+  const payload = {
+    email: document.getElementById('email').value,
+    secret: document.getElementById('secret').value,
+    task: document.getElementById('task').value,
+    round: Number(document.getElementById('round').value),
+    nonce: 'n-' + Math.random().toString(36).slice(2,9),
+    brief: document.getElementById('brief').value,
+    checks: JSON.parse(document.getElementById('checks').value || '[]'),
+    evaluation_url: document.getElementById('evaluation_url').value,
+    attachments: JSON.parse(document.getElementById('attachments').value || '[]'),
+    wait_for_result: document.getElementById('wait_for_result').checked
+  }
+
+  try{
+    const res = await fetch('/api-endpoint',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify(payload)})
+    const data = await res.json()
+    if(res.status === 429){
+      setStatus('Server busy — retry in ' + (res.headers.get('Retry-After') || data.retry_after) + 's')
+    } else if(payload.wait_for_result){
+      setStatus('Done — repo: ' + data.repo_url)
+      showPreview(data.pages_url)
+    } else {
+      setStatus('Accepted — build running in background')
+      // follow progress pushed by the server
+      watchProgress(payload.email, payload.task, payload.nonce)
+    }
+  }catch(err){
+    setStatus('Error: ' + err.message)
+  }
+})
+
+function showPreview(url){
+  if(!url) return;
+  preview.innerHTML = `<iframe src="${url}"></iframe>`
+}
+
+const STAGES = {
+  pending: 'Waiting for build to start',
+  queued: 'Queued',
+  generating: 'Generating app',
+  pushing: 'Pushing to GitHub',
+  'pages-pending': 'Waiting for GitHub Pages',
+  'pages-live': 'Site is live — notifying evaluator',
+  notified: 'Done — evaluator notified',
+  failed: 'Failed',
+  superseded: 'Superseded by a later round'
+}
+
+// returns true once the build has reached a terminal stage
+function showProgress(j){
+  const label = STAGES[j.status] || j.status
+  let msg = label
+  if(j.repo_url) msg += ' — ' + j.repo_url
+  if(j.error) msg += ' (' + j.error + ')'
+  setStatus(msg)
+  if(j.pages_url && (j.status === 'pages-live' || j.status === 'notified')) showPreview(j.pages_url)
+  return j.status === 'notified' || j.status === 'failed' || j.status === 'superseded'
+}
+
+let _source = null
+let _watchId = 0
+function watchProgress(email, task, nonce){
+  const id = ++_watchId
+  if(_source){ _source.close(); _source = null }
+  const q = new URLSearchParams({email, task, nonce}).toString()
+  if(window.EventSource){
+    _source = new EventSource('/events?' + q)
+    _source.addEventListener('status', (ev)=>{
+      if(showProgress(JSON.parse(ev.data))){ _source.close(); _source = null }
+    })
+    _source.onerror = ()=>{
+      // stream unavailable or dropped: fall back to long-polling
+      if(_source){ _source.close(); _source = null }
+      if(id === _watchId) longPoll(id, q)
+    }
+  } else {
+    longPoll(id, q)
+  }
+}
+
+async function longPoll(id, q){
+  let etag = null
+  while(id === _watchId){
+    try{
+      const headers = etag ? {'If-None-Match': etag} : {}
+      const r = await fetch('/result?' + q + '&wait=30', {headers})
+      if(r.status === 304) continue
+      if(!r.ok) return
+      etag = r.headers.get('ETag')
+      if(showProgress(await r.json())) return
+    }catch(e){
+      // back off briefly on network errors
+      await new Promise(res => setTimeout(res, 5000))
+    }
+  }
+}
+
+document.getElementById('clear').addEventListener('click',(e)=>{form.reset(); setStatus('')})
@@ -0,0 +1,132 @@
+import time
+import threading
+from collections import Counter
+
+import pytest
+
+from src import jobs
+from src.admission import Admission, SubmitterLimited
+from src.jobs import BuildQueue, FairQueue, Job, LANES
+from src.job_store import SQLiteBuildQueue
+
+
+def _build(body):
+    return body
+
+
+@pytest.fixture
+def blocked():
+    release = threading.Event()
+    yield lambda body: release.wait(10)
+    release.set()
+
+
+def test_submitter_limit_counts_queued_and_running(blocked):
+    admission = Admission(max_active=2, rate_per_minute=0)
+    queue = BuildQueue(workers=1, maxsize=10)
+    for i in range(2):
+        _, created = admission.submit("a", queue, ("a", i), blocked, {})
+        assert created
+    with pytest.raises(SubmitterLimited):
+        admission.submit("a", queue, ("a", 2), blocked, {})
+    # a retry of an accepted request is not a new build, and other submitters are unaffected
+    assert admission.submit("a", queue, ("a", 0), blocked, {})[1] is False
+    assert admission.submit("b", queue, ("b", 0), blocked, {})[1] is True
+
+
+def test_rate_limit_refunds_refused_builds():
+    admission = Admission(max_active=1, rate_per_minute=60, burst=2)
+    queue = SQLiteBuildQueue(":memory:")
+    admission.submit("a", queue, ("a", 0), _build, {})
+    # refused by the active limit, so it does not use up the second token
+    with pytest.raises(SubmitterLimited):
+        admission.submit("a", queue, ("a", 1), _build, {})
+    assert admission._buckets["a"][0] == pytest.approx(1, abs=0.01)
+
+
+def _slow_admit(admission, monkeypatch):
+    # widen the gap between admission and the queue insert
+    admit = admission.admit
+    monkeypatch.setattr(admission, "admit", lambda *args: (admit(*args), time.sleep(0.05)))
+
+
+def _race(submit, n=8):
+    barrier = threading.Barrier(n)
+    outcomes = []
+
+    def run(i):
+        barrier.wait()
+        try:
+            outcomes.append(submit(i)[1])
+        except SubmitterLimited:
+            outcomes.append("limited")
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    return Counter(outcomes)
+
+
+def test_concurrent_submits_cannot_both_pass_the_limit(blocked, monkeypatch):
+    admission = Admission(max_active=1, rate_per_minute=0)
+    _slow_admit(admission, monkeypatch)
+    queue = BuildQueue(workers=1, maxsize=10)
+    outcomes = _race(lambda i: admission.submit("a", queue, ("a", i), blocked, {}))
+    assert outcomes == {True: 1, "limited": 7}
+
+
+def test_concurrent_submits_across_processes(tmp_path, monkeypatch):
+    admission = Admission(max_active=2, rate_per_minute=0)
+    _slow_admit(admission, monkeypatch)
+    # two queues on one database stand in for two API processes
+    queues = [SQLiteBuildQueue(str(tmp_path / "jobs.db")) for _ in range(2)]
+    outcomes = _race(lambda i: admission.submit("a", queues[i % 2], ("a", i), _build, {}))
+    assert outcomes == {True: 2, "limited": 6}
+    assert queues[0].active("a") == 2
+
+
+def _job(lane, submitter="a"):
+    job = Job(_build, ({},), {})
+    job.lane, job.submitter = lane, submitter
+    return job
+
+
+def test_lanes_are_taken_by_weight(monkeypatch):
+    monkeypatch.setattr(jobs, "LANE_WEIGHTS", {"interactive": 6, "revision": 3, "bulk": 1})
+    queue = FairQueue()
+    for lane in reversed(LANES):
+        for _ in range(10):
+            queue.append(_job(lane))
+    taken = [queue.popleft().lane for _ in range(10)]
+    assert taken[0] == "interactive"
+    assert Counter(taken) == {"interactive": 6, "revision": 3, "bulk": 1}
+    # bulk is slowed down, never starved: it keeps its share until a lane empties
+    taken = [queue.popleft().lane for _ in range(10)]
+    assert Counter(taken) == {"interactive": 4, "revision": 5, "bulk": 1}
+
+
+def test_submitters_take_turns_within_a_lane():
+    queue = FairQueue()
+    flood = [_job("bulk", "a") for _ in range(3)]
+    for job in flood:
+        queue.append(job)
+    other = _job("bulk", "b")
+    queue.append(other)
+    assert queue.index(other) == 1
+    assert [queue.popleft() for _ in range(4)] == [flood[0], other, flood[1], flood[2]]
+
+
+def test_sqlite_queue_leases_by_lane_weight(monkeypatch):
+    monkeypatch.setattr(jobs, "LANE_WEIGHTS", {"interactive": 6, "revision": 3, "bulk": 1})
+    monkeypatch.setattr("src.job_store.LANE_WEIGHTS", jobs.LANE_WEIGHTS)
+    queue = SQLiteBuildQueue(":memory:", maxsize=100)
+    lanes = {}
+    for lane in reversed(LANES):
+        for i in range(10):
+            job, _ = queue.submit_keyed((lane, i), _build, {}, lane=lane, submitter=f"s{i}")
+            lanes[job.id] = lane
+    taken = [lanes[queue.lease("w")[0]] for _ in range(10)]
+    assert taken[0] == "interactive"
+    assert Counter(taken) == {"interactive": 6, "revision": 3, "bulk": 1}
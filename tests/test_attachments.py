@@ -0,0 +1,118 @@
+import os
+import base64
+import hashlib
+import threading
+import tracemalloc
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from src.attachments import AttachmentError, _Fetcher, ingest
+
+BODY = b"id,name\n1,a\n2,b\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/redirect":
+            self.send_response(302)
+            self.send_header("Location", "http://169.254.169.254/latest/meta-data/")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/csv")
+        self.send_header("Content-Length", str(len(BODY)))
+        self.send_header("ETag", '"v1"')
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def origin():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+class _InlinePool:
+    """Runs each task before submit returns, so its future is already done."""
+
+    def submit(self, fn, *args):
+        fut = Future()
+        try:
+            fut.set_result(fn(*args))
+        except Exception as e:
+            fut.set_exception(e)
+        return fut
+
+
+def _in_thread(fn, timeout=10):
+    result = []
+    t = threading.Thread(target=lambda: result.append(fn()), daemon=True)
+    t.start()
+    t.join(timeout)
+    assert not t.is_alive(), "fetch_all deadlocked"
+    return result[0]
+
+
+def test_fetch_same_url_twice(tmp_path, origin):
+    fetcher = _Fetcher(spool_dir=str(tmp_path), allow_private=True)
+    fetcher._pool = _InlinePool()
+    attachments = [{"name": "data.csv", "url": origin + "/data.csv"}]
+    for _ in range(2):
+        futures = _in_thread(lambda: fetcher.fetch_all(attachments))
+        fetched = futures[0].result(5)
+        with open(fetched["spool"], "rb") as f:
+            assert f.read() == BODY
+    assert fetcher._flights == {}
+
+
+@pytest.mark.parametrize("url", [
+    "http://127.0.0.1/x.png",
+    "http://localhost/x.png",
+    "http://169.254.169.254/latest/meta-data/",
+    "http://10.0.0.1/x.png",
+    "http://[::1]/x.png",
+])
+def test_private_addresses_are_refused(tmp_path, url):
+    with pytest.raises(AttachmentError):
+        _Fetcher(spool_dir=str(tmp_path)).fetch("x.png", url)
+
+
+def test_redirect_to_private_address_is_refused(tmp_path, origin, monkeypatch):
+    # the origin itself is on loopback, so only let that one host through
+    import src.attachments as attachments
+    checked = []
+
+    def check(url):
+        checked.append(url)
+        if not url.startswith(origin):
+            raise AttachmentError("not public")
+
+    monkeypatch.setattr(attachments, "check_public_url", check)
+    with pytest.raises(AttachmentError):
+        _Fetcher(spool_dir=str(tmp_path)).fetch("x", origin + "/redirect")
+    assert checked == [origin + "/redirect", "http://169.254.169.254/latest/meta-data/"]
+
+
+def test_ingest_peak_memory_is_bounded(tmp_path):
+    payload = os.urandom(8 * 1024 * 1024)
+    body = {"attachments": [{"name": "big.bin",
+                             "url": "data:application/octet-stream;base64," + base64.b64encode(payload).decode()}]}
+    tracemalloc.start()
+    try:
+        ingest(body, spool_dir=str(tmp_path))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    spooled = body["attachments"][0]
+    assert spooled["size"] == len(payload)
+    assert spooled["sha256"] == hashlib.sha256(payload).hexdigest()
+    # decoded in chunks: peak stays far below the 8 MiB payload (and its 11 MiB URI)
+    assert peak < len(payload) // 16, peak
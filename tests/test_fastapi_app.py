@@ -0,0 +1,33 @@
+import asyncio
+
+import pytest
+
+fastapi_app = pytest.importorskip("src.fastapi_app")
+from fastapi.testclient import TestClient  # noqa: E402
+
+from src import build  # noqa: E402
+
+
+def _on_loop():
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+def test_result_reads_the_store_off_the_event_loop(monkeypatch):
+    reads = []
+
+    def get_result(email, task, nonce=None):
+        reads.append(_on_loop())
+        return {"status": "generating"}
+
+    monkeypatch.setattr(build, "get_result", get_result)
+    client = TestClient(fastapi_app.app)
+    r = client.get("/result", params={"email": "a@example.com", "task": "t"})
+    assert r.status_code == 200 and r.json() == {"status": "generating"}
+    r = client.get("/result", params={"email": "a@example.com", "task": "t", "wait": 0.2},
+                   headers={"If-None-Match": r.headers["etag"]})
+    assert r.status_code == 304
+    assert reads and not any(reads)
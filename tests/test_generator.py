@@ -0,0 +1,33 @@
+from src import generator, llm_generator
+
+
+def test_failed_stream_leaves_no_partial_files(tmp_path, monkeypatch):
+    # a round-2 checkout with a file the stream will overwrite before failing
+    (tmp_path / "style.css").write_text("body{color:red}")
+
+    def generate_with_openai(brief, attachments, on_file=None):
+        on_file("style.css", "body{color:blue}")
+        on_file("app.js", "console.log('half')")
+        raise ConnectionError("stream dropped")
+
+    monkeypatch.setattr(llm_generator, "OPENAI_API_KEY", "k")
+    monkeypatch.setattr(llm_generator, "generate_with_openai", generate_with_openai)
+    generator.generate_app({"brief": "Show a cat"}, str(tmp_path))
+
+    assert not (tmp_path / "app.js").exists()
+    assert (tmp_path / "style.css").read_text() == "body{color:red}"
+    assert "Show a cat" in (tmp_path / "index.html").read_text()
+
+
+def test_streamed_files_are_kept_on_success(tmp_path, monkeypatch):
+    def generate_with_openai(brief, attachments, on_file=None):
+        files = {"index.html": "<h1>llm</h1>", "app.js": "run()"}
+        for name, content in files.items():
+            on_file(name, content)
+        return files
+
+    monkeypatch.setattr(llm_generator, "OPENAI_API_KEY", "k")
+    monkeypatch.setattr(llm_generator, "generate_with_openai", generate_with_openai)
+    generator.generate_app({"brief": "b"}, str(tmp_path))
+    assert (tmp_path / "index.html").read_text() == "<h1>llm</h1>"
+    assert (tmp_path / "app.js").read_text() == "run()"
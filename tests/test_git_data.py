@@ -0,0 +1,63 @@
+import os
+import importlib.util
+import subprocess
+
+import pytest
+
+from src import git_data
+from src.git_data import publish_files
+
+_spec = importlib.util.spec_from_file_location(
+    "benchmark", os.path.join(os.path.dirname(os.path.dirname(__file__)), "scripts", "benchmark.py"))
+benchmark = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(benchmark)
+
+HEADERS = {"Authorization": "token t"}
+
+
+@pytest.fixture
+def github(tmp_path, monkeypatch):
+    remotes = tmp_path / "remotes"
+    (remotes / benchmark.OWNER).mkdir(parents=True)
+    subprocess.run(["git", "init", "-q", "--bare", "--initial-branch=main",
+                    str(remotes / benchmark.OWNER / "site.git")], check=True)
+    server = benchmark._Server(benchmark.FakeGitHub, repos={"site"}, pages={}, pages_delay=0, remotes=str(remotes),
+                               rate_limit=0, rate_window=60, usage={}, limited=0, retry_after=None,
+                               git_writes={})
+    monkeypatch.setattr(git_data, "GITHUB_API_URL", server.url)
+    yield server
+    server.close()
+
+
+def _log(server):
+    bare = os.path.join(server.remotes, benchmark.OWNER, "site.git")
+    return subprocess.check_output(["git", "log", "--format=%H", "main"], cwd=bare).decode().split()
+
+
+def test_bootstraps_empty_repo_and_skips_unchanged_publish(github):
+    files = {"README.md": b"# site\n", "index.html": b"<h1>hi</h1>\n"}
+    first = publish_files(benchmark.OWNER, "site", files, HEADERS, message="Initial commit")
+    # the empty repo gets its first commit through /contents, then the full tree on top
+    assert github.git_writes["contents"] == 1
+    log = _log(github)
+    assert len(log) == 2 and log[0] == first
+    assert github.git_writes["commit"] == 1
+
+    second = publish_files(benchmark.OWNER, "site", files, HEADERS, message="Again")
+    assert second == first
+    assert github.git_writes["commit"] == 1
+    assert github.git_writes.get("ref") == 1
+    assert _log(github) == log
+
+
+def test_only_changed_blobs_are_uploaded(github):
+    files = {"README.md": b"# site\n", "index.html": b"<h1>hi</h1>\n", "app.js": b"// app\n"}
+    publish_files(benchmark.OWNER, "site", files, HEADERS)
+    blobs = github.git_writes["blob"]
+
+    sha = publish_files(benchmark.OWNER, "site", dict(files, **{"index.html": b"<h1>bye</h1>\n"}), HEADERS,
+                        keep_existing=True)
+    assert github.git_writes["blob"] == blobs + 1
+    assert _log(github)[0] == sha
+    bare = os.path.join(github.remotes, benchmark.OWNER, "site.git")
+    assert subprocess.check_output(["git", "show", "main:index.html"], cwd=bare) == b"<h1>bye</h1>\n"
@@ -0,0 +1,119 @@
+import os
+import time
+import threading
+import importlib.util
+
+import pytest
+import requests
+
+from src.github_scheduler import GitHubScheduler, RateLimited, priority, INTERACTIVE, NORMAL, BULK
+
+_spec = importlib.util.spec_from_file_location(
+    "benchmark", os.path.join(os.path.dirname(os.path.dirname(__file__)), "scripts", "benchmark.py"))
+benchmark = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(benchmark)
+
+
+@pytest.fixture
+def fake_github(tmp_path):
+    servers = []
+
+    def start(rate_limit, rate_window=1.0, retry_after=None):
+        server = benchmark._Server(benchmark.FakeGitHub, repos=set(), pages={}, pages_delay=0, remotes=str(tmp_path),
+                                   rate_limit=rate_limit, rate_window=rate_window, usage={}, limited=0,
+                                   retry_after=retry_after, git_writes={})
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+def _get(scheduler, github, token):
+    return scheduler.call(token, "GET", lambda: requests.get(github.url + "/user",
+                                                             headers={"Authorization": f"token {token}"}))
+
+
+def test_rests_token_when_headers_report_budget_spent(fake_github):
+    github = fake_github(rate_limit=3)
+    scheduler = GitHubScheduler(reserve=0, writes_per_minute=0)
+    for _ in range(3):
+        assert _get(scheduler, github, "t").status_code == 200
+    assert scheduler._bucket("t").remaining == 0
+
+    # the fourth call waits for X-RateLimit-Reset instead of spending a 403
+    started = time.time()
+    assert _get(scheduler, github, "t").status_code == 200
+    assert time.time() - started > 0.1
+    assert github.limited == 0
+
+
+def test_retries_after_retry_after(fake_github):
+    github = fake_github(rate_limit=1, retry_after=0.5)
+    # another process already spent the budget, so this scheduler's first call is refused
+    requests.get(github.url + "/user", headers={"Authorization": "token t"})
+    scheduler = GitHubScheduler(reserve=0, writes_per_minute=0, retries=3)
+    started = time.time()
+    assert _get(scheduler, github, "t").status_code == 200
+    assert github.limited == 1
+    assert time.time() - started >= 0.5
+
+
+def test_secondary_limit_backs_off_exponentially():
+    scheduler = GitHubScheduler(secondary_backoff=1)
+    bucket = scheduler._bucket("t")
+    now = time.time()
+    delays = [bucket.observe(403, {}, "You have exceeded a secondary rate limit", now, 1)[0] for _ in range(3)]
+    assert delays == [1, 2, 4]
+    assert bucket.observe(200, {}, "", now, 1) is None and bucket.backoff == 0
+    # a 403 that is not a rate limit is not retried
+    assert bucket.observe(403, {}, "Resource not accessible by integration", now, 1) is None
+
+
+def test_write_bucket_paces_content_creation():
+    scheduler = GitHubScheduler(writes_per_minute=6, max_wait=1)
+    for _ in range(6):
+        scheduler.acquire("t", write=True)
+        scheduler.release()
+    # a minute's worth went out in a burst; the next write is 10s away
+    with pytest.raises(RateLimited) as e:
+        scheduler.acquire("t", write=True)
+    assert 9 < e.value.retry_after <= 10
+    # reads are not paced
+    scheduler.acquire("t")
+    scheduler.release()
+
+
+def test_rotates_pool_and_skips_resting_tokens(fake_github, monkeypatch):
+    monkeypatch.setenv("GITHUB_TOKENS", "a,b,c")
+    monkeypatch.setenv("GITHUB_OWNER", "org")
+    scheduler = GitHubScheduler(reserve=0, writes_per_minute=0)
+    assert [scheduler.pick_token() for _ in range(4)] == ["a", "b", "c", "a"]
+
+    github = fake_github(rate_limit=1, rate_window=30)
+    _get(scheduler, github, "b")  # b's budget is spent until its window resets
+    assert [scheduler.pick_token() for _ in range(4)] == ["c", "a", "c", "a"]
+
+
+def test_higher_priority_waiters_go_first():
+    scheduler = GitHubScheduler(max_concurrency=1, writes_per_minute=0)
+    scheduler.acquire("t")
+    order = []
+
+    def call(name, level):
+        with priority(level):
+            scheduler.acquire("t")
+        order.append(name)
+        scheduler.release()
+
+    threads = []
+    for name, level in (("bulk", BULK), ("normal", NORMAL), ("interactive", INTERACTIVE)):
+        threads.append(threading.Thread(target=call, args=(name, level)))
+        threads[-1].start()
+        while scheduler.stats()["waiting"] < len(threads):
+            time.sleep(0.01)
+    scheduler.release()
+    for t in threads:
+        t.join(5)
+    assert order == ["interactive", "normal", "bulk"]
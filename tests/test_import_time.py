@@ -0,0 +1,23 @@
+import os
+import sys
+import subprocess
+import importlib.util
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(REPO_ROOT, "scripts", "check_import_time.py")
+
+_spec = importlib.util.spec_from_file_location("check_import_time", SCRIPT)
+check_import_time = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(check_import_time)
+
+
+@pytest.mark.parametrize("module", list(check_import_time.CHECKS))
+def test_import_within_budget(module):
+    # the script imports module in a fresh interpreter, with GitHub pointed at a socket that never answers
+    budget = os.environ.get("IMPORT_TIME_BUDGET", "2.0")
+    proc = subprocess.run([sys.executable, SCRIPT, "--budget", budget, module],
+                          cwd=REPO_ROOT, capture_output=True, text=True, timeout=120)
+    assert proc.returncode == 0, proc.stdout + proc.stderr
+    assert proc.stdout.startswith("ok")
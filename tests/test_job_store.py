@@ -0,0 +1,91 @@
+import time
+import threading
+
+import pytest
+
+from src import build, job_store, worker as worker_module
+from src.job_store import SQLiteBuildQueue
+from src.worker import Worker
+
+RUNS = []
+
+
+def _build(body):
+    RUNS.append(body["task"])
+    return ["payload", body["task"]]
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_store, "JOB_POLL_INTERVAL", 0.05)
+    return SQLiteBuildQueue(str(tmp_path / "jobs.db"), lease_seconds=0.3)
+
+
+def _submit(queue, task="t"):
+    job, created = queue.submit_keyed(("a@example.com", task, 1, "n"), _build, {"task": task})
+    assert created
+    return job
+
+
+def test_expired_lease_goes_to_second_claimant(queue):
+    job = _submit(queue)
+    job_id, target, args, attempt = queue.lease("w1")
+    assert (job_id, attempt) == (job.id, 1)
+    assert target == "tests.test_job_store:_build" and args == ({"task": "t"},)
+    # held by w1 until its lease runs out
+    assert queue.lease("w2") is None
+    assert queue.find(("a@example.com", "t", 1, "n")) is not None
+
+    time.sleep(0.4)
+    job_id, _, _, attempt = queue.lease("w2")
+    assert (job_id, attempt) == (job.id, 2)
+    # w1 comes back too late: its result is dropped, w2's is kept
+    assert queue.complete(job.id, ["stale"], "w1") is False
+    assert queue.complete(job.id, ["payload", "t"], "w2") is True
+    assert job.result(timeout=5) == ("payload", "t")
+
+
+def test_heartbeat_keeps_the_lease(queue):
+    _submit(queue)
+    queue.lease("w1")
+    for _ in range(6):
+        time.sleep(0.1)
+        queue.heartbeat("w1")
+        assert queue.lease("w2") is None
+    assert queue.stats()["running"] == 1
+
+
+def test_job_fails_after_max_attempts(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_store, "JOB_POLL_INTERVAL", 0.05)
+    queue = SQLiteBuildQueue(str(tmp_path / "jobs.db"), lease_seconds=0.1, max_attempts=1)
+    job = _submit(queue)
+    queue.lease("w1")
+    time.sleep(0.2)
+    assert queue.lease("w2") is None
+    assert [job_id for job_id, _ in queue.heartbeat("w2")] == [job.id]
+    with pytest.raises(RuntimeError, match="worker lost"):
+        job.result(timeout=5)
+
+
+def test_worker_picks_up_crashed_workers_job(queue, monkeypatch):
+    class Notifier:
+        def start(self):
+            pass
+
+    monkeypatch.setattr(build, "NOTIFIER", Notifier())
+    monkeypatch.setattr(worker_module, "WORKER_IDLE_SECONDS", 0.05)
+    RUNS.clear()
+    job = _submit(queue, "crashed")
+    # the first worker leases the job and dies without finishing or heartbeating
+    queue.lease("dead-worker")
+
+    worker = Worker(queue, concurrency=1, owner="w2")
+    thread = threading.Thread(target=worker.run, daemon=True)
+    thread.start()
+    try:
+        assert job.result(timeout=5) == ("payload", "crashed")
+    finally:
+        worker.stop()
+        thread.join(5)
+    assert RUNS == ["crashed"]
+    assert queue.stats()["workers"] == 0  # retired on shutdown
@@ -0,0 +1,85 @@
+import os
+import time
+import asyncio
+import threading
+
+from src.llm_cache import LLMCache, cache_key
+
+
+def test_hit_after_miss(tmp_path):
+    cache = LLMCache(root=str(tmp_path))
+    calls = []
+    key = cache_key(model="m", user="brief")
+
+    def compute():
+        calls.append(1)
+        return {"index.html": "<h1>hi</h1>"}
+
+    assert cache.get_or_compute(key, compute) == {"index.html": "<h1>hi</h1>"}
+    assert cache.get_or_compute(key, compute) == {"index.html": "<h1>hi</h1>"}
+    # a fresh instance on the same directory (another process) hits too
+    assert LLMCache(root=str(tmp_path)).get_or_compute(key, compute) == {"index.html": "<h1>hi</h1>"}
+    assert len(calls) == 1
+    assert cache.stats == {"hits": 1, "misses": 1, "coalesced": 0}
+    assert cache.get_or_compute(cache_key(model="m", user="other"), compute) and len(calls) == 2
+
+
+def test_concurrent_identical_requests_share_one_call(tmp_path):
+    cache = LLMCache(root=str(tmp_path))
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return {"a": "1"}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("k" * 64, compute)))
+               for _ in range(5)]
+    for t in threads:
+        t.start()
+    while cache.stats["misses"] + cache.stats["coalesced"] < 5:
+        time.sleep(0.01)
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert len(calls) == 1
+    assert results == [{"a": "1"}] * 5
+    assert cache.stats["coalesced"] == 4
+
+
+def test_async_requests_share_one_call(tmp_path):
+    cache = LLMCache(root=str(tmp_path))
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"a": "1"}
+
+    async def main():
+        return await asyncio.gather(*(cache.aget_or_compute("k" * 64, compute) for _ in range(4)))
+
+    assert asyncio.run(main()) == [{"a": "1"}] * 4
+    assert len(calls) == 1 and cache.stats["coalesced"] == 3
+
+
+def test_writes_scan_only_when_over_the_limit(tmp_path, monkeypatch):
+    cache = LLMCache(root=str(tmp_path), max_bytes=10_000)
+    walks = []
+    walk = os.walk
+    monkeypatch.setattr(os, "walk", lambda *args: walks.append(1) or walk(*args))
+
+    for i in range(20):
+        cache.put(cache_key(i=i), {"f": "x" * 100})
+    # measured once to start the running total, then never again under the limit
+    assert len(walks) == 1
+
+    for i in range(20, 200):
+        cache.put(cache_key(i=i), {"f": "x" * 100})
+    assert 1 < len(walks) < 20
+    size = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in walk(str(tmp_path)) for name in names)
+    assert size <= 10_000
+    # the most recently written entry survives eviction
+    assert cache.get(cache_key(i=199)) == {"f": "x" * 100}
@@ -0,0 +1,88 @@
+import json
+import base64
+import struct
+
+import pytest
+
+from src import llm_prompt
+from src.llm_prompt import build, estimate_tokens
+
+ORDER = ["previews", "attachment_details", "attachments", "brief"]
+SYSTEM = "You write static sites."
+BRIEF = "Build a page that charts the sales data. " * 40
+
+
+def _data_uri(mime, data):
+    return f"data:{mime};base64,{base64.b64encode(data).decode()}"
+
+
+def _csv(name, width):
+    rows = "\n".join(",".join(f"{r}-{c}" * width for c in range(4)) for r in range(20))
+    return {"name": name, "url": _data_uri("text/csv", ("a,b,c,d\n" + rows).encode())}
+
+
+def _png(name):
+    header = b"\x89PNG\r\n\x1a\n" + struct.pack(">I", 13) + b"IHDR" + struct.pack(">II", 640, 480)
+    return {"name": name, "url": _data_uri("image/png", header + b"\0" * 100)}
+
+
+def _attachments():
+    return [_csv("big.csv", 20), _csv("small.csv", 1), _png("logo.png")] + \
+        [_png(f"photo{i}.png") for i in range(9)]
+
+
+def _parse(prompt):
+    return json.loads(prompt.user)
+
+
+def test_within_budget_nothing_is_cut():
+    prompt = build(BRIEF, _attachments(), SYSTEM, budget=100_000)
+    assert prompt.truncated == []
+    assert prompt.tokens == estimate_tokens(SYSTEM) + llm_prompt._MESSAGE_OVERHEAD + estimate_tokens(prompt.user)
+    user = _parse(prompt)
+    assert user["brief"] == BRIEF
+    big, _, logo = user["attachments"][:3]
+    assert big["path"] == "assets/big.csv" and big["mime"] == "text/csv" and big["preview"].startswith("a,b,c,d\n")
+    assert big["rows"] == 20
+    assert (logo["width"], logo["height"]) == (640, 480)
+
+
+def test_largest_preview_goes_first():
+    full = build(BRIEF, _attachments(), SYSTEM, budget=0)
+    big = len(json.dumps(_parse(full)["attachments"][0]["preview"]))
+    prompt = build(BRIEF, _attachments(), SYSTEM, budget=full.tokens - 10)
+    assert prompt.truncated == ["previews"]
+    big_d, small_d = _parse(prompt)["attachments"][:2]
+    assert "preview" not in big_d and "preview" in small_d
+    assert full.tokens - prompt.tokens >= big // 4 - 1
+
+
+def test_cuts_follow_documented_order_and_fit_budget():
+    full = build(BRIEF, _attachments(), SYSTEM, budget=0).tokens
+    seen = []
+    for budget in range(full, 150, -25):
+        prompt = build(BRIEF, _attachments(), SYSTEM, budget=budget)
+        assert prompt.tokens <= budget
+        # each stage is only reached once every earlier one has been cut
+        assert prompt.truncated == ORDER[:len(prompt.truncated)]
+        user = _parse(prompt)
+        details = any(len(d) > 2 for d in user["attachments"])
+        assert ("attachment_details" in prompt.truncated) == (not details)
+        if "attachments" in prompt.truncated:
+            assert len(user["attachments"]) == llm_prompt._MIN_ATTACHMENTS
+            assert user["attachments_omitted"] == 12 - llm_prompt._MIN_ATTACHMENTS
+        if "brief" in prompt.truncated:
+            assert user["brief"].endswith("characters omitted]")
+            assert BRIEF.startswith(user["brief"].split("\n[brief truncated")[0])
+        else:
+            assert user["brief"] == BRIEF
+        seen.extend(part for part in prompt.truncated if part not in seen)
+    assert seen == ORDER
+
+
+@pytest.mark.parametrize("brief", ['"quoted" \\ ' * 300, "\n\t" * 600, "☃" * 2000])
+def test_escaped_brief_still_fits(brief):
+    prompt = build(brief, [], SYSTEM, budget=200)
+    assert prompt.truncated == ["brief"]
+    assert prompt.tokens <= 200
+    assert prompt.tokens == estimate_tokens(SYSTEM) + llm_prompt._MESSAGE_OVERHEAD + estimate_tokens(prompt.user)
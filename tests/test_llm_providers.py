@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+import requests
+
+from src import llm_providers
+from src.llm_providers import Provider, hedged, ahedged
+
+
+@pytest.fixture
+def providers(monkeypatch):
+    monkeypatch.setattr(llm_providers, "LLM_HEDGE_PERCENTILE", 95)
+    monkeypatch.setattr(llm_providers, "fallback", Provider("fallback", "http://fallback", "m", "k"))
+    return llm_providers.primary, llm_providers.fallback
+
+
+def _http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"HTTP {status}", response=response)
+
+
+@pytest.mark.parametrize("status, failover", [(400, False), (401, False), (408, True), (429, True), (500, True)])
+def test_failover_only_on_retryable_errors(providers, status, failover):
+    primary, fallback = providers
+    calls = []
+
+    def attempt(provider):
+        calls.append(provider)
+        if provider is primary:
+            raise _http_error(status)
+        return "ok"
+
+    if failover:
+        assert hedged(attempt) == "ok"
+    else:
+        with pytest.raises(requests.HTTPError):
+            hedged(attempt)
+    assert calls == ([primary, fallback] if failover else [primary])
+
+
+def test_async_client_error_is_not_sent_again(providers):
+    primary, fallback = providers
+    calls = []
+
+    async def attempt(provider):
+        calls.append(provider)
+        raise _http_error(422)
+
+    with pytest.raises(requests.HTTPError):
+        asyncio.run(ahedged(attempt))
+    assert calls == [primary]
+
@@ -0,0 +1,74 @@
+import json
+import os
+import subprocess
+
+import pytest
+
+from src.mirror_cache import MirrorCache, fcntl
+
+
+def _git(*args, cwd=None):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True)
+
+
+@pytest.fixture
+def remotes(tmp_path):
+    """Make bare repos a.git and b.git with a commit on main, returning their paths."""
+    paths = {}
+    for name in ("a", "b"):
+        work = tmp_path / "src" / name
+        work.mkdir(parents=True)
+        _git("init", "--quiet", "--initial-branch=main", cwd=work)
+        (work / "index.html").write_text(name * 1000)
+        _git("add", ".", cwd=work)
+        _git("-c", "user.name=t", "-c", "user.email=t@example.com", "commit", "--quiet", "-m", "init", cwd=work)
+        bare = tmp_path / "remotes" / f"{name}.git"
+        _git("clone", "--quiet", "--bare", str(work), str(bare))
+        paths[name] = str(bare)
+    return paths
+
+
+def _index(cache):
+    with open(os.path.join(cache.root, "index.json")) as f:
+        return json.load(f)
+
+
+def test_checkout_records_size_and_evicts_lru(tmp_path, remotes):
+    cache = MirrorCache(root=str(tmp_path / "mirrors"))
+    for name in ("a", "b"):
+        with cache.checkout("o", name, remotes[name]) as workdir:
+            assert os.path.exists(os.path.join(workdir, "index.html"))
+    index = _index(cache)
+    assert set(index) == {"o/a", "o/b"}
+    assert all(entry["size"] > 0 for entry in index.values())
+
+    # only room for one: the least recently used mirror goes
+    cache.max_bytes = index["o/b"]["size"]
+    cache.evict()
+    assert set(_index(cache)) == {"o/b"}
+    assert not os.path.exists(cache.mirror_path("o", "a"))
+    assert os.path.isdir(cache.mirror_path("o", "b"))
+
+
+def test_eviction_runs_after_a_failed_build(tmp_path, remotes):
+    cache = MirrorCache(root=str(tmp_path / "mirrors"), max_bytes=0)
+    with pytest.raises(RuntimeError):
+        with cache.checkout("o", "a", remotes["a"]):
+            raise RuntimeError("build failed")
+    assert _index(cache) == {}
+    assert not os.path.exists(cache.mirror_path("o", "a"))
+
+
+@pytest.mark.skipif(fcntl is None, reason="needs flock")
+def test_eviction_skips_mirror_locked_by_another_process(tmp_path, remotes):
+    cache = MirrorCache(root=str(tmp_path / "mirrors"))
+    with cache.checkout("o", "a", remotes["a"]):
+        pass
+    cache.max_bytes = 0
+    # a separate lock file descriptor stands in for another process holding the mirror
+    with open(cache.mirror_path("o", "a") + ".lock", "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        cache.evict()
+        assert os.path.isdir(cache.mirror_path("o", "a"))
+    cache.evict()
+    assert not os.path.exists(cache.mirror_path("o", "a"))
@@ -0,0 +1,101 @@
+import json
+import threading
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from src.notifier import NotificationDispatcher
+
+
+class _Evaluator(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.received.append(json.loads(body))
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def evaluator():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Evaluator)
+    server.received = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def dispatcher():
+    started = []
+
+    def make(**kwargs):
+        started.append(NotificationDispatcher(**kwargs))
+        return started[-1]
+
+    yield make
+    # cancel deliveries still waiting, so no task is left pending on a closed loop
+    for d in started:
+        d.stop()
+
+
+def test_restart_during_pages_wait_resumes_notification(tmp_path, evaluator, dispatcher):
+    path = str(tmp_path / "outbox.db")
+    url = f"http://127.0.0.1:{evaluator.server_address[1]}/notify"
+    waits = []
+
+    # the first process dies while the site is still building: its wait never finishes
+    first = dispatcher(path=path, wait_live=lambda meta, u, deadline: waits.append(deadline) or Future())
+    first.enqueue(url, {"task": "t"}, meta={"task": "t"}, wait_for="https://o.github.io/t/", wait_seconds=300)
+    assert first.pending() == 1
+    assert evaluator.received == []
+
+    delivered = threading.Event()
+    resumed = []
+
+    def wait_live(meta, pages_url, deadline):
+        resumed.append((meta, pages_url, deadline))
+        fut = Future()
+        fut.set_result(True)
+        return fut
+
+    second = dispatcher(path=path, wait_live=wait_live, on_result=lambda meta, ok, error: delivered.set())
+    second.start()
+    assert delivered.wait(10)
+    assert evaluator.received == [{"task": "t"}]
+    # the resumed wait keeps the original deadline rather than starting over
+    assert resumed == [({"task": "t"}, "https://o.github.io/t/", waits[0])]
+    assert second.pending() == 0
+
+
+def test_idle_hosts_are_forgotten(tmp_path, evaluator, dispatcher):
+    results = []
+    done = threading.Event()
+
+    def on_result(meta, ok, error):
+        results.append(ok)
+        if len(results) == 3:
+            done.set()
+
+    notifier = dispatcher(path=str(tmp_path / "outbox.db"), per_host=1, on_result=on_result)
+    port = evaluator.server_address[1]
+    # two names for the same server are two hosts
+    for host in ("127.0.0.1", "localhost", "127.0.0.1"):
+        notifier.enqueue(f"http://{host}:{port}/notify", {"host": host})
+    assert done.wait(10)
+    assert results == [True] * 3
+    assert notifier._host_limits == {}
+
+
+def test_stop_keeps_undelivered_rows(tmp_path, dispatcher):
+    path = str(tmp_path / "outbox.db")
+    notifier = dispatcher(path=path, wait_live=lambda meta, u, deadline: Future())
+    notifier.enqueue("http://127.0.0.1:1/notify", {"task": "t"}, wait_for="https://o.github.io/t/", wait_seconds=300)
+    notifier.stop()
+    notifier.start()
+    assert notifier.pending() == 1
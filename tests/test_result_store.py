@@ -0,0 +1,40 @@
+import pytest
+
+from src.result_store import MemoryResultStore, SQLiteResultStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryResultStore()
+    return SQLiteResultStore(str(tmp_path / "results.db"))
+
+
+def test_new_build_clears_previous_outcome(store):
+    store.set_status("a@example.com", "t", "n1", "failed", round=1, error="boom")
+    store.set_status("a@example.com", "t", "n1", "queued", round=1)
+    assert store.get("a@example.com", "t", "n1")["error"] is None
+    rec = store.set_status("a@example.com", "t", "n1", "notified", result={"commit_sha": "abc"})
+    assert rec["status"] == "notified" and rec["error"] is None
+    assert rec["result"] == {"commit_sha": "abc"}
+
+
+def test_later_statuses_keep_result_and_error(store):
+    store.set_status("a@example.com", "t", "n1", "pushing", round=1, result={"repo_url": "r"})
+    rec = store.set_status("a@example.com", "t", "n1", "failed", error="push rejected")
+    assert rec["result"] == {"repo_url": "r"} and rec["error"] == "push rejected"
+
+
+def test_polling_reads_do_not_write(tmp_path):
+    store = SQLiteResultStore(str(tmp_path / "results.db"), access_resolution=300)
+    store.set_status("a@example.com", "t", "n1", "generating", round=1)
+    changes = store._conn.total_changes
+    for _ in range(10):
+        assert store.get("a@example.com", "t", "n1")["status"] == "generating"
+        store.latest("a@example.com", "t")
+    assert store._conn.total_changes == changes
+
+    # once the LRU timestamp is stale, a read refreshes it
+    store.access_resolution = 0
+    store.get("a@example.com", "t", "n1")
+    assert store._conn.total_changes == changes + 1
@@ -0,0 +1,85 @@
+import threading
+
+import pytest
+
+from src import build
+from src.admission import Admission
+from src.jobs import BuildQueue, QueueFull
+from src.result_store import open_store
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(build, "RESULT_STORE", open_store(":memory:"))
+    admission = Admission(max_active=0, rate_per_minute=60, burst=5)
+    monkeypatch.setattr(build, "ADMISSION", admission)
+    release = threading.Event()
+    started = threading.Event()
+
+    def target(body):
+        build.record_status(body, "generating")
+        started.set()
+        release.wait(10)
+
+    queue = BuildQueue(workers=1, maxsize=1)
+    yield queue, target, admission, started
+    release.set()
+
+
+def _body(nonce="n1"):
+    return {"email": "a@example.com", "task": "t", "round": 1, "nonce": nonce,
+            "brief": "b", "evaluation_url": "http://127.0.0.1:1/notify"}
+
+
+def _tokens(admission):
+    return admission._buckets["a@example.com"][0]
+
+
+def test_concurrent_duplicate_keeps_status_and_allowance(service, monkeypatch):
+    queue, target, admission, started = service
+    job, _, created = build.submit_build(_body(), queue, target)
+    assert created and started.wait(5)
+    tokens = _tokens(admission)
+
+    # a duplicate that raced past both lookups is still answered by submit_keyed
+    store = build.RESULT_STORE
+    get = store.get
+    monkeypatch.setattr(queue, "find", lambda key: None)
+    monkeypatch.setattr(store, "get", lambda *args: None)
+    dup, _, created = build.submit_build(_body(), queue, target)
+    assert dup is job and not created
+    assert get("a@example.com", "t", "n1")["status"] == "generating"
+    assert _tokens(admission) == pytest.approx(tokens, abs=0.01)
+
+
+def test_queue_full_refunds_allowance(service):
+    queue, target, admission, started = service
+    build.submit_build(_body("n1"), queue, target)
+    assert started.wait(5)
+    build.submit_build(_body("n2"), queue, target)  # fills the one queue slot
+    tokens = _tokens(admission)
+    with pytest.raises(QueueFull):
+        build.submit_build(_body("n3"), queue, target)
+    assert _tokens(admission) == pytest.approx(tokens, abs=0.01)
+    # refused with a 429, so /result has nothing for it
+    assert build.RESULT_STORE.get("a@example.com", "t", "n3") is None
+    assert build.RESULT_STORE.get("a@example.com", "t", "n2")["status"] == "queued"
+
+
+def test_restart_rebuilds_orphaned_build(tmp_path, monkeypatch):
+    path = str(tmp_path / "results.db")
+    # the previous process stopped while building; its record never left "generating"
+    open_store(path).set_status("a@example.com", "t", "n1", "generating", round=1)
+
+    monkeypatch.setattr(build, "RESULT_STORE", open_store(path))
+    monkeypatch.setattr(build, "ADMISSION", Admission(max_active=0, rate_per_minute=60, burst=5))
+    ran = threading.Event()
+    queue = BuildQueue(workers=1, maxsize=4)
+    job, rec, created = build.submit_build(_body(), queue, lambda body: ran.set())
+    assert created and rec is None
+    assert ran.wait(5)
+
+    # a finished record is still answered as a duplicate
+    build.RESULT_STORE.set_status("a@example.com", "t", "n2", "notified", round=1)
+    job, rec, created = build.submit_build(_body("n2"), queue, lambda body: None)
+    assert job is None and rec["status"] == "notified" and not created